@@ -0,0 +1,153 @@
+import asyncio
+import functools
+import subprocess
+import time
+from concurrent.futures import Executor as ThreadPool
+from typing import List, Union, Optional
+
+from PIL import Image
+
+from fbmr.config import Action
+from fbmr.executor import (
+    CHAIN_COMPLETED,
+    CHAIN_ENDED,
+    Executor,
+    ActionScore,
+    AdvanceProgress,
+    dumps_flight_recorder_on_failure,
+    logs_chain_to_session_log,
+)
+from fbmr.helpers import FrameWaiter, capture_frame
+from fbmr.utils.debug_settings import debug_settings
+
+
+class AsyncExecutor(Executor):
+    """
+    An asyncio version of Executor, so that one event loop can drive many devices and chains at once.
+
+    Captures, template matching and effects (adb calls, clicks) are blocking, so they run in `thread_pool`
+    (the loop's default executor if None). Cooldowns and polling are awaited instead of slept, so cancelling the
+    task running execute_chain() stops the chain at the next await; there's no need for an ExecutionHook to raise.
+    ExecutionHook methods are still called, from the event loop's thread.
+    """
+
+    def __init__(self, thread_pool=None):
+        # type: (Optional[ThreadPool]) -> None
+        super(AsyncExecutor, self).__init__()
+        self.thread_pool = thread_pool
+        # speculative scoring is a blocking loop; it isn't supported here
+        self.speculative_scoring = False
+
+    async def run_blocking(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.thread_pool, functools.partial(fn, *args, **kwargs)
+        )
+
+    async def next_frame(self, waiter: FrameWaiter) -> Image:
+        """The async equivalent of FrameWaiter.next_frame()."""
+        if waiter.captured:
+            if waiter.is_streaming:
+                await self.run_blocking(
+                    waiter.device.wait_for_new_frame, waiter.max_interval
+                )
+            else:
+                await asyncio.sleep(waiter.next_interval())
+        waiter.captured = True
+        return await self.run_blocking(capture_frame, waiter.device)
+
+    @logs_chain_to_session_log
+    @dumps_flight_recorder_on_failure
+    async def execute_chain(
+        self,
+        start_action_names: Union[str, list[str]],
+        end_action_names: list[str],
+        state_dict: dict,
+        utils: dict,
+        min_action_delay: float = 0.0,
+        max_minutes: float = 0.0,
+    ) -> Optional[Action]:
+        start_action_names = self.start_chain(start_action_names, utils)
+        device = utils["device"]
+        start = time.time()
+        executed_action = None
+        while True:
+            debug_settings.check_timeout()
+            self.begin_search(start_action_names, start)
+
+            action_start = time.time()
+            try:
+                image = await self.run_blocking(capture_frame, device)
+                self.frame_capture_time = time.time()
+                executed_action = await self.execute_best_action(
+                    image, state_dict, utils, end_action_names=end_action_names
+                )
+                outcome, start_action_names = self.chain_step(
+                    executed_action, start_action_names, end_action_names
+                )
+                if outcome == CHAIN_ENDED:
+                    return None
+                if outcome == CHAIN_COMPLETED:
+                    break
+            except subprocess.CalledProcessError:
+                self.adb_error()
+                await asyncio.sleep(self.adb_error_wait)
+
+            if self.timed_out(start_action_names, start, max_minutes):
+                break
+
+            wait_time = self.action_delay(action_start, min_action_delay)
+            if wait_time > 0:
+                await asyncio.sleep(wait_time)
+        self.next_action_names = None
+        return executed_action
+
+    async def execute_best_action(
+        self,
+        pil_image: Image,
+        state_dict: dict,
+        utils: dict,
+        end_action_names: Optional[List[str]] = None,
+        action_scores: Optional[List[ActionScore]] = None,
+    ) -> Optional[Action]:
+        action, action_scores, annotated_image = await self.run_blocking(
+            self.decide_action, pil_image, state_dict, utils, action_scores
+        )
+        self.record_outcome(pil_image, action_scores, annotated_image, action)
+        if action is None:
+            return None
+        await self.apply_and_wait(action, pil_image, annotated_image, state_dict, utils)
+        self.finish_action(action, end_action_names)
+        return action
+
+    async def apply_and_wait(
+        self,
+        action: Action,
+        pil_image: Image,
+        annotated_image: Image,
+        state_dict: dict,
+        utils: dict,
+    ):
+        self.before_effects(action, pil_image, annotated_image)
+        effect_start = time.time()
+        await self.run_blocking(action.apply, pil_image, state_dict, utils)
+        self.effects_applied(action, effect_start)
+        if action.cooldown:
+            await asyncio.sleep(action.cooldown)
+        if action.advance_if_condition:
+            waiter = FrameWaiter(utils["device"])
+            progress = AdvanceProgress()
+            while True:
+                debug_settings.check_timeout()
+                sc = await self.next_frame(waiter)
+                self.report_advance_wait(action, sc, progress)
+                if await self.run_blocking(
+                    self.can_advance, action, sc, state_dict, utils
+                ):
+                    break
+                # however, if we get stuck, try to get out of it by repeating the action
+                if await self.run_blocking(
+                    self.retry_if_stuck, action, sc, state_dict, utils, progress
+                ):
+                    waiter.reset()
+            self.advanced(action, progress)
@@ -1,9 +1,33 @@
 import logging
 import os
+import time
 from PIL import Image
 from typing import Optional, Tuple, Callable, TypeAlias
 
-from fbmr.utils.detect_image import find_location_path_pil, pad_region
+from fbmr.utils.detect_image import (
+    find_location_path_pil,
+    find_locations_path_pil,
+    pad_region,
+)
+from fbmr.utils.fingerprint_index import FINGERPRINT_BITS, fingerprint
+from fbmr.utils.frame_scale import (
+    frame_scale,
+    from_frame_box,
+    screen_size,
+    to_frame_point,
+    to_frame_region,
+)
+from fbmr.utils.lazy_import import LazyModule
+from fbmr.utils.session_log import session_log
+from fbmr.utils.template_store import configs_root_of, is_store_ref, resolve
+
+np = LazyModule("numpy")
+
+# rough costs of one check, in microseconds; composite conditions check their cheapest parts first
+PROBE_COST = 20
+HASH_COST = 100
+REGION_MATCH_COST = 1000
+FULL_FRAME_MATCH_COST = 20000
 
 
 class Condition(object):
@@ -25,8 +49,15 @@ class Condition(object):
     def set_folder_path(self, folder_path: str):
         self.folder_path = folder_path
 
+    def estimated_cost(self) -> float:
+        # roughly how many microseconds a check takes, relative to other conditions
+        return REGION_MATCH_COST
+
     def adjust_file_path(self, path: str) -> str:
-        if path.startswith("configs"):
+        if is_store_ref(path):
+            # shared with other configs; see fbmr/utils/template_store.py
+            return resolve(path, configs_root_of(self.folder_path))
+        elif path.startswith("configs"):
             # already relative to script root (eg. configs/[category]/...)
             return path
         else:
@@ -48,6 +79,16 @@ def load_condition(c_data: dict, folder_path: str) -> Condition:
         condition = SubimageCondition.load(c_data)
     elif condition_type == "NotSubimageCondition":
         condition = NotSubimageCondition.load(c_data)
+    elif condition_type == "PixelProbeCondition":
+        condition = PixelProbeCondition.load(c_data)
+    elif condition_type == "RegionHashCondition":
+        condition = RegionHashCondition.load(c_data)
+    elif condition_type == "AllOf":
+        condition = AllOf.load(c_data, folder_path)
+    elif condition_type == "AnyOf":
+        condition = AnyOf.load(c_data, folder_path)
+    elif condition_type == "Not":
+        condition = Not.load(c_data, folder_path)
     else:
         raise ValueError("Couldn't load condition type {0}".format(condition_type))
     condition.set_folder_path(folder_path)
@@ -58,6 +99,9 @@ ImageValidityTest: TypeAlias = Callable[[float, float], bool]
 
 
 class ImageCondition(Condition):
+    # whether any strength below the threshold gives the same result, so the match prefilter can skip the match
+    prefilter_safe = False
+
     def __init__(
         self,
         image_path: str,
@@ -66,6 +110,7 @@ class ImageCondition(Condition):
         weight: Optional[float] = 1.0,
         save_region_as: Optional[str] = False,
         should_pad_region: Optional[bool] = True,
+        outline_path: Optional[str] = None,
     ):
         super(ImageCondition, self).__init__()
         self.image_path = image_path  # strong
@@ -78,41 +123,96 @@ class ImageCondition(Condition):
         # string for saving the match region in the state_dict
         self.save_region_as = save_region_as
         self.should_pad_region = should_pad_region
+        # the full screenshot the template was cropped from (the macro recorder's "_outline" image)
+        self.outline_path = outline_path
 
     def find_valid_rect(
         self, pil_image: Image, state_dict: dict, utils: dict
     ) -> (float, Tuple[int, int, int, int]):
         raise NotImplementedError("ImageCondition.find_valid_rect() not implemented")
 
+    def outline_file_path(self) -> Optional[str]:
+        """
+        The path to the screenshot the template was cropped from, if there is one. Configs recorded before outline_path
+        was saved name it after the template, with "_outline" in place of "_tap".
+        """
+        if self.outline_path:
+            path = self.adjust_file_path(self.outline_path)
+        elif self.image_path and "_tap" in self.image_path:
+            path = self.adjust_file_path(self.image_path).replace("_tap", "_outline")
+        else:
+            return None
+        return path if os.path.exists(path) else None
+
+    def estimated_cost(self) -> float:
+        if self.intended_region:
+            return REGION_MATCH_COST
+        return FULL_FRAME_MATCH_COST
+
     def find_image(
         self,
         pil_image: Image,
         validity_test: ImageValidityTest,
         state_dict: dict,
-        _utils: dict,
+        utils: dict,
     ) -> (float, Tuple[int, int, int, int]):
-        cropped_image = pil_image
+        a_image_path = self.adjust_file_path(self.image_path)
+        # regions and boxes are in the config's screenshot_size coordinates, even for frames captured at another size
+        scale = frame_scale(pil_image, utils)
+        size = screen_size(pil_image, utils)
         cropped_region = None
         if self.intended_region:
             cropped_region = self.intended_region
             if self.should_pad_region:
-                cropped_region = pad_region(self.intended_region, pil_image.size)
-            cropped_image = pil_image.crop(cropped_region)
-
-        a_image_path = self.adjust_file_path(self.image_path)
-        strength, box = find_location_path_pil(a_image_path, cropped_image)
-        x, y, t_width, t_height = box
-
-        updated_box = box
-        if self.intended_region and cropped_region:
-            c_l, c_t, c_r, c_b = cropped_region
-            updated_box = (x + c_l, y + c_t, t_width, t_height)
+                cropped_region = pad_region(self.intended_region, size)
+
+        match_cache = utils.get("match_cache", None)
+        # with the match prefilter, templates that can't score enough to be valid or found aren't matched
+        min_strength = None
+        if (
+            utils.get("match_prefilter", False)
+            and self.prefilter_safe
+            and self.weight > 0
+        ):
+            viability_adjustment = max(0, state_dict.get("viability_adjustment", 0))
+            min_strength = (self.threshold - viability_adjustment) / (self.weight * 100)
+
+        def match(region):
+            if match_cache:
+                cached = match_cache.get(pil_image, a_image_path, region)
+                if cached:
+                    return cached
+            return self.match(a_image_path, pil_image, region, min_strength, scale)
+
+        # the template is on screen if it'd pass as a SubimageCondition, whatever validity_test is
+        def is_found(strength):
+            return strength * self.weight * 100 > self.threshold
+
+        tracker = utils.get("template_tracker", None)
+        tracked = None
+        if tracker:
+            tracked = tracker.find(self, size, cropped_region, match, is_found)
+        learned_regions = utils.get("learned_regions", None)
+        if tracked:
+            strength, updated_box = tracked
+        elif cropped_region or not learned_regions:
+            strength, updated_box = match(cropped_region)
+        else:
+            strength, updated_box = learned_regions.find(
+                self.image_path, size, match, is_found
+            )
+        if tracker and not tracked:
+            tracker.update(self, size, updated_box, is_found(strength))
 
         scaled_strength = strength * self.weight * 100 + state_dict.get(
             "viability_adjustment", 0
         )
-        logging.getLogger("fbmr_logger").debug(
-            f"{self.__class__.__name__} match {int(scaled_strength)}/{self.threshold} for {self.image_path}"
+        logging.getLogger("fbmr_logger.matches").debug(
+            "%s match %d/%s for %s",
+            self.__class__.__name__,
+            scaled_strength,
+            self.threshold,
+            self.image_path,
         )
         if validity_test(scaled_strength, self.threshold):
             if self.save_region_as:
@@ -120,11 +220,121 @@ class ImageCondition(Condition):
             return scaled_strength, updated_box
         return 0, updated_box
 
+    def match(
+        self,
+        a_image_path: str,
+        pil_image: Image,
+        region: Optional[Tuple[int, int, int, int]],
+        min_strength: Optional[float] = None,
+        scale: Optional[Tuple[float, float]] = None,
+    ) -> (float, Tuple[int, int, int, int]):
+        """
+        Matches the template in `region` of pil_image, or all of it. The box is in pil_image's coordinates.
+        With min_strength, a template that can't reach it may not be matched; see find_location_path_pil.
+        With the frame's scale, `region` and the box are in screenshot_size coordinates instead.
+        """
+        frame_region = region
+        if scale and region:
+            frame_region = to_frame_region(region, scale, pil_image.size)
+        cropped_image = pil_image.crop(frame_region) if frame_region else pil_image
+        match_start = time.perf_counter()
+        strength, box = find_location_path_pil(
+            a_image_path, cropped_image, min_strength, scale
+        )
+        session_log.enabled and session_log.event(
+            "match",
+            template=self.image_path,
+            seconds=round(time.perf_counter() - match_start, 6),
+            strength=round(strength, 4),
+            region=region,
+        )
+        if frame_region:
+            x, y, t_width, t_height = box
+            c_l, c_t, _c_r, _c_b = frame_region
+            box = (x + c_l, y + c_t, t_width, t_height)
+        if scale:
+            box = from_frame_box(box, scale)
+        return strength, box
+
     def make_json(self) -> dict:
         raise NotImplementedError("Condition.make_json() not implemented")
 
 
+class MatchCache:
+    """
+    The matches for one frame, made ahead of scoring: the templates of image conditions that search the same region
+    are matched together, in one pass over it (see SceneMatcher in detect_image.py). ImageCondition.find_image looks
+    here before matching, when the executor passes it as utils["match_cache"].
+    """
+
+    def __init__(self, pil_image: Image):
+        self.pil_image = pil_image
+        # {(template path, region): (strength, box)}
+        self.matches = {}
+
+    def get(
+        self,
+        pil_image: Image,
+        a_image_path: str,
+        region: Optional[Tuple[int, int, int, int]],
+    ) -> Optional[Tuple[float, Tuple[int, int, int, int]]]:
+        if pil_image is not self.pil_image:
+            return None
+        return self.matches.get((a_image_path, region and tuple(region)), None)
+
+    def prefetch(self, conditions: list[Condition], utils: dict):
+        """
+        Matches the conditions' templates in the regions find_image will search first, where two or more of them
+        share one. Templates searched with a learned region or a tracked window aren't, since those regions vary.
+        """
+        if frame_scale(self.pil_image, utils):
+            # conditions match their own resized templates on frames captured at another size
+            return
+        tracker = utils.get("template_tracker", None)
+        # {region: [template path]}
+        groups = {}
+        for condition in leaf_conditions(conditions):
+            if not isinstance(condition, ImageCondition):
+                continue
+            if tracker and tracker.is_tracking(condition):
+                continue
+            region = None
+            if condition.intended_region:
+                region = tuple(condition.intended_region)
+                if condition.should_pad_region:
+                    region = pad_region(condition.intended_region, self.pil_image.size)
+            elif "learned_regions" in utils:
+                continue
+            a_image_path = condition.adjust_file_path(condition.image_path)
+            paths = groups.setdefault(region, [])
+            if a_image_path not in paths and (a_image_path, region) not in self.matches:
+                paths.append(a_image_path)
+
+        for region, paths in groups.items():
+            if len(paths) < 2:
+                continue
+            cropped_image = self.pil_image.crop(region) if region else self.pil_image
+            match_start = time.perf_counter()
+            results = find_locations_path_pil(paths, cropped_image)
+            seconds = (time.perf_counter() - match_start) / len(paths)
+            for path, (strength, box) in zip(paths, results):
+                if region:
+                    x, y, t_width, t_height = box
+                    box = (x + region[0], y + region[1], t_width, t_height)
+                self.matches[(path, region)] = (strength, box)
+                session_log.enabled and session_log.event(
+                    "match",
+                    template=path,
+                    seconds=round(seconds, 6),
+                    strength=round(strength, 4),
+                    region=region,
+                    batched=True,
+                )
+
+
 class SubimageCondition(ImageCondition):
+    prefilter_safe = True
+
     def __init__(
         self,
         image_path: str,
@@ -133,6 +343,7 @@ class SubimageCondition(ImageCondition):
         weight: Optional[float] = 1.0,
         save_region_as: Optional[str] = False,
         should_pad_region: Optional[bool] = True,
+        outline_path: Optional[str] = None,
     ):
         super(SubimageCondition, self).__init__(
             image_path,
@@ -141,6 +352,7 @@ class SubimageCondition(ImageCondition):
             weight,
             save_region_as,
             should_pad_region,
+            outline_path,
         )
 
     def find_valid_rect(
@@ -159,6 +371,7 @@ class SubimageCondition(ImageCondition):
             json_data.get("threshold", 80),
             json_data.get("weight", 1.0),
             json_data.get("save_region_as", None),
+            outline_path=json_data.get("outline_path", None),
         )
 
     def make_json(self) -> dict:
@@ -170,6 +383,8 @@ class SubimageCondition(ImageCondition):
             "weight": self.weight,
             "save_region_as": self.save_region_as,
         }
+        if self.outline_path:
+            d["outline_path"] = self.outline_path
         return d
 
 
@@ -182,6 +397,7 @@ class NotSubimageCondition(ImageCondition):
         weight: Optional[float] = 1.0,
         save_region_as: Optional[str] = False,
         should_pad_region: Optional[bool] = True,
+        outline_path: Optional[str] = None,
     ):
         super(NotSubimageCondition, self).__init__(
             image_path,
@@ -190,6 +406,7 @@ class NotSubimageCondition(ImageCondition):
             weight,
             save_region_as,
             should_pad_region,
+            outline_path,
         )
 
     def find_valid_rect(
@@ -211,6 +428,7 @@ class NotSubimageCondition(ImageCondition):
             json_data.get("threshold", 80),
             json_data.get("weight", 1.0),
             json_data.get("save_region_as", None),
+            outline_path=json_data.get("outline_path", None),
         )
 
     def make_json(self) -> dict:
@@ -222,4 +440,292 @@ class NotSubimageCondition(ImageCondition):
             "weight": self.weight,
             "save_region_as": self.save_region_as,
         }
+        if self.outline_path:
+            d["outline_path"] = self.outline_path
         return d
+
+
+def check_in_bounds(region, image_size):
+    """raises if a (left, upper, right, lower) region isn't inside the screenshot"""
+    c_l, c_t, c_r, c_b = region
+    max_x, max_y = image_size
+    if c_l < 0 or c_t < 0 or c_r > max_x or c_b > max_y:
+        raise ValueError(f"region {tuple(region)} is outside of image {image_size}")
+
+
+def rgb_at(pil_image: Image, x: int, y: int) -> Tuple[int, int, int]:
+    pixel = pil_image.getpixel((x, y))
+    if pil_image.mode in ("RGB", "RGBA"):
+        return pixel[:3]
+    return pil_image.convert("RGB").getpixel((x, y))
+
+
+class PixelProbeCondition(Condition):
+    """
+    Checks the colors of a few pixels, eg. to tell whether a fixed HUD element is showing. There's no search, so it
+    costs microseconds instead of a template match's milliseconds.
+    """
+
+    def __init__(
+        self,
+        probes: list[Tuple[int, int, list[int, int, int]]],
+        threshold: float = 94,
+    ):
+        super(PixelProbeCondition, self).__init__()
+        # [x, y, [r, g, b]] for each pixel, in screenshot coordinates
+        self.probes = probes
+        # integer between 0 and 100. valid if 100 * (1 - the largest channel difference / 255) exceeds it;
+        # the default allows each channel to be off by 15
+        self.threshold = threshold
+
+    def estimated_cost(self) -> float:
+        return PROBE_COST
+
+    def find_valid_rect(
+        self, pil_image: Image, state_dict: dict, utils: dict
+    ) -> (float, Tuple[int, int, int, int]):
+        xs = [x for x, _y, _color in self.probes]
+        ys = [y for _x, y, _color in self.probes]
+        check_in_bounds(
+            (min(xs), min(ys), max(xs) + 1, max(ys) + 1), screen_size(pil_image, utils)
+        )
+        scale = frame_scale(pil_image, utils)
+        difference = 0
+        for x, y, color in self.probes:
+            if scale:
+                x, y = to_frame_point(x, y, scale, pil_image.size)
+            for actual, expected in zip(rgb_at(pil_image, x, y), color):
+                difference = max(difference, abs(actual - expected))
+        strength = 100 * (1 - difference / 255)
+        rect = (min(xs), min(ys), max(xs) - min(xs) + 1, max(ys) - min(ys) + 1)
+        logging.getLogger("fbmr_logger.matches").debug(
+            "PixelProbeCondition match %d/%s for %d probes",
+            strength,
+            self.threshold,
+            len(self.probes),
+        )
+        if strength > self.threshold:
+            return strength, rect
+        return 0, rect
+
+    @staticmethod
+    def load(json_data: dict):
+        return PixelProbeCondition(
+            json_data.get("probes"),
+            json_data.get("threshold", 94),
+        )
+
+    def make_json(self) -> dict:
+        return {
+            "type": "PixelProbeCondition",
+            "probes": self.probes,
+            "threshold": self.threshold,
+        }
+
+
+class RegionHashCondition(Condition):
+    """
+    Compares a fixed region of the screenshot to a perceptual hash of how it should look: the same difference hash the
+    fingerprint index uses, of the region instead of the whole screen. It ignores small shifts in color, compression
+    and scaling, but not where the region is, and it's the brightness changes that are hashed, so regions of flat
+    color all look alike. A few bits of hashing instead of a search, so it costs microseconds.
+    """
+
+    def __init__(
+        self,
+        region: list[int, int, int, int],
+        region_hash: str,
+        threshold: float = 90,
+    ):
+        super(RegionHashCondition, self).__init__()
+        # pil crop region (left, upper, right, lower)
+        self.region = region
+        # the region's fingerprint, as hex; see fbmr/utils/fingerprint_index.py
+        self.region_hash = region_hash
+        # integer between 0 and 100. valid if the percentage of the hash's bits that match exceeds it
+        self.threshold = threshold
+        self.packed_hash = np.frombuffer(bytes.fromhex(region_hash), np.uint8)
+
+    def estimated_cost(self) -> float:
+        return HASH_COST
+
+    def find_valid_rect(
+        self, pil_image: Image, state_dict: dict, utils: dict
+    ) -> (float, Tuple[int, int, int, int]):
+        check_in_bounds(self.region, screen_size(pil_image, utils))
+        scale = frame_scale(pil_image, utils)
+        frame_region = tuple(self.region)
+        if scale:
+            frame_region = to_frame_region(frame_region, scale, pil_image.size)
+        region_hash = fingerprint(pil_image.crop(frame_region))
+        differing = int(
+            np.unpackbits(np.bitwise_xor(region_hash, self.packed_hash)).sum()
+        )
+        strength = 100 * (1 - differing / FINGERPRINT_BITS)
+        c_l, c_t, c_r, c_b = self.region
+        rect = (c_l, c_t, c_r - c_l, c_b - c_t)
+        logging.getLogger("fbmr_logger.matches").debug(
+            "RegionHashCondition match %d/%s for %s",
+            strength,
+            self.threshold,
+            self.region,
+        )
+        if strength > self.threshold:
+            return strength, rect
+        return 0, rect
+
+    @staticmethod
+    def load(json_data: dict):
+        return RegionHashCondition(
+            json_data.get("region"),
+            json_data.get("hash"),
+            json_data.get("threshold", 90),
+        )
+
+    def make_json(self) -> dict:
+        return {
+            "type": "RegionHashCondition",
+            "region": self.region,
+            "hash": self.region_hash,
+            "threshold": self.threshold,
+        }
+
+
+def leaf_conditions(conditions: list[Condition]) -> list[Condition]:
+    """The conditions, with composite conditions replaced by the conditions inside them."""
+    leaves = []
+    for condition in conditions:
+        if isinstance(condition, CompositeCondition):
+            leaves.extend(leaf_conditions(condition.conditions))
+        else:
+            leaves.append(condition)
+    return leaves
+
+
+class CompositeCondition(Condition):
+    """
+    Combines other conditions, checking the cheapest first (see estimated_cost) and stopping once the result is
+    decided. The conditions that aren't checked don't save their regions to the state_dict.
+    """
+
+    def __init__(self, conditions: list[Condition]):
+        super(CompositeCondition, self).__init__()
+        self.conditions = conditions
+
+    def set_folder_path(self, folder_path: str):
+        self.folder_path = folder_path
+        for c in self.conditions:
+            c.set_folder_path(folder_path)
+
+    def estimated_cost(self) -> float:
+        # when nothing short-circuits
+        return sum(c.estimated_cost() for c in self.conditions)
+
+    def cost_ordered(self) -> list[Condition]:
+        # sorted is stable, so conditions of the same cost are checked in the order they're written
+        return sorted(self.conditions, key=lambda c: c.estimated_cost())
+
+    def log_result(self, validity: float, checked: int):
+        logging.getLogger("fbmr_logger.matches").debug(
+            "%s result %d after %d/%d conditions",
+            self.__class__.__name__,
+            validity,
+            checked,
+            len(self.conditions),
+        )
+
+
+class AllOf(CompositeCondition):
+    """
+    Valid if all of its conditions are; scores the lowest of them, like an Action's own list of conditions. Stops at
+    the first condition that isn't valid.
+    """
+
+    def find_valid_rect(
+        self, pil_image: Image, state_dict: dict, utils: dict
+    ) -> (float, Tuple[int, int, int, int]):
+        min_validity = 100.0
+        min_rect = (0, 0, 0, 0)
+        checked = 0
+        for c in self.cost_ordered():
+            validity, rect = c.find_valid_rect(pil_image, state_dict, utils)
+            checked += 1
+            if validity < min_validity:
+                min_validity = validity
+                min_rect = rect
+            if min_validity <= 0:
+                break
+        self.log_result(min_validity, checked)
+        return min_validity, min_rect
+
+    @staticmethod
+    def load(json_data: dict, folder_path: str):
+        return AllOf([load_condition(c, folder_path) for c in json_data["conditions"]])
+
+    def make_json(self) -> dict:
+        return {
+            "type": "AllOf",
+            "conditions": [c.make_json() for c in self.conditions],
+        }
+
+
+class AnyOf(CompositeCondition):
+    """
+    Valid if any of its conditions is; scores the first valid one, checking the cheapest first. Alternatives that
+    would've scored higher aren't checked, so write ones that can't be confused with each other.
+    """
+
+    def find_valid_rect(
+        self, pil_image: Image, state_dict: dict, utils: dict
+    ) -> (float, Tuple[int, int, int, int]):
+        first_rect = None
+        checked = 0
+        for c in self.cost_ordered():
+            validity, rect = c.find_valid_rect(pil_image, state_dict, utils)
+            checked += 1
+            if validity > 0:
+                self.log_result(validity, checked)
+                return validity, rect
+            if first_rect is None:
+                first_rect = rect
+        self.log_result(0, checked)
+        return 0, first_rect or (0, 0, 0, 0)
+
+    @staticmethod
+    def load(json_data: dict, folder_path: str):
+        return AnyOf([load_condition(c, folder_path) for c in json_data["conditions"]])
+
+    def make_json(self) -> dict:
+        return {
+            "type": "AnyOf",
+            "conditions": [c.make_json() for c in self.conditions],
+        }
+
+
+class Not(CompositeCondition):
+    """
+    Valid, scoring 100, if its condition isn't valid; scores 0 if it is. Like NotSubimageCondition, for any condition.
+    """
+
+    def __init__(self, condition: Condition):
+        super(Not, self).__init__([condition])
+
+    def find_valid_rect(
+        self, pil_image: Image, state_dict: dict, utils: dict
+    ) -> (float, Tuple[int, int, int, int]):
+        validity, rect = self.conditions[0].find_valid_rect(
+            pil_image, state_dict, utils
+        )
+        if validity > 0:
+            return 0, rect
+        return 100, rect
+
+    @staticmethod
+    def load(json_data: dict, folder_path: str):
+        return Not(load_condition(json_data["condition"], folder_path))
+
+    def make_json(self) -> dict:
+        return {
+            "type": "Not",
+            "condition": self.conditions[0].make_json(),
+        }
@@ -3,12 +3,23 @@ import json
 import os
 import pyjson5
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Dict, Optional, Tuple
 from PIL import Image
 
-from fbmr.conditions import load_condition, Condition
+from fbmr.conditions import leaf_conditions, load_condition, Condition
 from fbmr.effects import load_effect, Effect
+from fbmr.utils.compiled_config import (
+    COMPILED_FILENAME,
+    CompiledConfig,
+    source_signature,
+)
 from fbmr.utils.debug_settings import debug_settings
+from fbmr.utils.detect_image import decode_template, template_cache
+from fbmr.utils.frame_scale import resize_to_screenshot_size
+from fbmr.utils.settings import settings
+
+# image paths on conditions and effects that aren't matched as templates
+NON_TEMPLATE_PATHS = ["folder_path", "scene_image_path", "outline_path"]
 
 
 class Config:
@@ -32,6 +43,8 @@ class Config:
 
         self.folder_path = os.path.join(configs_root, name)
         self.json_path = os.path.join(configs_root, name, "config.json")
+        # see fbmr/utils/compiled_config.py
+        self.compiled_path = os.path.join(configs_root, name, COMPILED_FILENAME)
 
         if not create_if_missing:
             if not os.path.exists(self.folder_path):
@@ -51,9 +64,76 @@ class Config:
 
     def read(self):
         # type: () -> None
+        use_compiled = settings.get_fbmr_compiled_configs()
+        compiled = None
+        if use_compiled and os.path.exists(self.compiled_path):
+            compiled = CompiledConfig.open(self.compiled_path)
+            if compiled and compiled.is_stale("config.json", self.json_path):
+                compiled = None
+
+        if compiled:
+            self.load_json(compiled.config_json)
+        else:
+            with open(self.json_path) as json_file:
+                data = pyjson5.load(json_file)
+                self.load_json(data)
+
+        if use_compiled:
+            template_paths = self.template_paths()
+            if compiled is None or any(
+                compiled.is_stale(ref, path) for ref, path in template_paths.items()
+            ):
+                compiled = self.compile()
+            if compiled:
+                for ref, path in template_paths.items():
+                    if ref in compiled.templates:
+                        template_cache.preload(path, compiled.templates[ref])
+
+    def compile(self):
+        # type: () -> Optional[CompiledConfig]
+        """
+        Writes config.compiled: config.json and every template it uses, decoded. Returns it, opened.
+        Returns None if it couldn't be written (eg. on Windows, while another process has it mapped).
+        """
+        sources = {"config.json": source_signature(self.json_path)}
         with open(self.json_path) as json_file:
-            data = pyjson5.load(json_file)
-            self.load_json(data)
+            config_json = pyjson5.load(json_file)
+        templates = {}
+        for ref, path in self.template_paths().items():
+            signature = source_signature(path)
+            if signature is None:
+                # a missing image is reported when it's matched, as before
+                continue
+            sources[ref] = signature
+            # not template_cache.read; the cached template may be a view of the config.compiled being replaced
+            templates[ref] = decode_template(path)
+        try:
+            CompiledConfig.write(self.compiled_path, config_json, sources, templates)
+        except OSError as e:
+            logging.getLogger("fbmr_logger").warning(
+                f"Config: couldn't write {self.compiled_path}; {e}"
+            )
+            return None
+        return CompiledConfig.open(self.compiled_path)
+
+    def template_paths(self):
+        # type: () -> Dict[str, str]
+        """{path as written in config.json: path to the file} for each template used by the conditions and effects."""
+        paths = {}
+        for action in self.actions:
+            parts = leaf_conditions(action.conditions) + action.effects
+            if action.advance_if_condition:
+                parts.extend(leaf_conditions([action.advance_if_condition]))
+            for part in parts:
+                for attr, value in vars(part).items():
+                    if (
+                        attr.endswith("_path")
+                        and attr not in NON_TEMPLATE_PATHS
+                        and isinstance(value, str)
+                        and value
+                    ):
+                        paths[value] = part.adjust_file_path(value)
+        return paths
 
     def write(self):
         # type: () -> None
@@ -177,7 +257,9 @@ class Action(object):
         if not self.is_enabled:
             return 0, (0, 0, 0, 0)
 
-        logging.getLogger("fbmr_logger").debug(f"Checking action {self.name}: starting")
+        logging.getLogger("fbmr_logger").debug(
+            "Checking action %s: starting", self.name
+        )
         min_validity = 100.0
         min_rect = (0, 0, 0, 0)
         for c in self.conditions:
@@ -187,7 +269,7 @@ class Action(object):
                 min_rect = rect
         if len(self.conditions) > 0:
             logging.getLogger("fbmr_logger").debug(
-                f"Checking action {self.name}: final score {int(min_validity)}"
+                "Checking action %s: final score %d", self.name, min_validity
             )
         return min_validity, min_rect
 
@@ -198,5 +280,7 @@ class Action(object):
 
     def apply(self, pil_image, state_dict, utils):
         # type: (Image, dict, dict) -> None
+        # effects work at the config's screenshot_size; see fbmr/utils/frame_scale.py
+        pil_image = resize_to_screenshot_size(pil_image, utils)
         for e in self.effects:
             e.apply(pil_image, state_dict, utils)
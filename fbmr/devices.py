@@ -1,9 +1,7 @@
 import subprocess
 
-from fbmr.devicetypes.windows_android_device import WindowsAndroidDevice
-from fbmr.devicetypes.windows_app_device import WindowsAppDevice
-from fbmr.devicetypes.streaming_android_device import StreamingAndroidDevice
 from fbmr.devicetypes.device import Device
+from fbmr.utils.lazy_import import import_class
 
 import os
 from typing import Tuple, Optional, Callable
@@ -100,10 +98,18 @@ def all_device_config_parsers():
 
 
 class DeviceConfig:
+    # the Device subclass, as "module.ClassName". backends pull in platform-specific packages (win32gui, scrcpy...),
+    # so they're only imported when a device is initialized
+    device_class_path = None  # type: Optional[str]
+
     @staticmethod
     def name():
         raise NotImplementedError()
 
+    @classmethod
+    def device_class(cls) -> type:
+        return import_class(cls.device_class_path)
+
     @classmethod
     def validate(cls, data: dict, throw_on_error: bool = False) -> bool:
         """
@@ -208,6 +214,10 @@ class DeviceConfig:
 
 
 class StreamingAndroidDeviceConfig(DeviceConfig):
+    device_class_path = (
+        "fbmr.devicetypes.streaming_android_device.StreamingAndroidDevice"
+    )
+
     @staticmethod
     def name():
         return "StreamingAndroidDevice"
@@ -215,7 +225,7 @@ class StreamingAndroidDeviceConfig(DeviceConfig):
     @classmethod
     def initialize(cls, data: dict) -> Optional[Device]:
         cls.validate(data, throw_on_error=True)
-        return StreamingAndroidDevice(
+        return cls.device_class()(
             data["screenshot_size"],  # resolution
             ["-s", data["adb_serial"]],  # serial
         )
@@ -226,6 +236,8 @@ class StreamingAndroidDeviceConfig(DeviceConfig):
 
 
 class WindowsAndroidDeviceConfig(DeviceConfig):
+    device_class_path = "fbmr.devicetypes.windows_android_device.WindowsAndroidDevice"
+
     @staticmethod
     def name():
         return "WindowsAndroidDevice"
@@ -236,7 +248,7 @@ class WindowsAndroidDeviceConfig(DeviceConfig):
         if not data["adb_serial"].isalnum():
             subprocess.run(["adb", "connect", data["adb_serial"]], check=True)
 
-        return WindowsAndroidDevice(
+        return cls.device_class()(
             data["screenshot_size"],
             ["-s", data["adb_serial"]],
             crop_settings=data["window_crop_LTRB"],
@@ -256,6 +268,8 @@ class WindowsAndroidDeviceConfig(DeviceConfig):
 
 
 class WindowsAppDeviceConfig(DeviceConfig):
+    device_class_path = "fbmr.devicetypes.windows_app_device.WindowsAppDevice"
+
     @staticmethod
     def name():
         return "WindowsAppDevice"
@@ -263,7 +277,7 @@ class WindowsAppDeviceConfig(DeviceConfig):
     @classmethod
     def initialize(cls, data: dict) -> Optional[Device]:
         cls.validate(data, throw_on_error=True)
-        return WindowsAppDevice(
+        return cls.device_class()(
             target_size=data["screenshot_size"],
             crop_settings=data["window_crop_LTRB"],
             window_title_regexes=[data["window_title"]],
@@ -21,6 +21,14 @@ class Device(ABC):
         """
         pass
 
+    def screen_capture_native(self):
+        # type: () -> Image
+        """
+        Captures the same screen content as screen_capture, at the device's own resolution.
+        click and swipe still take screen_capture's coordinates.
+        """
+        return self.screen_capture_raw()
+
     @abstractmethod
     def click(self, x, y):
         # type: (int, int) -> None
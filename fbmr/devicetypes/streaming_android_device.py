@@ -14,6 +14,8 @@ SCRCPY_DEVICE_KILL_THREAD = "SCRCPY_DEVICE_KILL_THREAD"
 
 image_condition = threading.Condition()
 last_image = None
+# incremented for every decoded frame, so that waiters can tell a new frame from the one they already have
+last_image_index = 0
 
 
 class StreamingAndroidDevice(adb_alt_device.ADBAltDevice):
@@ -38,6 +40,7 @@ class StreamingAndroidDevice(adb_alt_device.ADBAltDevice):
                 self.image_queue, self.event_queue, self.thread = start_listener_thread(
                     adb_flags[i + 1], fps, bitrate
                 )
+        self.captured_image_index = 0
         super(StreamingAndroidDevice, self).__init__(capture_size, adb_flags)
 
     def cleanup(self):
@@ -45,16 +48,29 @@ class StreamingAndroidDevice(adb_alt_device.ADBAltDevice):
 
     def screen_capture_raw(self, crop_settings=None):
         # type: (Optional[tuple[int]]) -> Image
-        global image_condition, last_image
+        global image_condition, last_image, last_image_index
         image = None
         with image_condition:
             while True:
                 if last_image is not None:
                     image = last_image
+                    self.captured_image_index = last_image_index
                     break
                 image_condition.wait()
         return Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
 
+    def wait_for_new_frame(self, timeout):
+        # type: (float) -> bool
+        """
+        Block until the stream delivers a frame newer than the last captured one.
+        Returns False if `timeout` seconds pass first.
+        """
+        global image_condition
+        with image_condition:
+            return image_condition.wait_for(
+                lambda: last_image_index > self.captured_image_index, timeout=timeout
+            )
+
     def screen_off(self):
         self.event_queue.put(EVENT_SCREEN_OFF)
 
@@ -77,10 +93,11 @@ def listener_thread(serial, event_queue, fps, bitrate):
                 pass
 
         if frame is not None:
-            global image_condition, last_image
+            global image_condition, last_image, last_image_index
             with image_condition:
                 last_image = frame
-                image_condition.notify()
+                last_image_index += 1
+                image_condition.notify_all()
 
     client = scrcpy.Client(device=serial, max_fps=fps, bitrate=bitrate)
     client.add_listener(scrcpy.EVENT_FRAME, on_frame)
@@ -53,6 +53,10 @@ class WindowsAndroidDevice(device.WindowsAppInterfaceDevice, device.ADBInterface
         # type: () -> Image
         return self.windows_app_device.screen_capture()
 
+    def screen_capture_native(self):
+        # type: () -> Image
+        return self.windows_app_device.screen_capture_native()
+
     def warn_if_screenshot_has_borders(self):
         # type: () -> bool
         return self.windows_app_device.warn_if_screenshot_has_borders()
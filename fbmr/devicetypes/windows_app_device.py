@@ -114,6 +114,17 @@ class WindowsAppDevice(device.WindowsAppInterfaceDevice):
         )
         return im
 
+    def screen_capture_native(self):
+        # type: () -> Image
+        # cropped like screen_capture, but not resized; screenshot_window only returns scales when it resizes
+        _scale_x, _scale_y, im = screenshot_window(
+            self._window_manager, None, crop_settings=self._crop_settings
+        )
+        # clicks are still in target_size coordinates; keep their scales in sync with the window, as screen_capture does
+        self._scale_x = im.size[0] / float(self.target_size[0])
+        self._scale_y = im.size[1] / float(self.target_size[1])
+        return im
+
     def warn_if_screenshot_has_borders(self):
         sc = self.screen_capture_raw(crop_settings=self._crop_settings)
         crop_settings = infer_cropping(sc)
@@ -10,6 +10,9 @@ import numpy
 import pyjson5
 from PIL import Image
 
+from fbmr.conditions import PixelProbeCondition, RegionHashCondition, rgb_at
+from fbmr.utils.fingerprint_index import fingerprint
+
 
 class ConfigUtil:
     """Utility functions for editing the Config.json as a json rather than Config, Action, Effect"""
@@ -154,6 +157,19 @@ def interactive_crop_screenshot_and_save(
     region_image.save(os.path.join(folder, filename_region))
 
 
+def pixel_probe_condition_json(pil_image, points, threshold=94):
+    """A PixelProbeCondition for the colors the screenshot has at each [x, y] in points."""
+    probes = [[x, y, list(rgb_at(pil_image, x, y))] for x, y in points]
+    return PixelProbeCondition(probes, threshold).make_json()
+
+
+def region_hash_condition_json(pil_image, region, threshold=90):
+    """A RegionHashCondition for how the screenshot looks in region (left, upper, right, lower)."""
+    region = [int(v) for v in region]
+    region_hash = fingerprint(pil_image.crop(tuple(region))).tobytes().hex()
+    return RegionHashCondition(region, region_hash, threshold).make_json()
+
+
 def update_action_and_save_json(
     config_name, config_json_dict, action_index_to_update, action_json_str
 ):
@@ -9,6 +9,7 @@ from fbmr.utils.detect_image import (
     find_location_multi_path_pil,
     pad_region,
 )
+from fbmr.utils.template_store import configs_root_of, is_store_ref, resolve
 
 
 def variation() -> int:
@@ -31,7 +32,10 @@ class Effect(object):
 
     def adjust_file_path(self, path):
         # type: (str) -> str
-        if path.startswith("configs"):
+        if is_store_ref(path):
+            # shared with other configs; see fbmr/utils/template_store.py
+            return resolve(path, configs_root_of(self.folder_path))
+        elif path.startswith("configs"):
             # already relative to script root (e.g. configs/[category]/...)
             return path
         else:
@@ -1,3 +1,6 @@
+import functools
+import inspect
+import itertools
 import time
 from typing import List, Union, Optional, Tuple
 import subprocess
@@ -5,10 +8,17 @@ from PIL import Image, ImageDraw
 from abc import ABC, abstractmethod
 import logging
 
-from fbmr.utils.debug_settings import debug_settings
+from fbmr.utils.debug_settings import debug_settings, GlobalTimeoutError
+from fbmr.utils.fingerprint_index import FingerprintIndex
+from fbmr.utils.flight_recorder import FlightRecorder
+from fbmr.utils.learned_regions import LearnedRegions, learned_regions_for
 from fbmr.config import Config, Action
-from fbmr.conditions import Condition
-from fbmr.helpers import sleep_countdown
+from fbmr.conditions import Condition, MatchCache
+from fbmr.helpers import sleep_countdown, time_str, FrameWaiter, capture_frame
+from fbmr.utils import metrics
+from fbmr.utils.session_log import session_log
+from fbmr.utils.template_tracker import TemplateTracker
+from fbmr.utils.transition_stats import TransitionStats, transition_stats_for
 from fbmr.utils.settings import settings
 
 
@@ -16,6 +26,119 @@ class UnreachedExitActionException(ValueError):
     pass
 
 
+# see Executor.chain_step
+CHAIN_ENDED = "ended"
+CHAIN_COMPLETED = "completed"
+
+
+def dumps_flight_recorder_on_failure(execute_chain):
+    """Decorates execute_chain (sync or async) to dump the executor's flight recorder if the chain raises."""
+
+    def dump(executor, e):
+        executor.flight_recorder and executor.flight_recorder.dump(
+            f"{e.__class__.__name__} {e}"
+        )
+
+    if inspect.iscoroutinefunction(execute_chain):
+
+        @functools.wraps(execute_chain)
+        async def async_wrapper(self, *args, **kwargs):
+            try:
+                return await execute_chain(self, *args, **kwargs)
+            except (UnreachedExitActionException, GlobalTimeoutError) as e:
+                dump(self, e)
+                raise
+
+        return async_wrapper
+
+    @functools.wraps(execute_chain)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return execute_chain(self, *args, **kwargs)
+        except (UnreachedExitActionException, GlobalTimeoutError) as e:
+            dump(self, e)
+            raise
+
+    return wrapper
+
+
+# ids for the chain_start and chain_end session log events; shared by every executor in the process
+_chain_ids = itertools.count(1)
+
+
+def logs_chain_to_session_log(execute_chain):
+    """
+    Decorates execute_chain (sync or async) to write chain_start and chain_end events to the session log.
+    Both events have a chain_id, so chains of the same config that run at the same time can be told apart.
+    chain_end has the last action applied, or the exception that ended the chain.
+    """
+
+    def start(executor, start_action_names, end_action_names):
+        if type(start_action_names) is str:
+            start_action_names = [start_action_names]
+        chain_id = next(_chain_ids)
+        executor.log_event(
+            "chain_start",
+            chain_id=chain_id,
+            start_action_names=start_action_names,
+            end_action_names=end_action_names,
+        )
+        return chain_id, time.time()
+
+    def end(executor, started, last_action=None, error=None):
+        chain_id, start_time = started
+        executor.log_event(
+            "chain_end",
+            chain_id=chain_id,
+            seconds=round(time.time() - start_time, 4),
+            last_action=last_action.name if last_action else None,
+            error=error,
+        )
+        session_log.flush()
+
+    if inspect.iscoroutinefunction(execute_chain):
+
+        @functools.wraps(execute_chain)
+        async def async_wrapper(
+            self, start_action_names, end_action_names, *args, **kwargs
+        ):
+            if not session_log.enabled:
+                return await execute_chain(
+                    self, start_action_names, end_action_names, *args, **kwargs
+                )
+            started = start(self, start_action_names, end_action_names)
+            try:
+                result = await execute_chain(
+                    self, start_action_names, end_action_names, *args, **kwargs
+                )
+            except BaseException as e:
+                end(self, started, error=e.__class__.__name__)
+                raise
+            end(self, started, last_action=result)
+            return result
+
+        return async_wrapper
+
+    @functools.wraps(execute_chain)
+    def wrapper(self, start_action_names, end_action_names, *args, **kwargs):
+        if not session_log.enabled:
+            return execute_chain(
+                self, start_action_names, end_action_names, *args, **kwargs
+            )
+        started = start(self, start_action_names, end_action_names)
+        try:
+            result = execute_chain(
+                self, start_action_names, end_action_names, *args, **kwargs
+            )
+        except BaseException as e:
+            end(self, started, error=e.__class__.__name__)
+            raise
+        end(self, started, last_action=result)
+        return result
+
+    return wrapper
+
+
 class ActionScore:
     def __init__(self, action_name, score, bounding_box):
         self.action_name = action_name
@@ -23,6 +146,29 @@ class ActionScore:
         self.bounding_box = bounding_box
 
 
+class AdvanceProgress:
+    """How long an action has waited for its advance_if_condition, and how often it's been retried meanwhile."""
+
+    def __init__(self):
+        self.start_ts = time.time()
+        self.last_retry = self.start_ts
+        self.retries = 0
+
+
+class SpeculativeResult:
+    """Scores for the next actions, computed during a cooldown on a copy of the state_dict."""
+
+    def __init__(
+        self, action_names, pil_image, capture_time, state_dict, action_scores
+    ):
+        # type: (List[str], Image, float, dict, List[ActionScore]) -> None
+        self.action_names = action_names
+        self.pil_image = pil_image
+        self.capture_time = capture_time
+        self.state_dict = state_dict
+        self.action_scores = action_scores
+
+
 class Executor:
     # next_action_names: list[Str]
 
@@ -31,10 +177,162 @@ class Executor:
         self.next_action_names = []
         self.execution_hook = None  # type: Optional[ExecutionHook]
         self.throw_if_end_action_not_reached = False
+        # seconds to wait for the device to recover after an adb error
+        self.adb_error_wait = 10
+        self.speculative_scoring = settings.get_fbmr_speculative_scoring()
+        self.speculative_max_frame_age = settings.get_fbmr_speculative_max_frame_age()
+        self.speculative_result = None  # type: Optional[SpeculativeResult]
+        # when the frame being acted on was captured; for the frame age metric
+        self.frame_capture_time = None  # type: Optional[float]
+        self.flight_recorder = (
+            FlightRecorder(annotate=annotate_image_with_bounding_boxes)
+            if settings.get_debug_flight_recorder()
+            else None
+        )  # type: Optional[FlightRecorder]
+        self.learned_search_regions = settings.get_fbmr_learned_search_regions()
+        self.learned_regions = None  # type: Optional[LearnedRegions]
+        self.template_tracker = (
+            TemplateTracker() if settings.get_fbmr_track_templates() else None
+        )  # type: Optional[TemplateTracker]
+        self.use_fingerprint_index = settings.get_fbmr_fingerprint_index()
+        self.fingerprint_candidates = settings.get_fbmr_fingerprint_candidates()
+        # built on the first frame that any action could match
+        self.fingerprint_index = None  # type: Optional[FingerprintIndex]
+        self.use_transition_stats = settings.get_fbmr_transition_stats()
+        self.transition_stats = None  # type: Optional[TransitionStats]
+        # with strict_scoring off, scoring stops at the first candidate that scores above 20 + early_stop_margin
+        self.strict_scoring = settings.get_fbmr_strict_scoring()
+        self.early_stop_margin = settings.get_fbmr_early_stop_margin()
+        # match the templates of conditions sharing a region together; only when every candidate is scored anyway
+        self.batch_matching = settings.get_fbmr_batch_matching()
+        self.match_prefilter = settings.get_fbmr_match_prefilter()
+        # frames are captured at the device's resolution, and templates resized to it; see fbmr/utils/frame_scale.py
+        self.native_resolution_capture = settings.get_fbmr_native_resolution_capture()
+        self.last_action_name = None  # type: Optional[str]
+        if settings.get_debug_session_log():
+            session_log.start()
 
     def set_config(self, config: Config):
         self.config = config
+        self.learned_regions = (
+            learned_regions_for(config.folder_path)
+            if self.learned_search_regions
+            else None
+        )
+        self.template_tracker and self.template_tracker.clear()
+        self.fingerprint_index = None
+        self.transition_stats = (
+            transition_stats_for(config.folder_path)
+            if self.use_transition_stats
+            else None
+        )
+        self.last_action_name = None
+
+    def add_utils(self, utils: dict):
+        """Adds the executor's per-config helpers to the utils passed to conditions and effects."""
+        if self.learned_regions:
+            utils["learned_regions"] = self.learned_regions
+        if self.template_tracker:
+            utils["template_tracker"] = self.template_tracker
+        if self.match_prefilter:
+            utils["match_prefilter"] = True
+        if self.native_resolution_capture:
+            if self.config.screenshot_size:
+                utils["screenshot_size"] = tuple(self.config.screenshot_size)
+            else:
+                logging.getLogger("fbmr_logger").warning(
+                    f"Executor: {self.config.name} has no screenshot_size, so its templates can't be resized to match"
+                    f" frames captured at the device's resolution"
+                )
+
+    def start_chain(
+        self, start_action_names: Union[str, list[str]], utils: dict
+    ) -> List[str]:
+        """The bookkeeping at the start of execute_chain; returns start_action_names as a list."""
+        if type(start_action_names) is str:
+            start_action_names = [start_action_names]
+        self.next_action_names = start_action_names
+        self.speculative_result = None
+        self.flight_recorder and self.flight_recorder.record_event(
+            f"starting chain {start_action_names}"
+        )
+        self.add_utils(utils)
 
+        self.execution_hook and self.execution_hook.starting_chain(
+            start_action_names, self.config
+        )
+        return start_action_names
+
+    def begin_search(self, start_action_names: List[str], start: float):
+        self.execution_hook and self.execution_hook.searching_for_action(
+            self.next_action_names, self.config
+        )
+
+        minutes = (time.time() - start) / 60
+        logging.getLogger("fbmr_logger").info(
+            f"action_chain '{start_action_names}' running: {minutes:.2f} minutes; next: {self.next_action_names}"
+        )
+
+    def chain_step(
+        self,
+        executed_action: Optional[Action],
+        start_action_names: List[str],
+        end_action_names: List[str],
+    ) -> Tuple[Optional[str], List[str]]:
+        """
+        After each search: CHAIN_ENDED if there are no next actions, CHAIN_COMPLETED if an end action ran, or None;
+        and the start_action_names to report the chain under from now on.
+        """
+        if len(self.next_action_names) == 0:
+            return CHAIN_ENDED, start_action_names
+        if executed_action and len(start_action_names) > 1:
+            start_action_names = [executed_action.name]
+        if (
+            executed_action
+            and end_action_names
+            and executed_action.name in end_action_names
+        ):
+            logging.getLogger("fbmr_logger").info(
+                f"action_chain '{start_action_names}' completed -> {executed_action.name}; returning"
+            )
+            self.execution_hook and self.execution_hook.chain_completed(
+                start_action_names, executed_action.name, self.config
+            )
+            return CHAIN_COMPLETED, start_action_names
+        return None, start_action_names
+
+    def adb_error(self):
+        metrics.adb_errors.inc()
+        logging.getLogger("fbmr_logger").error("adb error")
+        self.flight_recorder and self.flight_recorder.dump("adb error")
+
+    def timed_out(
+        self, start_action_names: List[str], start: float, max_minutes: float
+    ) -> bool:
+        """Whether the chain has run for longer than max_minutes (0 for no limit); reports it if it has."""
+        minutes = (time.time() - start) / 60
+        if max_minutes != 0 and minutes > max_minutes:
+            logging.getLogger("fbmr_logger").warning(
+                f"action_chain '{start_action_names}' max_minutes exceeded; uptime: {minutes} minutes"
+            )
+            self.flight_recorder and self.flight_recorder.dump("max_minutes exceeded")
+            self.execution_hook and self.execution_hook.chain_timed_out(
+                start_action_names, minutes * 60, self.config
+            )
+            return True
+        return False
+
+    def action_delay(self, action_start: float, min_action_delay: float) -> float:
+        """How long to wait before the next search, so that searches start at least min_action_delay apart."""
+        wait_time = min(
+            float(min_action_delay) - (time.time() - action_start), min_action_delay
+        )
+        if wait_time > 0:
+            self.log_event("delay", seconds=round(wait_time, 4))
+        return wait_time
+
+    @logs_chain_to_session_log
+    @dumps_flight_recorder_on_failure
     def execute_chain(
         self,
         start_action_names: Union[str, list[str]],
@@ -44,68 +342,42 @@ class Executor:
         min_action_delay: float = 0.0,
         max_minutes: float = 0.0,
     ) -> Optional[Action]:
-        if type(start_action_names) is str:
-            start_action_names = [start_action_names]
-        self.next_action_names = start_action_names
-
-        self.execution_hook and self.execution_hook.starting_chain(
-            start_action_names, self.config
-        )
-
+        start_action_names = self.start_chain(start_action_names, utils)
         device = utils["device"]
         start = time.time()
         executed_action = None
         while True:
             debug_settings.check_timeout()
-
-            self.execution_hook and self.execution_hook.searching_for_action(
-                self.next_action_names, self.config
-            )
-
-            minutes = (time.time() - start) / 60
-            logging.getLogger("fbmr_logger").info(
-                f"action_chain '{start_action_names}' running: {minutes:.2f} minutes; next: {self.next_action_names}"
-            )
+            self.begin_search(start_action_names, start)
 
             action_start = time.time()
             try:
-                image = device.screen_capture()
+                image, action_scores = self.take_speculative_result(state_dict)
+                if image is None:
+                    image = capture_frame(device)
+                    self.frame_capture_time = time.time()
                 executed_action = self.execute_best_action(
-                    image, state_dict, utils, end_action_names=end_action_names
+                    image,
+                    state_dict,
+                    utils,
+                    end_action_names=end_action_names,
+                    action_scores=action_scores,
                 )
-                if len(self.next_action_names) == 0:
+                outcome, start_action_names = self.chain_step(
+                    executed_action, start_action_names, end_action_names
+                )
+                if outcome == CHAIN_ENDED:
                     return None
-                if executed_action and len(start_action_names) > 1:
-                    start_action_names = [executed_action.name]
-                if (
-                    executed_action
-                    and end_action_names
-                    and executed_action.name in end_action_names
-                ):
-                    logging.getLogger("fbmr_logger").info(
-                        f"action_chain '{start_action_names}' completed -> {executed_action.name}; returning"
-                    )
-                    self.execution_hook and self.execution_hook.chain_completed(
-                        start_action_names, executed_action.name, self.config
-                    )
+                if outcome == CHAIN_COMPLETED:
                     break
             except subprocess.CalledProcessError:
-                logging.getLogger("fbmr_logger").error("adb error")
-                time.sleep(10)
+                self.adb_error()
+                time.sleep(self.adb_error_wait)
 
-            minutes = (time.time() - start) / 60
-            if max_minutes != 0 and minutes > max_minutes:
-                logging.getLogger("fbmr_logger").warning(
-                    f"action_chain '{start_action_names}' max_minutes exceeded; uptime: {minutes} minutes"
-                )
-                self.execution_hook and self.execution_hook.chain_timed_out(
-                    start_action_names, minutes * 60, self.config
-                )
+            if self.timed_out(start_action_names, start, max_minutes):
                 break
 
-            wait_time = min(
-                float(min_action_delay) - (time.time() - action_start), min_action_delay
-            )
+            wait_time = self.action_delay(action_start, min_action_delay)
             if wait_time > 0:
                 time.sleep(wait_time)
         self.next_action_names = None
@@ -114,152 +386,407 @@ class Executor:
     def score_actions(
         self, pil_image: Image, state_dict: dict, utils: dict, action_names: List[str]
     ) -> List[ActionScore]:
+        """
+        Scores the actions, best first. Candidates are scored in order of how often they've followed the last action,
+        if transition_stats is on; without strict_scoring, the ones after the first clearly viable one aren't scored.
+        With batch_matching, templates that several conditions search the same region for are matched in one pass.
+        """
+        if self.transition_stats:
+            action_names = self.transition_stats.order(
+                self.last_action_name, action_names
+            )
+        if self.batch_matching and self.strict_scoring and len(action_names) > 1:
+            match_cache = MatchCache(pil_image)
+            match_cache.prefetch(
+                [
+                    condition
+                    for action_name in action_names
+                    if self.config.get_action(action_name).is_enabled
+                    for condition in self.config.get_action(action_name).conditions
+                ],
+                utils,
+            )
+            utils = dict(utils, match_cache=match_cache)
         action_scores = []  # type: List[ActionScore]
+        timings = []  # type: List[list]
         for action_name in action_names:
+            action_start = time.perf_counter()
             viability, rect = self.config.get_action(action_name).find_valid_rect(
                 pil_image, state_dict, utils
             )
             action_scores.append(ActionScore(action_name, viability, rect))
+            if session_log.enabled:
+                seconds = round(time.perf_counter() - action_start, 6)
+                timings.append([action_name, viability, seconds])
+            if not self.strict_scoring and viability > 20 + self.early_stop_margin:
+                break
         action_scores.sort(key=lambda x: x.score, reverse=True)
+        # [action name, score, seconds], in scoring order
+        self.log_event("score", actions=timings)
         return action_scores
 
-    def execute_best_action(
-        self,
-        pil_image: Image,
-        state_dict: dict,
-        utils: dict,
-        end_action_names: Optional[List[str]] = None,
-    ) -> Optional[Action]:
+    def score_all_actions(
+        self, pil_image: Image, state_dict: dict, utils: dict
+    ) -> List[ActionScore]:
+        """
+        Scores the config's actions, for when any of them could be next.
+        With the fingerprint index, only the actions recorded on screens like pil_image are scored, unless none of
+        them are viable; then the rest are scored too.
+        """
+        action_names = [a.name for a in self.config.actions]
+        if not self.use_fingerprint_index:
+            return self.score_actions(pil_image, state_dict, utils, action_names)
+        if self.fingerprint_index is None:
+            self.fingerprint_index = FingerprintIndex.build(self.config)
+        candidates = self.fingerprint_index.candidates(
+            pil_image, self.fingerprint_candidates
+        )
+        action_scores = []  # type: List[ActionScore]
+        if candidates:
+            action_scores = self.score_actions(pil_image, state_dict, utils, candidates)
+        metrics.fingerprint_lookups.inc()
+        if action_scores and action_scores[0].score > 20:
+            return action_scores
+        metrics.fingerprint_fallbacks.inc()
+        remaining = [name for name in action_names if name not in candidates]
+        action_scores += self.score_actions(pil_image, state_dict, utils, remaining)
+        action_scores.sort(key=lambda x: x.score, reverse=True)
+        return action_scores
+
+    def score_candidates(
+        self, pil_image: Image, state_dict: dict, utils: dict
+    ) -> List[ActionScore]:
+        """Scores next_action_names, or every action if any of them could be next."""
         self.next_action_names = [n for n in self.next_action_names if n]
         if len(self.next_action_names) > 0:
             logging.getLogger("fbmr_logger").debug(
-                f"execute_best_action: next_action_names {self.next_action_names}"
+                "execute_best_action: next_action_names %s", self.next_action_names
+            )
+            return self.score_actions(
+                pil_image, state_dict, utils, self.next_action_names
             )
+        return self.score_all_actions(pil_image, state_dict, utils)
 
-        action_scores = self.score_actions(
-            pil_image,
-            state_dict,
-            utils,
-            self.next_action_names or [a.name for a in self.config.actions],
-        )
+    def decide_action(
+        self,
+        pil_image: Image,
+        state_dict: dict,
+        utils: dict,
+        action_scores: Optional[List[ActionScore]] = None,
+    ) -> Tuple[Optional[Action], List[ActionScore], Image]:
+        """
+        Scores the candidates on pil_image, unless action_scores already has their scores. Returns the best one if
+        it's viable (and, with confirmAll, still viable on a new frame), the scores, and pil_image annotated with them.
+        Blocks; calls no ExecutionHook methods.
+        """
+        if action_scores is None:
+            action_scores = self.score_candidates(pil_image, state_dict, utils)
         action = self.config.get_action(action_scores[0].action_name)
-
-        def confirm_action():
-            if self.config.confirmAll:
-                confirmation_image = utils["device"].screen_capture()
-                confirm_viability = action.is_valid(
-                    confirmation_image, state_dict, utils
-                )
-                if confirm_viability < 20:
-                    logging.getLogger("fbmr_logger").debug(
-                        f"execute_best_action: confirm failed {action.name} viability {confirm_viability}"
-                    )
-                    return False
-            return True
-
         annotated_image = annotate_image_with_bounding_boxes(
             pil_image, [(a.score, a.bounding_box) for a in action_scores]
         )
-        if action and action_scores[0].score > 20 and confirm_action():
+        if not action or action_scores[0].score <= 20:
+            return None, action_scores, annotated_image
+        if self.config.confirmAll:
+            confirmation_image = capture_frame(utils["device"])
+            confirm_viability = action.is_valid(confirmation_image, state_dict, utils)
+            if confirm_viability < 20:
+                logging.getLogger("fbmr_logger").debug(
+                    f"execute_best_action: confirm failed {action.name} viability {confirm_viability}"
+                )
+                return None, action_scores, annotated_image
+        return action, action_scores, annotated_image
+
+    def record_outcome(
+        self,
+        pil_image: Image,
+        action_scores: List[ActionScore],
+        annotated_image: Image,
+        action: Optional[Action],
+    ):
+        """Records what decide_action decided: the action about to be applied, or a failed search."""
+        if action:
             logging.getLogger("fbmr_logger").info(
                 f"execute_best_action: running {action.name}"
             )
-            self.apply_and_wait(action, pil_image, annotated_image, state_dict, utils)
-            self.next_action_names = action.next_action_names
-            if self.throw_if_end_action_not_reached:
-                if not self.next_action_names and end_action_names:
-                    raise UnreachedExitActionException(
-                        f"execute_best_action: could not reach {end_action_names}"
-                    )
-            return action
+            self.record_decision(action)
+            self.record_frame(pil_image, action_scores, action)
         else:
+            metrics.search_failures.inc()
+            self.record_frame(pil_image, action_scores, None)
             self.execution_hook and self.execution_hook.action_search_failed(
                 annotated_image, self.config
             )
 
-        return None
+    def finish_action(self, action: Action, end_action_names: Optional[List[str]]):
+        """Moves on to the applied action's next actions."""
+        self.next_action_names = action.next_action_names
+        if self.throw_if_end_action_not_reached:
+            if not self.next_action_names and end_action_names:
+                raise UnreachedExitActionException(
+                    f"execute_best_action: could not reach {end_action_names}"
+                )
 
-    def apply_and_wait(
+    def execute_best_action(
         self,
-        action: Action,
         pil_image: Image,
-        annotated_image: Image,
         state_dict: dict,
         utils: dict,
+        end_action_names: Optional[List[str]] = None,
+        action_scores: Optional[List[ActionScore]] = None,
+    ) -> Optional[Action]:
+        """
+        Score the candidate actions on pil_image and apply the best one, if it's viable.
+        `action_scores` can be passed in if the candidates have already been scored on pil_image.
+        """
+        action, action_scores, annotated_image = self.decide_action(
+            pil_image, state_dict, utils, action_scores
+        )
+        self.record_outcome(pil_image, action_scores, annotated_image, action)
+        if action is None:
+            return None
+        self.apply_and_wait(action, pil_image, annotated_image, state_dict, utils)
+        self.finish_action(action, end_action_names)
+        return action
+
+    def before_effects(
+        self, action: Action, pil_image: Image, annotated_image: Optional[Image]
     ):
         if self.execution_hook:
             hook_image = annotated_image or pil_image
             self.execution_hook.performing_action(
                 action, hook_image.copy(), self.config
             )
-        action.apply(pil_image, state_dict, utils)
+
+    def effects_applied(self, action: Action, effect_start: float):
+        self.log_event(
+            "effect", action=action.name, seconds=round(time.time() - effect_start, 4)
+        )
         self.execution_hook and self.execution_hook.after_action(
             action, action.cooldown, self.config
         )
         if action.cooldown:
+            self.log_event("cooldown", action=action.name, seconds=action.cooldown)
             logging.getLogger("fbmr_logger").info(
                 f"action {action.name} applied; cooldown: {action.cooldown:.2f}"
             )
-            sleep_countdown(action.cooldown, interval=0.1)
-        if action.advance_if_condition:
-            device = utils["device"]
-            start_ts = time.time()
-            last_retry = start_ts
-            retries = 0
-            while True:
-                debug_settings.check_timeout()
-                elapsed = time.time() - start_ts
-                retry_duration = settings.get_fbmr_action_retry_duration()
 
-                sc = device.screen_capture()
-                self.execution_hook and self.execution_hook.waiting_to_advance(
-                    action, sc.copy(), elapsed, retry_duration, retries, self.config
+    def report_advance_wait(self, action: Action, sc: Image, progress: AdvanceProgress):
+        self.execution_hook and self.execution_hook.waiting_to_advance(
+            action,
+            sc.copy(),
+            time.time() - progress.start_ts,
+            settings.get_fbmr_action_retry_duration(),
+            progress.retries,
+            self.config,
+        )
+
+    def can_advance(
+        self, action: Action, sc: Image, state_dict: dict, utils: dict
+    ) -> bool:
+        """Whether the action has completed, or one of its next actions has become valid, on sc. Blocks."""
+        # wait for this action to be completed
+        if action.advance_if_condition.is_valid(sc, state_dict, utils):
+            logging.getLogger("fbmr_logger").info(
+                f"action {action.name} advance_if_condition satisfied"
+            )
+            return True
+
+        # or for the next action to become available
+        for next_action_name in action.next_action_names:
+            if self.config.get_action(next_action_name).is_valid(sc, state_dict, utils):
+                logging.getLogger("fbmr_logger").info(
+                    f"action {action.name}'s next action {next_action_name} became valid"
                 )
+                return True
+        return False
 
-                # wait for this action to be completed
-                if action.advance_if_condition.is_valid(sc, state_dict, utils):
-                    logging.getLogger("fbmr_logger").info(
-                        f"action {action.name} advance_if_condition satisfied"
-                    )
-                    break
+    def retry_if_stuck(
+        self,
+        action: Action,
+        sc: Image,
+        state_dict: dict,
+        utils: dict,
+        progress: AdvanceProgress,
+    ) -> bool:
+        """
+        Re-applies the action if it's been waiting to advance for longer than the retry duration, and is still valid
+        on sc (the frame that failed can_advance, rather than a new one). Returns whether it did. Blocks.
+        """
+        elapsed = time.time() - progress.start_ts
+        print(
+            f"action {action.name} waiting for success: {elapsed:.2f} elapsed",
+            end="\n",
+            flush=True,
+        )
+        if (
+            time.time() - progress.last_retry
+        ) <= settings.get_fbmr_action_retry_duration():
+            return False
+        logging.getLogger("fbmr_logger").debug(
+            f"execute_best_action: checking for retry {action.name}"
+        )
+        viability = action.is_valid(sc, state_dict, utils)
+        if viability == 0:
+            return False
+        progress.retries += 1
+        metrics.action_retries.inc()
+        self.log_event("retry", action=action.name, viability=viability)
+        action.apply(sc, state_dict, utils)
+        logging.getLogger("fbmr_logger").debug(
+            f"execute_best_action: retried {action.name} with viability {viability}"
+        )
+        progress.last_retry = time.time()
+        return True
+
+    def advanced(self, action: Action, progress: AdvanceProgress):
+        self.log_event(
+            "advance",
+            action=action.name,
+            seconds=round(time.time() - progress.start_ts, 4),
+            retries=progress.retries,
+        )
 
-                # or for the next action to become available
-                def a_next_action_is_valid():
-                    for next_action_name in action.next_action_names:
-                        if self.config.get_action(next_action_name).is_valid(
-                            sc, state_dict, utils
-                        ):
-                            logging.getLogger("fbmr_logger").info(
-                                f"action {action.name}'s next action {next_action_name} became valid"
-                            )
-                            return True
-                    return False
-
-                if a_next_action_is_valid():
+    def apply_and_wait(
+        self,
+        action: Action,
+        pil_image: Image,
+        annotated_image: Image,
+        state_dict: dict,
+        utils: dict,
+    ):
+        self.before_effects(action, pil_image, annotated_image)
+        effect_start = time.time()
+        action.apply(pil_image, state_dict, utils)
+        self.effects_applied(action, effect_start)
+        if action.cooldown:
+            # the speculative result would be stale by the time advance_if_condition is satisfied
+            if (
+                self.speculative_scoring
+                and action.next_action_names
+                and not action.advance_if_condition
+            ):
+                self.speculate_during_cooldown(action, state_dict, utils)
+            else:
+                sleep_countdown(action.cooldown, interval=0.1)
+        if action.advance_if_condition:
+            waiter = FrameWaiter(utils["device"])
+            progress = AdvanceProgress()
+            while True:
+                debug_settings.check_timeout()
+                sc = waiter.next_frame()
+                self.report_advance_wait(action, sc, progress)
+                if self.can_advance(action, sc, state_dict, utils):
                     break
-
-                print(
-                    f"action {action.name} waiting for success: {elapsed:.2f} elapsed",
-                    end="\n",
-                    flush=True,
-                )
                 # however, if we get stuck, try to get out of it by repeating the action
-                if (time.time() - last_retry) > retry_duration:
-                    sc = device.screen_capture()
-                    logging.getLogger("fbmr_logger").debug(
-                        f"execute_best_action: checking for retry {action.name}"
-                    )
-                    viability = action.is_valid(sc, state_dict, utils)
-                    if viability != 0:
-                        retries += 1
-                        action.apply(sc, state_dict, utils)
-                        logging.getLogger("fbmr_logger").debug(
-                            f"execute_best_action: retried {action.name} with viability {viability}"
-                        )
-                        last_retry = time.time()
-                time.sleep(0.5)
+                if self.retry_if_stuck(action, sc, state_dict, utils, progress):
+                    waiter.reset()
+            self.advanced(action, progress)
         print("\n", flush=True)
 
+    def speculate_during_cooldown(self, action: Action, state_dict: dict, utils: dict):
+        """
+        Sleep through action.cooldown, scoring action.next_action_names on incoming frames in the meantime.
+        Nothing is applied here: the most recent result is left in self.speculative_result for execute_chain.
+        """
+        action_names = [n for n in action.next_action_names if n]
+        waiter = FrameWaiter(utils["device"])
+        end_time = time.time() + action.cooldown
+        last_cycle_duration = 0.0
+        # don't start a capture+score cycle that would run past the end of the cooldown
+        while end_time - time.time() > last_cycle_duration:
+            debug_settings.check_timeout()
+            print(
+                f"\rSpeculating for {time_str(end_time - time.time())}",
+                end="",
+            )
+            cycle_start = time.time()
+            pil_image = waiter.next_frame()
+            capture_time = time.time()
+            speculative_state = dict(state_dict)
+            action_scores = self.score_actions(
+                pil_image, speculative_state, utils, action_names
+            )
+            self.speculative_result = SpeculativeResult(
+                action_names,
+                pil_image,
+                capture_time,
+                speculative_state,
+                action_scores,
+            )
+            last_cycle_duration = time.time() - cycle_start
+        time.sleep(max(end_time - time.time(), 0))
+        print("")
+
+    def take_speculative_result(
+        self, state_dict: dict
+    ) -> Tuple[Optional[Image], Optional[List[ActionScore]]]:
+        """
+        Consume self.speculative_result if it was scored for the current next_action_names on a fresh enough frame.
+        The state_dict updates made while scoring it are applied to state_dict.
+        """
+        result = self.speculative_result
+        self.speculative_result = None
+        if result is None:
+            return None, None
+        frame_age = time.time() - result.capture_time
+        if (
+            result.action_names != [n for n in self.next_action_names if n]
+            or frame_age > self.speculative_max_frame_age
+        ):
+            logging.getLogger("fbmr_logger").debug(
+                f"speculative result discarded; frame age {frame_age:.2f}"
+            )
+            return None, None
+        logging.getLogger("fbmr_logger").debug(
+            f"speculative result used; frame age {frame_age:.2f}"
+        )
+        state_dict.update(result.state_dict)
+        self.frame_capture_time = result.capture_time
+        return result.pil_image, result.action_scores
+
+    def record_decision(self, action: Action):
+        metrics.action_decisions.inc()
+        self.transition_stats and self.transition_stats.record(
+            self.last_action_name, action.name
+        )
+        self.last_action_name = action.name
+        if self.frame_capture_time is not None:
+            metrics.frame_age_seconds.observe(time.time() - self.frame_capture_time)
+
+    def record_frame(
+        self,
+        pil_image: Image,
+        action_scores: List[ActionScore],
+        action: Optional[Action],
+    ):
+        """Records the decision made on a frame (action is None if none was viable)."""
+        if session_log.enabled:
+            self.log_event(
+                "decision",
+                action=action.name if action else None,
+                best=action_scores[0].action_name,
+                score=action_scores[0].score,
+                frame_age=(
+                    round(time.time() - self.frame_capture_time, 4)
+                    if self.frame_capture_time is not None
+                    else None
+                ),
+            )
+        if self.flight_recorder:
+            self.flight_recorder.record_frame(
+                pil_image,
+                [(a.action_name, a.score, a.bounding_box) for a in action_scores],
+                action.name if action else None,
+            )
+
+    def log_event(self, event: str, **fields):
+        """Writes an event for this executor's config to the session log, if it's enabled."""
+        if session_log.enabled:
+            session_log.event(
+                event, config=self.config.name if self.config else None, **fields
+            )
+
     def check_conditions(
         self,
         conditions: List[Condition],
@@ -1,6 +1,12 @@
 import logging
 import time
 
+from fbmr.utils import metrics
+from fbmr.utils.settings import settings
+
+# re-applying an action faster than this risks double taps while the device is still reacting to the last one
+REAPPLY_INTERVAL = 0.5
+
 
 def time_str(seconds):
     """
@@ -31,6 +37,83 @@ def sleep_countdown(duration, interval=1.0):
     print("")
 
 
+def capture_frame(device):
+    """
+    Capture a frame from the device, recording the capture count and latency metrics.
+    With `native_resolution_capture = true` in settings.txt, the frame isn't resized to the config's screenshot_size.
+
+    Args:
+        device: The device to capture from.
+
+    Returns:
+        The captured image.
+    """
+    with metrics.capture_seconds.time():
+        if settings.get_fbmr_native_resolution_capture():
+            image = device.screen_capture_native()
+        else:
+            image = device.screen_capture()
+    metrics.captures.inc()
+    return image
+
+
+class FrameWaiter:
+    """
+    Paces the captures of a loop that waits for the screen to change.
+
+    Devices that can signal new frames (see StreamingAndroidDevice.wait_for_new_frame) are captured as soon as a
+    new frame arrives. Other devices are polled, starting at `min_interval` and backing off towards `max_interval`
+    while nothing happens. Call reset() after acting on the device, since that's when the screen is likely to change.
+    """
+
+    def __init__(self, device, min_interval=None, max_interval=None, backoff=1.5):
+        self.device = device
+        self.min_interval = (
+            settings.get_fbmr_wait_min_interval()
+            if min_interval is None
+            else min_interval
+        )
+        self.max_interval = (
+            settings.get_fbmr_wait_max_interval()
+            if max_interval is None
+            else max_interval
+        )
+        self.backoff = backoff
+        self.interval = self.min_interval
+        self.captured = False
+
+    def reset(self):
+        self.interval = self.min_interval
+
+    @property
+    def is_streaming(self):
+        return getattr(self.device, "wait_for_new_frame", None) is not None
+
+    def next_interval(self):
+        """Returns how long to sleep before the next poll, and backs off the one after it."""
+        interval = self.interval
+        self.interval = min(self.interval * self.backoff, self.max_interval)
+        return interval
+
+    def wait(self):
+        if self.is_streaming:
+            self.device.wait_for_new_frame(self.max_interval)
+            return
+        time.sleep(self.next_interval())
+
+    def next_frame(self):
+        """
+        Capture a frame, waiting first unless this is the first capture.
+
+        Returns:
+            The captured image.
+        """
+        if self.captured:
+            self.wait()
+        self.captured = True
+        return capture_frame(self.device)
+
+
 def apply_action_and_wait_to_become_invalid(
     log_prefix, action_name, success_stat, device, config, state, utils, stats
 ):
@@ -46,21 +129,25 @@ def apply_action_and_wait_to_become_invalid(
     2. A menu item that causes the menu itself to change.
     """
     clicked = False
+    last_apply = 0.0
+    waiter = FrameWaiter(device)
     while True:
-        time.sleep(0.5)
-        image = device.screen_capture()
+        image = waiter.next_frame()
         action = config.get_action(action_name)
         viability = action.is_valid(image, state, utils)
 
         logging.getLogger("fbmr_logger").debug(
-            f"{log_prefix}: checking ", action.name, " viability ", viability
+            f"{log_prefix}: checking {action.name} viability {viability}"
         )
         if viability == 0 and not clicked:
             # waiting for the action to become valid
             continue
         elif viability != 0:
             # action is valid, we'll click until it's accepted
-            action.apply(image, state, utils)
+            if time.time() - last_apply >= REAPPLY_INTERVAL:
+                action.apply(image, state, utils)
+                last_apply = time.time()
+                waiter.reset()
             clicked = True
         elif viability == 0 and clicked:
             # the action succeeded because it can no longer be performed
@@ -97,21 +184,25 @@ def apply_action_and_wait_for_next_action(
     (OpenCV cannot differentiate between colors; a button looks the same even if it's grayed out.)
     """
     clicked = False
+    last_apply = 0.0
+    waiter = FrameWaiter(device)
     while True:
-        time.sleep(0.5)
-        image = device.screen_capture()
+        image = waiter.next_frame()
         action = config.get_action(action_name)
         viability = action.is_valid(image, state, utils)
 
         logging.getLogger("fbmr_logger").debug(
-            f"{log_prefix}: checking ", action.name, " viability ", viability
+            f"{log_prefix}: checking {action.name} viability {viability}"
         )
         if viability == 0 and not clicked:
             # waiting for the action to become valid
             continue
         elif viability != 0:
             # action is valid, we'll click until it's accepted
-            action.apply(image, state, utils)
+            if time.time() - last_apply >= REAPPLY_INTERVAL:
+                action.apply(image, state, utils)
+                last_apply = time.time()
+                waiter.reset()
             clicked = True
         elif clicked:
             if config.get_action(next_action_name).is_valid(image, state, utils) != 0:
@@ -129,17 +220,24 @@ def hammer_back_button_until_action_viable(
     1. Opening the app causes dialogs to appear (that can be dismissed with BACK).
     2. Returning to the home screen from a nested menu.
     """
-    seen = 0
+    seen_duration = 0.0
+    last_press = 0.0
+    last_capture = time.time()
+    waiter = FrameWaiter(device)
     while True:
-        image = device.screen_capture()
+        image = waiter.next_frame()
+        now = time.time()
         action = config.get_action(action_name)
         viability = action.is_valid(image, state, utils)
 
         if viability == 0:
             # keep trying to close dialogs
-            device.press_back_button()
+            if now - last_press >= REAPPLY_INTERVAL:
+                device.press_back_button()
+                last_press = now
+                waiter.reset()
         else:
-            seen += 1
-            if seen > 10:  # 5 seconds of just the home screen
+            seen_duration += now - last_capture
+            if seen_duration > 5:  # 5 seconds of just the home screen
                 break
-        time.sleep(0.5)
+        last_capture = now
@@ -0,0 +1,291 @@
+import logging
+import subprocess
+import threading
+import time
+from queue import Queue, Empty, Full
+from typing import List, Union, Optional
+
+from PIL import Image
+
+from fbmr.config import Action
+from fbmr.executor import (
+    CHAIN_COMPLETED,
+    CHAIN_ENDED,
+    Executor,
+    ActionScore,
+    dumps_flight_recorder_on_failure,
+    logs_chain_to_session_log,
+)
+from fbmr.helpers import FrameWaiter, capture_frame
+from fbmr.utils.debug_settings import debug_settings
+
+
+class PipelineFrame:
+    def __init__(self, index, pil_image, capture_time):
+        # type: (int, Image, float) -> None
+        self.index = index
+        self.pil_image = pil_image
+        self.capture_time = capture_time
+
+
+class PipelineDecision:
+    """The scores for one frame, tagged with the frame and the generation of next_action_names they were made for."""
+
+    def __init__(self, frame, generation, action_names, state_dict, action_scores):
+        # type: (PipelineFrame, int, List[str], dict, List[ActionScore]) -> None
+        self.frame = frame
+        self.generation = generation
+        self.action_names = action_names
+        self.state_dict = state_dict
+        self.action_scores = action_scores
+
+
+class PipelineError:
+    """Wraps an exception from a stage thread, so that it can be re-raised in the calling thread."""
+
+    def __init__(self, exception):
+        # type: (BaseException) -> None
+        self.exception = exception
+
+
+def put_latest(queue, item):
+    # type: (Queue, object) -> bool
+    """Put item into a bounded queue, dropping the oldest item if it's full. Returns True if something was dropped."""
+    dropped = False
+    while True:
+        try:
+            queue.put_nowait(item)
+            return dropped
+        except Full:
+            try:
+                queue.get_nowait()
+                dropped = True
+            except Empty:
+                pass
+
+
+class PipelinedExecutor(Executor):
+    """
+    An Executor that runs capture, scoring and actuation as separate stages, connected by bounded queues:
+    - a capture thread pushes frames, dropping the oldest frame if scoring has fallen behind.
+    - a scoring thread scores the current next_action_names on each frame, on a copy of the state_dict.
+    - the calling thread applies the decisions, and is the only thread that calls the ExecutionHook.
+
+    Each decision is tagged with its frame and the 'generation' of next_action_names it was scored for.
+    Decisions for an old generation, or on frames captured before the last action finished, are discarded; so
+    actions are never decided on a screen from before the previous action took effect.
+    While an action is being applied (including its cooldown and advance_if_condition), the capture stage is paused,
+    so only one thread captures from the device at a time.
+    On slow devices, the time per search becomes max(capture, scoring) rather than capture + scoring.
+    """
+
+    def __init__(self):
+        super(PipelinedExecutor, self).__init__()
+        # pipelining replaces speculative scoring
+        self.speculative_scoring = False
+        self.dropped_frames = 0
+        self.stale_frames = 0
+        self.last_decision_frame_index = None  # type: Optional[int]
+
+        # guards the fields below; never held while the device is used
+        self._lock = threading.Lock()
+        # held by the capture stage for each capture, and by the calling thread while it applies an action
+        self._device_lock = threading.Lock()
+        self._generation = 0
+        self._action_names = []  # type: List[str]
+        self._actuation_end_time = 0.0
+
+    def _set_next_action_names(self, action_names):
+        # type: (List[str]) -> None
+        with self._lock:
+            self._generation += 1
+            # empty when any action could be next; see score_all_actions
+            self._action_names = [n for n in action_names if n]
+            self._actuation_end_time = time.time()
+
+    def _begin_actuation(self):
+        with self._lock:
+            # every frame is stale until the action has finished, so the scoring stage leaves the state_dict alone
+            self._actuation_end_time = float("inf")
+
+    def _end_actuation(self):
+        with self._lock:
+            self._actuation_end_time = time.time()
+
+    def _capture_stage(self, device, frame_queue, stop_event):
+        # type: (object, Queue, threading.Event) -> None
+        waiter = FrameWaiter(device, backoff=1.0)
+        index = 0
+        while not stop_event.is_set():
+            if index:
+                waiter.wait()
+            try:
+                # blocks while an action is being applied
+                with self._device_lock:
+                    if stop_event.is_set():
+                        break
+                    pil_image = capture_frame(device)
+            except subprocess.CalledProcessError:
+                self.adb_error()
+                stop_event.wait(self.adb_error_wait)
+                continue
+            index += 1
+            frame = PipelineFrame(index, pil_image, time.time())
+            if put_latest(frame_queue, frame):
+                self.dropped_frames += 1
+
+    def _scoring_stage(
+        self, state_dict, utils, frame_queue, decision_queue, stop_event
+    ):
+        # type: (dict, dict, Queue, Queue, threading.Event) -> None
+        while not stop_event.is_set():
+            try:
+                frame = frame_queue.get(timeout=0.1)
+            except Empty:
+                continue
+            with self._lock:
+                if frame.capture_time < self._actuation_end_time:
+                    self.stale_frames += 1
+                    continue
+                generation = self._generation
+                action_names = list(self._action_names)
+                scoring_state = dict(state_dict)
+            if action_names:
+                action_scores = self.score_actions(
+                    frame.pil_image, scoring_state, utils, action_names
+                )
+            else:
+                action_scores = self.score_all_actions(
+                    frame.pil_image, scoring_state, utils
+                )
+            put_latest(
+                decision_queue,
+                PipelineDecision(
+                    frame, generation, action_names, scoring_state, action_scores
+                ),
+            )
+
+    def _run_stage(self, target, decision_queue, stop_event, *args):
+        try:
+            target(*args)
+        except BaseException as e:
+            stop_event.set()
+            put_latest(decision_queue, PipelineError(e))
+
+    @logs_chain_to_session_log
+    @dumps_flight_recorder_on_failure
+    def execute_chain(
+        self,
+        start_action_names: Union[str, list[str]],
+        end_action_names: list[str],
+        state_dict: dict,
+        utils: dict,
+        min_action_delay: float = 0.0,
+        max_minutes: float = 0.0,
+    ) -> Optional[Action]:
+        start_action_names = self.start_chain(start_action_names, utils)
+        self._set_next_action_names(self.next_action_names)
+
+        frame_queue = Queue(maxsize=1)
+        decision_queue = Queue(maxsize=1)
+        stop_event = threading.Event()
+        stages = [
+            threading.Thread(
+                target=self._run_stage,
+                args=(
+                    self._capture_stage,
+                    decision_queue,
+                    stop_event,
+                    utils["device"],
+                    frame_queue,
+                    stop_event,
+                ),
+                daemon=True,
+            ),
+            threading.Thread(
+                target=self._run_stage,
+                args=(
+                    self._scoring_stage,
+                    decision_queue,
+                    stop_event,
+                    state_dict,
+                    utils,
+                    frame_queue,
+                    decision_queue,
+                    stop_event,
+                ),
+                daemon=True,
+            ),
+        ]
+        for stage in stages:
+            stage.start()
+
+        start = time.time()
+        executed_action = None
+        searching = True
+        try:
+            while True:
+                debug_settings.check_timeout()
+
+                if searching:
+                    self.begin_search(start_action_names, start)
+                    searching = False
+
+                try:
+                    decision = decision_queue.get(timeout=0.1)
+                except Empty:
+                    decision = None
+                if isinstance(decision, PipelineError):
+                    raise decision.exception
+
+                if decision is not None and decision.generation == self._generation:
+                    searching = True
+                    action_start = time.time()
+                    self.last_decision_frame_index = decision.frame.index
+                    self.frame_capture_time = decision.frame.capture_time
+                    logging.getLogger("fbmr_logger").debug(
+                        f"pipeline: deciding on frame #{decision.frame.index}; frame age "
+                        f"{action_start - decision.frame.capture_time:.2f}; dropped {self.dropped_frames}"
+                    )
+                    self._begin_actuation()
+                    try:
+                        with self._device_lock:
+                            state_dict.update(decision.state_dict)
+                            executed_action = self.execute_best_action(
+                                decision.frame.pil_image,
+                                state_dict,
+                                utils,
+                                end_action_names=end_action_names,
+                                action_scores=decision.action_scores,
+                            )
+                    except subprocess.CalledProcessError:
+                        # as in Executor.execute_chain; the capture stage stays paused while the device recovers
+                        self.adb_error()
+                        time.sleep(self.adb_error_wait)
+                        continue
+                    finally:
+                        self._end_actuation()
+                    if executed_action:
+                        self._set_next_action_names(self.next_action_names)
+                    outcome, start_action_names = self.chain_step(
+                        executed_action, start_action_names, end_action_names
+                    )
+                    if outcome == CHAIN_ENDED:
+                        return None
+                    if outcome == CHAIN_COMPLETED:
+                        break
+
+                    if executed_action:
+                        wait_time = self.action_delay(action_start, min_action_delay)
+                        if wait_time > 0:
+                            time.sleep(wait_time)
+                            self._set_next_action_names(self.next_action_names)
+
+                if self.timed_out(start_action_names, start, max_minutes):
+                    break
+        finally:
+            stop_event.set()
+            for stage in stages:
+                stage.join()
+        self.next_action_names = None
+        return executed_action
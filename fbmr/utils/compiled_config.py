@@ -0,0 +1,129 @@
+"""
+compiled_config.py
+
+a packed, memory-mappable copy of a config: its config.json and every template it uses, already decoded.
+
+layout:
+    MAGIC (8 bytes) | header length (uint64, little endian) | header (JSON) | padding | template arrays
+the header holds the config.json contents, the mtime and size of each source file (to tell when it's stale), and the
+offset (from the start of the arrays) and shape of each template. the arrays are raw, C-ordered BGR uint8;
+they start at the first 64 byte boundary after the header, and each is aligned to 64 bytes.
+
+loading maps the file read-only, and templates are numpy views into the mapping: there's no PNG decoding, and
+processes running the same config share the templates' memory through the page cache.
+the file is only ever replaced, never rewritten in place: truncating a mapped file crashes the processes mapping it.
+"""
+
+import json
+import logging
+import os
+import struct
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+from fbmr.utils.lazy_import import LazyModule
+
+np = LazyModule("numpy")
+
+MAGIC = b"FBMRC\x00\x00\x01"
+ALIGNMENT = 64
+COMPILED_FILENAME = "config.compiled"
+
+
+def align(offset):
+    # type: (int) -> int
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def source_signature(path):
+    # type: (str) -> Optional[List[int]]
+    """[mtime_ns, size] of the file, or None if it doesn't exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+class CompiledConfig:
+    def __init__(self, path, header, data):
+        # type: (str, dict, Optional[np.ndarray]) -> None
+        self.path = path
+        self.config_json = header["config"]  # type: dict
+        # {name: [mtime_ns, size]}; "config.json", and each template reference as written in config.json
+        self.sources = header["sources"]  # type: Dict[str, List[int]]
+        self.templates = {}  # type: Dict[str, np.ndarray]
+        for ref, entry in header["templates"].items():
+            size = int(np.prod(entry["shape"]))
+            view = data[entry["offset"] : entry["offset"] + size]
+            self.templates[ref] = view.reshape(entry["shape"])
+
+    @staticmethod
+    def open(path):
+        # type: (str) -> Optional[CompiledConfig]
+        """Maps a compiled config, or returns None if it's missing, unreadable or from another version of fbmr."""
+        try:
+            with open(path, "rb") as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    return None
+                (header_length,) = struct.unpack("<Q", f.read(8))
+                header = json.loads(f.read(header_length).decode("utf-8"))
+            data_start = align(len(MAGIC) + 8 + header_length)
+            data = None
+            if header["templates"]:
+                data = np.memmap(path, dtype=np.uint8, mode="r", offset=data_start)
+            return CompiledConfig(path, header, data)
+        except (OSError, ValueError, KeyError, struct.error) as e:
+            logging.getLogger("fbmr_logger").warning(
+                f"CompiledConfig: couldn't open {path}; {e}"
+            )
+            return None
+
+    def is_stale(self, name, path):
+        # type: (str, str) -> bool
+        """Whether the source file `name` (at `path`) has changed since this was compiled."""
+        recorded = self.sources.get(name, None)
+        return recorded is None or recorded != source_signature(path)
+
+    @staticmethod
+    def write(path, config_json, sources, templates):
+        # type: (str, dict, Dict[str, List[int]], Dict[str, np.ndarray]) -> None
+        """
+        Writes a compiled config. `sources` are the signatures (see source_signature) of the files it was built from,
+        and `templates` the decoded images, keyed by their references in config.json.
+        The file is written to a temporary file and moved into place, so readers never see a partial file.
+        """
+        entries = {}
+        arrays = []  # type: List[Tuple[int, np.ndarray]]
+        offset = 0
+        for ref, image in templates.items():
+            image = np.ascontiguousarray(image, dtype=np.uint8)
+            offset = align(offset)
+            entries[ref] = {
+                "offset": offset,
+                "shape": list(image.shape),
+            }
+            arrays.append((offset, image))
+            offset += image.nbytes
+
+        header = json.dumps(
+            {"config": config_json, "sources": sources, "templates": entries},
+            separators=(",", ":"),
+        ).encode("utf-8")
+        data_start = align(len(MAGIC) + 8 + len(header))
+
+        folder = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(MAGIC)
+                f.write(struct.pack("<Q", len(header)))
+                f.write(header)
+                f.write(b"\0" * (data_start - f.tell()))
+                for array_offset, image in arrays:
+                    f.seek(data_start + array_offset)
+                    f.write(image.tobytes())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.path.exists(tmp_path) and os.unlink(tmp_path)
+            raise
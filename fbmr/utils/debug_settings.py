@@ -1,8 +1,11 @@
 import os
+import threading
 import time
 import logging.config
 import datetime
+from typing import Optional
 
+from fbmr.utils.log_pipeline import LogPipeline, start_log_pipeline
 from fbmr.utils.settings import settings
 
 
@@ -20,9 +23,13 @@ def delete_stale_files_in_folder(folder_path, expiration_duration):
             for file in files:
                 file_path = os.path.join(root, file)
                 if os.path.isfile(file_path) or os.path.islink(file_path):
-                    file_modification_time = os.path.getmtime(file_path)
-                    if (current_time - file_modification_time) > expiration_duration:
-                        os.unlink(file_path)
+                    try:
+                        age = current_time - os.path.getmtime(file_path)
+                        if age > expiration_duration:
+                            os.unlink(file_path)
+                    except FileNotFoundError:
+                        # removed while we were looking; this runs alongside the app
+                        pass
     os.makedirs(folder_path, exist_ok=True)
 
 
@@ -31,14 +38,16 @@ class DebugSettings:
         self.debug_folder = DEBUG_FOLDER
         self.log_folder = LOGS_FOLDER_ABSOLUTE
 
-        delete_stale_files_in_folder(
-            self.debug_folder, settings.get_debug_image_expire_time()
-        )
-        delete_stale_files_in_folder(
-            self.log_folder, settings.get_debug_log_expire_time()
+        os.makedirs(self.debug_folder, exist_ok=True)
+        os.makedirs(self.log_folder, exist_ok=True)
+        # walking /debug can take a while when it's full of images; don't hold up startup for it
+        self.cleanup_thread = threading.Thread(
+            target=self.delete_stale_files, daemon=True
         )
+        self.cleanup_thread.start()
 
-        initialize_logger()
+        # set if async_logging is on; stop() it to go back to writing logs on the calling thread
+        self.log_pipeline = initialize_logger()
 
         self.save_detect_subimage_images = False
         self.log_detect_subimage = False
@@ -46,6 +55,14 @@ class DebugSettings:
         self.timeout_timestamp = 0
         self.timeout_duration = 0
 
+    def delete_stale_files(self):
+        delete_stale_files_in_folder(
+            self.debug_folder, settings.get_debug_image_expire_time()
+        )
+        delete_stale_files_in_folder(
+            self.log_folder, settings.get_debug_log_expire_time()
+        )
+
     def save_image_with_timestamp(self, image, suffix_filename):
         timestamp = datetime.datetime.now().strftime("%Y %B %d %A %I-%M-%S%p")
         debug_image_name = os.path.join(
@@ -69,6 +86,7 @@ class DebugSettings:
 
 
 def initialize_logger():
+    # type: () -> Optional[LogPipeline]
     current_time = datetime.datetime.now()
     formatted_time = current_time.strftime("%Y-%m-%d_%H-%M-%S")
     filename = f"debug_{formatted_time}.log"
@@ -76,6 +94,17 @@ def initialize_logger():
         "logging.conf",
         defaults={"logfilename": os.path.join(LOGS_FOLDER_RELATIVE, filename)},
     )
+    if settings.get_debug_async_logging():
+        matches_jsonl_path = None
+        if settings.get_debug_log_matches_as_jsonl():
+            matches_jsonl_path = os.path.join(
+                LOGS_FOLDER_RELATIVE, f"matches_{formatted_time}.jsonl"
+            )
+        return start_log_pipeline(
+            debug_sample_rate=settings.get_debug_log_debug_sample_rate(),
+            matches_jsonl_path=matches_jsonl_path,
+        )
+    return None
 
 
 debug_settings = DebugSettings()
@@ -4,25 +4,117 @@ detect_subimage.py
 methods for detecting an image within a bigger image + debugging.
 """
 
+import atexit
 import datetime
 import logging
 import ntpath
 import os
+import threading
+import time
 from pathlib import Path
+from queue import Queue, Full
+from typing import Optional
 
-import cv2
-import numpy as np
-
+from fbmr.utils import metrics
 from fbmr.utils.debug_settings import debug_settings
+from fbmr.utils.lazy_import import LazyModule
+from fbmr.utils.settings import settings
+
+# imported on first use; they're most of fbmr's import time
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
 
 GLOBAL_INCREMENT = 0
 
+# the match prefilter splits templates into PREFILTER_GRID x PREFILTER_GRID blocks; more blocks make a tighter bound,
+# but one that takes longer to compute than the match it could skip
+PREFILTER_GRID = 2
+# beyond this many template positions, bounding a region costs about as much as matching it
+PREFILTER_MAX_POSITIONS = 5000
+# matchTemplate's float32 rounding error, relative to the template's norm * the window's (without subtracting means)
+MATCH_ERROR = 1e-5
+
 
 def check_file_exists(fp):
     if not os.path.exists(fp):
         raise ValueError(f"File not found: {fp}")
 
 
+def decode_template(path):
+    # type: (str) -> np.ndarray
+    return cv2.imread(path)
+
+
+class TemplateCache:
+    """
+    Process-wide cache of decoded template images, keyed by path and invalidated by the file's mtime.
+    Shared by every Config (and every device) in the process, so each template is only decoded once.
+    The cached arrays are shared, so callers must not modify them.
+    """
+
+    def __init__(self):
+        self.templates = {}  # type: dict[str, tuple[float, np.ndarray]]
+        # {(path, scale): (the template it was resized from, resized template)}
+        self.scaled_templates = {}  # type: dict[tuple, tuple[np.ndarray, np.ndarray]]
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def read(self, path):
+        # type: (str) -> np.ndarray
+        check_file_exists(path)
+        mtime = os.path.getmtime(path)
+        cached = self.templates.get(path, None)
+        if cached is not None and cached[0] == mtime:
+            self.hits += 1
+            return cached[1]
+        template = decode_template(path)
+        with self.lock:
+            self.misses += 1
+            self.templates[path] = (mtime, template)
+        return template
+
+    def read_scaled(self, path, scale):
+        # type: (str, tuple[float, float]) -> np.ndarray
+        """The template resized by an (x, y) scale, as if it had been cut from a frame at that scale."""
+        template = self.read(path)
+        cached = self.scaled_templates.get((path, scale), None)
+        if cached is not None and cached[0] is template:
+            return cached[1]
+        scaled = scale_template(template, scale)
+        with self.lock:
+            self.scaled_templates[(path, scale)] = (template, scaled)
+        return scaled
+
+    def preload(self, path, template):
+        # type: (str, np.ndarray) -> None
+        """Caches an already decoded template (eg. from a compiled config) for the file as it is now."""
+        mtime = os.path.getmtime(path)
+        with self.lock:
+            self.templates[path] = (mtime, template)
+
+    def clear(self):
+        with self.lock:
+            self.templates = {}
+            self.scaled_templates = {}
+
+
+template_cache = TemplateCache()
+
+
+def scale_template(template_cvimg, scale):
+    # type: (np.ndarray, tuple[float, float]) -> np.ndarray
+    height, width = template_cvimg.shape[:2]
+    size = (max(1, round(width * scale[0])), max(1, round(height * scale[1])))
+    # area averaging when shrinking, like the antialiased resize of captured frames
+    shrinking = size[0] * size[1] < width * height
+    return cv2.resize(
+        template_cvimg,
+        size,
+        interpolation=cv2.INTER_AREA if shrinking else cv2.INTER_CUBIC,
+    )
+
+
 def find_location_path(object_path, scene_path):
     """
     _find_location handles the task of finding the location of an object
@@ -49,19 +141,35 @@ def find_location_pil(template_pil_img, scene_pil_img):
     )
 
 
-def find_location_path_pil(object_path, scene_pil_img):
-    check_file_exists(object_path)
-    return find_location_cv(
-        cv2.imread(object_path),
-        cv2.cvtColor(np.array(scene_pil_img), cv2.COLOR_RGB2BGR),
-        template_name=os.path.splitext(ntpath.basename(object_path))[0],
+def find_location_path_pil(object_path, scene_pil_img, min_strength=None, scale=None):
+    """
+    With min_strength, the match is skipped when match_prefilter shows that no position could score above it; the
+    result is then the prefilter's bound and the position it was reached at, instead of the best match.
+    With an (x, y) scale, the template is resized by it first (see fbmr/utils/frame_scale.py).
+    """
+    if scale:
+        template_cvimg = template_cache.read_scaled(object_path, scale)
+    else:
+        template_cvimg = template_cache.read(object_path)
+    scene_cvimg = cv2.cvtColor(np.array(scene_pil_img), cv2.COLOR_RGB2BGR)
+    template_name = os.path.splitext(ntpath.basename(object_path))[0]
+    if min_strength is None or not match_prefilter.applies(template_cvimg, scene_cvimg):
+        return find_location_cv(template_cvimg, scene_cvimg, template_name)
+
+    rejected = match_prefilter.check(
+        object_path, template_cvimg, scene_cvimg, min_strength
     )
+    if rejected:
+        return rejected
+    match_start = time.perf_counter()
+    location = find_location_cv(template_cvimg, scene_cvimg, template_name)
+    match_prefilter.record_match(time.perf_counter() - match_start)
+    return location
 
 
 def find_location_multi_path_pil(object_path, scene_pil_img, threshold):
-    check_file_exists(object_path)
     return find_location_cv_multi(
-        cv2.imread(object_path),
+        template_cache.read(object_path),
         cv2.cvtColor(np.array(scene_pil_img), cv2.COLOR_RGB2BGR),
         threshold,
         template_name=os.path.splitext(ntpath.basename(object_path))[0],
@@ -92,8 +200,32 @@ def find_location_cv_multi(
     assert s_height > 0, "scene image shouldn't be empty"
     assert s_width > 0, "scene image shouldn't be empty"
 
-    result = cv2.matchTemplate(scene_cvimg, template_cvimg, cv2.TM_CCOEFF_NORMED)
-    h, w = template_cvimg.shape[:2]
+    with metrics.match_template_seconds.time():
+        result = cv2.matchTemplate(scene_cvimg, template_cvimg, cv2.TM_CCOEFF_NORMED)
+    metrics.match_template_calls.inc()
+    return locations_from_result(
+        result,
+        template_cvimg,
+        scene_cvimg,
+        threshold,
+        min_count,
+        max_count,
+        template_name,
+    )
+
+
+def locations_from_result(
+    result,
+    template_cvimg,
+    scene_cvimg,
+    threshold=0.5,
+    min_count=1,
+    max_count=10,
+    template_name="UNKNOWN",
+):
+    """The best matches in a TM_CCOEFF_NORMED result (from cv2.matchTemplate, or SceneMatcher). Modifies result."""
+    t_height, t_width = template_cvimg.shape[:2]
+    h, w = t_height, t_width
 
     strengths_and_bounding_boxes = []
     count = 0
@@ -103,10 +235,14 @@ def find_location_cv_multi(
             break
         x, y = max_loc
         strengths_and_bounding_boxes.append((max_val, (x, y, t_width, t_height)))
-        logging.getLogger("fbmr_logger").debug(
-            "template_matching (str {}) at x,y ({}, {}) with size ({}, {})".format(
-                max_val, x, y, w, h
-            )
+        logging.getLogger("fbmr_logger.matches").debug(
+            "template_matching (str %s) at x,y (%s, %s) with size (%s, %s) for %s",
+            max_val,
+            x,
+            y,
+            w,
+            h,
+            template_name,
         )
         result[
             max_loc[1] - h // 2 : max_loc[1] + h // 2 + 1,
@@ -115,12 +251,480 @@ def find_location_cv_multi(
         count += 1
 
     if debug_settings.save_detect_subimage_images:
-        for strength, box in strengths_and_bounding_boxes:
-            write_debug_image(scene_cvimg, strength, [box], template_name=template_name)
+        # one image per search, with every match drawn on it
+        write_debug_image(
+            scene_cvimg,
+            strengths_and_bounding_boxes[0][0],
+            [box for _strength, box in strengths_and_bounding_boxes],
+            template_name=template_name,
+        )
 
     return strengths_and_bounding_boxes
 
 
+class SceneMatcher:
+    """
+    Matches many templates against one scene, sharing the work that only depends on the scene.
+    cv2.matchTemplate redoes all of it on every call: the scene's Fourier transform, and the integral images its
+    normalization uses. Here the scene is transformed once (each template is zero padded to the scene's size, so the
+    transforms line up), and the normalization is computed once per template size; templates recorded with the macro
+    recorder are all the same size.
+
+    match() gives the same result as cv2.matchTemplate(scene, template, cv2.TM_CCOEFF_NORMED), to float32 precision.
+    """
+
+    def __init__(self, scene_cvimg):
+        # type: (np.ndarray) -> None
+        self.scene_cvimg = scene_cvimg
+        self.scene_height, self.scene_width = scene_cvimg.shape[:2]
+        self.dft_size = (
+            cv2.getOptimalDFTSize(self.scene_height),
+            cv2.getOptimalDFTSize(self.scene_width),
+        )
+        self.scene_spectra = None  # type: Optional[list[np.ndarray]]
+        # per channel window sums, and the window sums of the squares of all channels
+        self.integral = None  # type: Optional[np.ndarray]
+        self.integral_of_squares = None  # type: Optional[np.ndarray]
+        # {(height, width): sqrt of each window's total variance * its pixel count}
+        self.window_norms = {}  # type: dict[tuple[int, int], np.ndarray]
+
+    def _padded(self, image, channel):
+        padded = np.zeros(self.dft_size, np.float32)
+        padded[: image.shape[0], : image.shape[1]] = image[:, :, channel]
+        return padded
+
+    def _prepare_scene(self):
+        scene = self.scene_cvimg.astype(np.float32)
+        self.scene_spectra = [
+            cv2.dft(self._padded(scene, c)) for c in range(scene.shape[2])
+        ]
+        self.integral = cv2.integral(scene, sdepth=cv2.CV_64F)
+        self.integral_of_squares = cv2.integral(
+            np.square(scene, dtype=np.float64).sum(axis=2), sdepth=cv2.CV_64F
+        )
+
+    def _window_norm(self, h, w):
+        key = (h, w)
+        if key not in self.window_norms:
+
+            def window_sums(integral):
+                return (
+                    integral[h:, w:]
+                    - integral[:-h, w:]
+                    - integral[h:, :-w]
+                    + integral[:-h, :-w]
+                )
+
+            sums = window_sums(self.integral)
+            if sums.ndim == 2:
+                sums = sums[:, :, None]
+            variance = window_sums(self.integral_of_squares) - np.square(sums).sum(
+                axis=2
+            ) / (h * w)
+            self.window_norms[key] = np.sqrt(np.maximum(variance, 0)).astype(np.float32)
+        return self.window_norms[key]
+
+    def match(self, template_cvimg):
+        # type: (np.ndarray) -> np.ndarray
+        """The TM_CCOEFF_NORMED result for the template: one score per position, (H - h + 1) x (W - w + 1)."""
+        h, w = template_cvimg.shape[:2]
+        assert h <= self.scene_height and w <= self.scene_width
+        out_h, out_w = self.scene_height - h + 1, self.scene_width - w + 1
+        template = template_cvimg.astype(np.float32)
+        template = template - template.reshape(-1, template.shape[2]).mean(axis=0)
+        template_norm = np.sqrt(np.square(template, dtype=np.float64).sum())
+        if template_norm == 0:
+            # a flat template; cv2 scores it 1 everywhere
+            metrics.match_template_calls.inc()
+            return np.ones((out_h, out_w), np.float32)
+
+        with metrics.match_template_seconds.time():
+            if self.scene_spectra is None:
+                self._prepare_scene()
+            spectrum = None
+            for c, scene_spectrum in enumerate(self.scene_spectra):
+                product = cv2.mulSpectrums(
+                    scene_spectrum,
+                    cv2.dft(self._padded(template, c), nonzeroRows=h),
+                    0,
+                    conjB=True,
+                )
+                spectrum = product if spectrum is None else spectrum + product
+            correlation = cv2.idft(
+                spectrum, flags=cv2.DFT_REAL_OUTPUT | cv2.DFT_SCALE, nonzeroRows=out_h
+            )[:out_h, :out_w]
+
+            norm = self._window_norm(h, w) * np.float32(template_norm)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                result = correlation / norm
+            # as cv2 does: scores just past +-1 (rounding) are clamped, and windows with no variance score 0
+            overshoot = ~(np.abs(result) < 1)
+            result[overshoot] = np.where(
+                np.abs(result[overshoot]) < 1.125, np.sign(result[overshoot]), 0
+            )
+        metrics.match_template_calls.inc()
+        return result
+
+
+def find_locations_cv(template_cvimgs, scene_cvimg, template_names=None):
+    # type: (list[np.ndarray], np.ndarray, Optional[list[str]]) -> list[tuple[float, tuple[int, int, int, int]]]
+    """find_location_cv for each template, sharing the scene's preprocessing between them (see SceneMatcher)."""
+    template_names = template_names or ["UNKNOWN"] * len(template_cvimgs)
+    matcher = SceneMatcher(scene_cvimg)
+    return [
+        locations_from_result(
+            matcher.match(template_cvimg),
+            template_cvimg,
+            scene_cvimg,
+            template_name=template_name,
+        )[0]
+        for template_cvimg, template_name in zip(template_cvimgs, template_names)
+    ]
+
+
+def find_locations_path_pil(object_paths, scene_pil_img):
+    # type: (list[str], Image) -> list[tuple[float, tuple[int, int, int, int]]]
+    return find_locations_cv(
+        [template_cache.read(path) for path in object_paths],
+        cv2.cvtColor(np.array(scene_pil_img), cv2.COLOR_RGB2BGR),
+        [os.path.splitext(ntpath.basename(path))[0] for path in object_paths],
+    )
+
+
+class TemplateBlocks:
+    """
+    The statistics of a template that ncc_upper_bound needs. The template, less its mean, is split into grid x grid
+    blocks, and each block is kept as its mean (per channel) and the norm of its pixels around that mean.
+    """
+
+    def __init__(self, template_cvimg, grid=None):
+        # type: (np.ndarray, Optional[int]) -> None
+        grid = grid or PREFILTER_GRID
+        template = template_cvimg.astype(np.float64)
+        self.height, self.width, channels = template.shape
+        centred = template - template.reshape(-1, channels).mean(axis=0)
+        self.norm = np.sqrt(np.square(centred).sum())
+        self.uncentred_norm = np.sqrt(np.square(template).sum())
+        ys = np.linspace(0, self.height, grid + 1).astype(int)
+        xs = np.linspace(0, self.width, grid + 1).astype(int)
+        # (y, x, height, width) of each block
+        self.boxes = []  # type: list[tuple[int, int, int, int]]
+        self.means = []  # type: list[np.ndarray]
+        self.norms = []  # type: list[float]
+        for y0, y1 in zip(ys[:-1], ys[1:]):
+            for x0, x1 in zip(xs[:-1], xs[1:]):
+                if y1 == y0 or x1 == x0:
+                    continue
+                pixels = centred[y0:y1, x0:x1].reshape(-1, channels)
+                mean = pixels.mean(axis=0)
+                self.boxes.append((int(y0), int(x0), int(y1 - y0), int(x1 - x0)))
+                self.means.append(mean)
+                self.norms.append(float(np.sqrt(np.square(pixels - mean).sum())))
+
+
+def ncc_upper_bound(blocks, scene_cvimg):
+    # type: (TemplateBlocks, np.ndarray) -> np.ndarray
+    """
+    A bound on cv2.matchTemplate(scene, template, cv2.TM_CCOEFF_NORMED) at each position, from integral images of the
+    scene; no position's score is higher than its bound.
+
+    The score's numerator sums (template - its mean) * (window - its mean) over the template's pixels. Over each
+    block, that's (block - block mean) * (window - window's mean over the block), which is at most the product of
+    their norms, plus block mean * the window's sum over the block. The denominator is the template's norm times the
+    window's, as cv2 computes it. matchTemplate's float32 rounding is allowed for with MATCH_ERROR.
+    """
+    h, w = blocks.height, blocks.width
+    out_h, out_w = scene_cvimg.shape[0] - h + 1, scene_cvimg.shape[1] - w + 1
+    if blocks.norm == 0:
+        # a flat template; cv2 scores it 1 everywhere
+        return np.ones((out_h, out_w))
+    integral, integral_of_squares = cv2.integral2(
+        scene_cvimg, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F
+    )
+    integral_of_squares = np.einsum("ijc->ij", integral_of_squares)
+
+    def window_sums(integral, bh, bw):
+        return (
+            integral[bh:, bw:]
+            - integral[:-bh, bw:]
+            - integral[bh:, :-bw]
+            + integral[:-bh, :-bw]
+        )
+
+    def centred_norms(sums, sums_of_squares, count):
+        squared_sums = np.einsum("ijc,ijc->ij", sums, sums)
+        return np.sqrt(np.maximum(sums_of_squares - squared_sums / count, 0))
+
+    # {(height, width): (window sums, centred norms)}, at every offset in the scene
+    by_size = {}  # type: dict[tuple[int, int], tuple[np.ndarray, np.ndarray]]
+    numerator = np.zeros((out_h, out_w))
+    for (y, x, bh, bw), mean, norm in zip(blocks.boxes, blocks.means, blocks.norms):
+        if (bh, bw) not in by_size:
+            sums = window_sums(integral, bh, bw)
+            squares = window_sums(integral_of_squares, bh, bw)
+            by_size[(bh, bw)] = sums, centred_norms(sums, squares, bh * bw)
+        sums, norms = by_size[(bh, bw)]
+        numerator += norm * norms[y : y + out_h, x : x + out_w]
+        numerator += sums[y : y + out_h, x : x + out_w] @ mean
+
+    squares = window_sums(integral_of_squares, h, w)
+    window_norms = centred_norms(window_sums(integral, h, w), squares, h * w)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        error = MATCH_ERROR * blocks.uncentred_norm * np.sqrt(squares)
+        bound = (numerator + error) / (blocks.norm * window_norms) + 1e-4
+    # cv2 scores windows with no variance 0
+    bound[window_norms == 0] = 0
+    return bound
+
+
+class MatchPrefilter:
+    """
+    Skips matching a template against a scene when ncc_upper_bound shows that it can't score above the strength the
+    caller needs. The bound costs about half of a match on the small regions conditions with an intended_region
+    search, and it doesn't pay on big ones, so regions with more than max_positions template positions are always
+    matched.
+    """
+
+    def __init__(self, grid=None, max_positions=None):
+        # type: (Optional[int], Optional[int]) -> None
+        self.grid = grid or PREFILTER_GRID
+        self.max_positions = max_positions or PREFILTER_MAX_POSITIONS
+        # {template path: (template array, its blocks)}; recomputed when template_cache decodes the file again
+        self.blocks = {}  # type: dict[str, tuple[np.ndarray, TemplateBlocks]]
+        self.lock = threading.Lock()
+        self.checks = 0
+        self.rejections = 0
+        self.bound_seconds = 0.0
+        # matches run after the bound didn't reject; to estimate the time each rejection saved
+        self.matches = 0
+        self.match_seconds = 0.0
+
+    def applies(self, template_cvimg, scene_cvimg):
+        # type: (np.ndarray, np.ndarray) -> bool
+        out_h = scene_cvimg.shape[0] - template_cvimg.shape[0] + 1
+        out_w = scene_cvimg.shape[1] - template_cvimg.shape[1] + 1
+        return out_h > 0 and out_w > 0 and out_h * out_w <= self.max_positions
+
+    def template_blocks(self, path, template_cvimg):
+        # type: (str, np.ndarray) -> TemplateBlocks
+        cached = self.blocks.get(path, None)
+        if cached is not None and cached[0] is template_cvimg:
+            return cached[1]
+        blocks = TemplateBlocks(template_cvimg, self.grid)
+        with self.lock:
+            self.blocks[path] = (template_cvimg, blocks)
+        return blocks
+
+    def check(self, path, template_cvimg, scene_cvimg, min_strength):
+        # type: (str, np.ndarray, np.ndarray, float) -> Optional[tuple[float, tuple[int, int, int, int]]]
+        """(the bound, (x, y, width, height) where it peaks) if no position can score min_strength, otherwise None."""
+        start = time.perf_counter()
+        bound = ncc_upper_bound(self.template_blocks(path, template_cvimg), scene_cvimg)
+        y, x = np.unravel_index(np.argmax(bound), bound.shape)
+        strength = float(bound[y, x])
+        rejected = strength < min_strength
+        seconds = time.perf_counter() - start
+        metrics.prefilter_seconds.observe(seconds)
+        metrics.prefilter_checks.inc()
+        with self.lock:
+            self.checks += 1
+            self.bound_seconds += seconds
+            self.rejections += rejected
+            mean_match_seconds = self.match_seconds / max(1, self.matches)
+        if not rejected:
+            return None
+        metrics.prefilter_rejections.inc()
+        metrics.prefilter_match_seconds_skipped.inc(mean_match_seconds)
+        h, w = template_cvimg.shape[:2]
+        return strength, (int(x), int(y), w, h)
+
+    def record_match(self, seconds):
+        # type: (float) -> None
+        with self.lock:
+            self.matches += 1
+            self.match_seconds += seconds
+
+    def seconds_saved(self):
+        # type: () -> float
+        """The estimated matching time skipped, less the time spent on bounds."""
+        with self.lock:
+            mean_match_seconds = self.match_seconds / max(1, self.matches)
+            return self.rejections * mean_match_seconds - self.bound_seconds
+
+    def report(self):
+        # type: () -> str
+        return (
+            f"match prefilter: {self.rejections}/{self.checks} rejected,"
+            f" {self.seconds_saved():.2f}s saved"
+        )
+
+
+match_prefilter = MatchPrefilter()
+
+
+class DebugImageWrite:
+    def __init__(self, scene_cvimg, bounding_boxes, path):
+        # type: (np.ndarray, list[tuple[int, int, int, int]], str) -> None
+        self.scene_cvimg = scene_cvimg
+        self.bounding_boxes = bounding_boxes
+        self.path = path
+
+
+class DebugImageWriter:
+    """
+    Writes debug images from a background thread, so that --debug doesn't slow down matching (and change timing).
+
+    Images are dropped instead of blocking the caller: when the queue is full, when they're filtered out by
+    `every_nth` (save one in N searches) or `failures_only` (save searches whose best match is weaker than
+    `failure_strength`), and while writing is over `max_mb_per_second`. Dropped images are counted; see report().
+    """
+
+    def __init__(
+        self,
+        queue_size=None,
+        every_nth=None,
+        failures_only=None,
+        failure_strength=None,
+        max_mb_per_second=None,
+        png_compression=1,
+    ):
+        self.queue = Queue(
+            settings.get_debug_image_queue_size() if queue_size is None else queue_size
+        )
+        self.every_nth = (
+            settings.get_debug_image_every_nth() if every_nth is None else every_nth
+        )
+        self.failures_only = (
+            settings.get_debug_image_failures_only()
+            if failures_only is None
+            else failures_only
+        )
+        self.failure_strength = (
+            settings.get_debug_image_failure_strength()
+            if failure_strength is None
+            else failure_strength
+        )
+        self.max_mb_per_second = (
+            settings.get_debug_image_max_mb_per_second()
+            if max_mb_per_second is None
+            else max_mb_per_second
+        )
+        # 0-9; PNG encoding dominates the cost of a write, and level 1 is several times faster than the default of 3
+        self.png_compression = png_compression
+        self.lock = threading.Lock()
+        self.thread = None  # type: Optional[threading.Thread]
+        self.searches = 0
+        self.written = 0
+        self.written_bytes = 0
+        self.dropped = {
+            "queue_full": 0,
+            "sampled": 0,
+            "succeeded": 0,
+            "rate_limited": 0,
+        }
+        # token bucket for max_mb_per_second; refilled with elapsed time, drained by the bytes written
+        self.byte_budget = self.max_mb_per_second * 1024 * 1024
+        self.byte_budget_time = time.time()
+
+    def _drop(self, reason):
+        with self.lock:
+            self.dropped[reason] += 1
+        metrics.debug_images_dropped.inc()
+
+    def _over_rate_limit(self):
+        if not self.max_mb_per_second:
+            return False
+        max_bytes_per_second = self.max_mb_per_second * 1024 * 1024
+        with self.lock:
+            now = time.time()
+            self.byte_budget = min(
+                self.byte_budget + (now - self.byte_budget_time) * max_bytes_per_second,
+                max_bytes_per_second,
+            )
+            self.byte_budget_time = now
+            return self.byte_budget <= 0
+
+    def submit(self, scene_cvimg, strength, bounding_boxes, path):
+        # type: (np.ndarray, float, list[tuple[int, int, int, int]], str) -> bool
+        """Queues a copy of scene_cvimg to be annotated with bounding_boxes and saved to path. Never blocks."""
+        with self.lock:
+            self.searches += 1
+            searches = self.searches
+        if self.every_nth > 1 and searches % self.every_nth != 1:
+            self._drop("sampled")
+            return False
+        if self.failures_only and strength >= self.failure_strength:
+            self._drop("succeeded")
+            return False
+        if self._over_rate_limit():
+            self._drop("rate_limited")
+            return False
+        try:
+            self.queue.put_nowait(
+                DebugImageWrite(scene_cvimg.copy(), list(bounding_boxes), path)
+            )
+        except Full:
+            self._drop("queue_full")
+            return False
+        self._start()
+        return True
+
+    def _start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._write_loop, daemon=True)
+                self.thread.start()
+                # the thread is a daemon; don't lose the queued images at exit
+                atexit.register(self.flush)
+
+    def _write_loop(self):
+        while True:
+            write = self.queue.get()
+            try:
+                self._write(write)
+            except Exception:
+                logging.getLogger("fbmr_logger").exception(
+                    f"DebugImageWriter: failed to write {write.path}"
+                )
+            finally:
+                self.queue.task_done()
+
+    def _write(self, write):
+        # type: (DebugImageWrite) -> None
+        for x, y, width, height in write.bounding_boxes:
+            cv2.rectangle(
+                write.scene_cvimg, (x, y), (x + width, y + height), (255, 0, 0)
+            )
+        Path(os.path.dirname(write.path)).mkdir(parents=True, exist_ok=True)
+        cv2.imwrite(
+            write.path,
+            write.scene_cvimg,
+            [cv2.IMWRITE_PNG_COMPRESSION, self.png_compression],
+        )
+        size = os.path.getsize(write.path)
+        with self.lock:
+            self.written += 1
+            self.written_bytes += size
+            self.byte_budget -= size
+        metrics.debug_images_written.inc()
+
+    def flush(self):
+        """Blocks until every queued image has been written."""
+        self.queue.join()
+
+    def report(self):
+        # type: () -> str
+        with self.lock:
+            dropped = ", ".join(f"{n} {reason}" for reason, n in self.dropped.items())
+            return (
+                f"debug images: {self.written} written ({self.written_bytes / (1024 * 1024):.1f} MB);"
+                f" dropped {sum(self.dropped.values())} ({dropped})"
+            )
+
+
+debug_image_writer = DebugImageWriter()
+
+
 def write_debug_image(
     scene_cvimg,
     strength,
@@ -130,16 +734,14 @@ def write_debug_image(
     debug_image_name=None,
     display_window=False,
 ):
+    """
+    Saves scene_cvimg, annotated with bounding_boxes, to the debug folder (via debug_image_writer), and/or shows it
+    in a window. scene_cvimg isn't modified.
+    """
     if debug_image_folder is None and display_window is False:
         return
 
-    source = scene_cvimg
-    for bounding_box in bounding_boxes:
-        x, y, width, height = bounding_box
-        cv2.rectangle(source, (x, y), (x + width, y + height), (255, 0, 0))
-
     if debug_image_name is None and debug_image_folder is not None:
-        template_name = template_name
         # Year Month Day DayOfWeek Time
         timestamp = datetime.datetime.now().strftime("%Y %B %d %A %I-%M-%S%p")
         global GLOBAL_INCREMENT
@@ -153,21 +755,24 @@ def write_debug_image(
         and debug_image_name
         and debug_settings.save_detect_subimage_images
     ):
-        path = Path(debug_image_folder)
-        path.mkdir(parents=True, exist_ok=True)
-
         debug_image_path = os.path.join(
             debug_image_folder,
             debug_image_name.replace(".png", " {}.png".format(str(strength)[:4])),
         )
 
-        if debug_settings.log_detect_subimage:
-            debug_settings.detect_subimages_logger(
+        queued = debug_image_writer.submit(
+            scene_cvimg, strength, bounding_boxes, debug_image_path
+        )
+        if queued and debug_settings.log_detect_subimage:
+            logging.getLogger("fbmr_logger").debug(
                 f"template_matching saving image {debug_image_path}"
             )
-        cv2.imwrite(debug_image_path, source)
 
     if display_window:
+        source = scene_cvimg.copy()
+        for bounding_box in bounding_boxes:
+            x, y, width, height = bounding_box
+            cv2.rectangle(source, (x, y), (x + width, y + height), (255, 0, 0))
         cv2.namedWindow("Source", cv2.WINDOW_AUTOSIZE)
         cv2.imshow("Source", source)
         cv2.waitKey(0)
@@ -0,0 +1,137 @@
+"""
+fingerprint_index.py
+
+narrows down which actions to score when any action in a config could be next (ie. next_action_names is empty).
+each action's `_outline` screenshot (saved by the macro recorder, as the condition's outline_path) is reduced to a 256 bit
+difference hash: the screen, shrunk to 17x16 grayscale, as whether each pixel is brighter than its right neighbour.
+the current frame is hashed the same way, and only the actions recorded on the most similar screens are scored.
+
+actions without an outline screenshot can't be ranked, so they're always candidates.
+the hashes are cached in fingerprints.json, next to config.json, and recomputed when an outline image changes.
+"""
+
+import logging
+import os
+from typing import Dict, List, Optional
+
+from PIL import Image
+
+from fbmr.utils.compiled_config import source_signature
+from fbmr.utils.lazy_import import LazyModule
+from fbmr.utils.persistent_stats import JSONFile
+
+np = LazyModule("numpy")
+
+FINGERPRINTS_FILENAME = "fingerprints.json"
+FINGERPRINT_SIZE = (17, 16)
+FINGERPRINT_BITS = (FINGERPRINT_SIZE[0] - 1) * FINGERPRINT_SIZE[1]
+# screens further apart than this (in differing bits) aren't considered similar at all
+MAX_DISTANCE = FINGERPRINT_BITS // 4
+
+
+def fingerprint(pil_image):
+    # type: (Image.Image) -> np.ndarray
+    """The screen's difference hash, as FINGERPRINT_BITS / 8 packed bytes."""
+    small = np.asarray(
+        pil_image.convert("L").resize(FINGERPRINT_SIZE, Image.BILINEAR),
+        dtype=np.int16,
+    )
+    return np.packbits(small[:, 1:] > small[:, :-1])
+
+
+def outline_path(action):
+    # type: (object) -> Optional[str]
+    """The `_outline` screenshot recorded with the action's first image condition, if there is one."""
+    conditions = list(action.conditions)
+    for condition in conditions:
+        # composite conditions' parts are looked at after the action's own conditions
+        conditions.extend(getattr(condition, "conditions", []))
+        # ImageCondition.outline_file_path
+        outline_file_path = getattr(condition, "outline_file_path", None)
+        path = outline_file_path and outline_file_path()
+        if path:
+            return path
+    return None
+
+
+class FingerprintIndex:
+    def __init__(self, action_names, fingerprints, unindexed_action_names):
+        # type: (List[str], np.ndarray, List[str]) -> None
+        self.action_names = action_names
+        # one row of packed bits per name in action_names
+        self.fingerprints = fingerprints
+        self.unindexed_action_names = unindexed_action_names
+
+    @staticmethod
+    def build(config):
+        # type: (object) -> FingerprintIndex
+        """Indexes the config's enabled actions, reusing the fingerprints in its fingerprints.json where it can."""
+        cache_path = os.path.join(config.folder_path, FINGERPRINTS_FILENAME)
+        # {outline path: {"signature": [mtime_ns, size], "fingerprint": hex}}
+        cache = JSONFile.read_json(cache_path)
+        updated_cache = {}
+        action_names = []
+        fingerprints = []
+        unindexed_action_names = []
+        for action in config.actions:
+            if not action.is_enabled:
+                continue
+            path = outline_path(action)
+            if path is None:
+                unindexed_action_names.append(action.name)
+                continue
+            signature = source_signature(path)
+            cached = cache.get(path, None)
+            if cached and cached["signature"] == signature:
+                packed = np.frombuffer(bytes.fromhex(cached["fingerprint"]), np.uint8)
+            else:
+                with Image.open(path) as outline:
+                    packed = fingerprint(outline)
+            updated_cache[path] = {
+                "signature": signature,
+                "fingerprint": packed.tobytes().hex(),
+            }
+            action_names.append(action.name)
+            fingerprints.append(packed)
+
+        if unindexed_action_names:
+            logging.getLogger("fbmr_logger").info(
+                f"FingerprintIndex: {len(unindexed_action_names)} of {len(unindexed_action_names) + len(action_names)}"
+                f" actions have no outline screenshot and are always scored: {unindexed_action_names}"
+            )
+        if updated_cache != cache:
+            try:
+                JSONFile.save_json(cache_path, updated_cache)
+            except OSError as e:
+                logging.getLogger("fbmr_logger").warning(
+                    f"FingerprintIndex: couldn't write {cache_path}; {e}"
+                )
+        packed_bytes = FINGERPRINT_BITS // 8
+        return FingerprintIndex(
+            action_names,
+            np.array(fingerprints, dtype=np.uint8).reshape(-1, packed_bytes),
+            unindexed_action_names,
+        )
+
+    def distances(self, pil_image):
+        # type: (Image.Image) -> Dict[str, int]
+        """{action name: differing bits between the frame and the action's outline screenshot}"""
+        if not self.action_names:
+            return {}
+        differing = np.unpackbits(
+            np.bitwise_xor(self.fingerprints, fingerprint(pil_image)), axis=1
+        ).sum(axis=1)
+        return dict(zip(self.action_names, differing.tolist()))
+
+    def candidates(self, pil_image, max_candidates):
+        # type: (Image.Image, int) -> List[str]
+        """
+        The actions recorded on the screens most similar to pil_image (at most max_candidates of them, nearest first),
+        followed by the actions that aren't indexed.
+        """
+        distances = self.distances(pil_image)
+        nearest = sorted(
+            (name for name, distance in distances.items() if distance <= MAX_DISTANCE),
+            key=lambda name: distances[name],
+        )
+        return nearest[:max_candidates] + self.unindexed_action_names
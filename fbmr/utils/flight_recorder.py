@@ -0,0 +1,171 @@
+"""
+flight_recorder.py
+
+keeps the last few seconds of frames, scores and decisions in memory, and saves them to the debug folder when a chain
+fails. an alternative to --debug for long runs: nothing is written unless something goes wrong.
+"""
+
+import collections
+import datetime
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+from PIL import Image
+
+from fbmr.utils.debug_settings import debug_settings
+from fbmr.utils.settings import settings
+
+
+class FlightRecord:
+    def __init__(self, timestamp, description, pil_image=None, action_scores=None):
+        # type: (float, str, Optional[Image], Optional[List[Tuple[str, float, tuple]]]) -> None
+        self.timestamp = timestamp
+        self.description = description
+        self.pil_image = pil_image
+        # (action name, score, bounding box)
+        self.action_scores = action_scores or []
+
+    @property
+    def size(self):
+        # type: () -> int
+        if self.pil_image is None:
+            return 0
+        return (
+            self.pil_image.width
+            * self.pil_image.height
+            * len(self.pil_image.getbands())
+        )
+
+
+class FlightRecorder:
+    """
+    A ring buffer of the most recent frames (with their action scores and the chosen action) and events, bounded by
+    `max_seconds` and `max_megabytes`. Frames are kept by reference; they're only encoded when dump() is called.
+
+    The Executor dumps it when a chain fails (see Executor.flight_recorder). It also dumps itself when
+    `failure_streak` frames in a row have no viable action. Dumps are at least `min_dump_interval` seconds apart.
+    """
+
+    def __init__(
+        self,
+        max_seconds=None,
+        max_megabytes=None,
+        failure_streak=None,
+        min_dump_interval=60.0,
+        folder=None,
+        annotate=None,
+    ):
+        # type: (Optional[float], Optional[float], Optional[int], float, Optional[str], Optional[Callable]) -> None
+        self.max_seconds = (
+            settings.get_debug_flight_recorder_seconds()
+            if max_seconds is None
+            else max_seconds
+        )
+        self.max_bytes = (
+            1024
+            * 1024
+            * (
+                settings.get_debug_flight_recorder_megabytes()
+                if max_megabytes is None
+                else max_megabytes
+            )
+        )
+        self.failure_streak = (
+            settings.get_debug_flight_recorder_failure_streak()
+            if failure_streak is None
+            else failure_streak
+        )
+        self.min_dump_interval = min_dump_interval
+        self.folder = folder or debug_settings.debug_folder
+        # draws (score, bounding box) pairs onto a copy of a frame; see executor.annotate_image_with_bounding_boxes
+        self.annotate = annotate
+        self.records = collections.deque()  # type: collections.deque[FlightRecord]
+        self.size = 0
+        self.consecutive_failures = 0
+        self.last_dump_time = 0.0
+        self.dumps = []  # type: List[str]
+        self.lock = threading.Lock()
+
+    def _append(self, record):
+        # type: (FlightRecord) -> None
+        with self.lock:
+            self.records.append(record)
+            self.size += record.size
+            while self.records and (
+                self.size > self.max_bytes
+                or record.timestamp - self.records[0].timestamp > self.max_seconds
+            ):
+                self.size -= self.records.popleft().size
+
+    def record_frame(self, pil_image, action_scores, chosen_action_name):
+        # type: (Image, List[Tuple[str, float, tuple]], Optional[str]) -> None
+        """Records a scored frame; `chosen_action_name` is None if no action was viable."""
+        if chosen_action_name:
+            description = f"chose {chosen_action_name}"
+        else:
+            description = "no viable action"
+        self._append(FlightRecord(time.time(), description, pil_image, action_scores))
+
+        if chosen_action_name:
+            self.consecutive_failures = 0
+            return
+        self.consecutive_failures += 1
+        if self.failure_streak and self.consecutive_failures == self.failure_streak:
+            self.dump(f"{self.failure_streak} searches in a row failed")
+
+    def record_event(self, description):
+        # type: (str) -> None
+        self._append(FlightRecord(time.time(), description))
+
+    def dump(self, reason):
+        # type: (str) -> Optional[str]
+        """Saves the buffered records into a new folder in the debug folder, and returns its path."""
+        now = time.time()
+        with self.lock:
+            if now - self.last_dump_time < self.min_dump_interval:
+                logging.getLogger("fbmr_logger").info(
+                    f"FlightRecorder: skipped dump for '{reason}'; dumped recently"
+                )
+                return None
+            self.last_dump_time = now
+            records = list(self.records)
+
+        timestamp = datetime.datetime.now().strftime("%Y %B %d %A %I-%M-%S%p")
+        slug = re.sub(r"[^\w\- ]", "", reason)[:60].strip()
+        dump_folder = os.path.join(
+            self.folder, f"{timestamp} - flight recorder - {slug}"
+        )
+        os.makedirs(dump_folder, exist_ok=True)
+
+        timeline = []
+        for i, record in enumerate(records):
+            entry = {
+                "seconds_before_dump": round(now - record.timestamp, 3),
+                "description": record.description,
+                "action_scores": [
+                    {"action": name, "score": score, "bounding_box": box}
+                    for name, score, box in record.action_scores
+                ],
+            }
+            if record.pil_image is not None:
+                image = record.pil_image
+                if self.annotate and record.action_scores:
+                    image = self.annotate(
+                        image, [(score, box) for _, score, box in record.action_scores]
+                    )
+                entry["image"] = f"{i:04d}.png"
+                image.save(os.path.join(dump_folder, entry["image"]))
+            timeline.append(entry)
+
+        with open(os.path.join(dump_folder, "timeline.json"), "w") as f:
+            json.dump({"reason": reason, "records": timeline}, f, indent=2)
+        self.dumps.append(dump_folder)
+        logging.getLogger("fbmr_logger").warning(
+            f"FlightRecorder: '{reason}'; saved the last {len(records)} records to {dump_folder}"
+        )
+        return dump_folder
@@ -0,0 +1,78 @@
+"""
+frame_scale.py
+
+with `native_resolution_capture = true` in settings.txt, frames are captured at the device's own resolution (see
+Device.screen_capture_native) instead of being resized to the config's screenshot_size on every capture.
+conditions still work in screenshot_size coordinates: they map their regions onto the frame, match templates resized
+once to the frame's scale (see TemplateCache.read_scaled), and map the boxes they find back. effects are given the
+frame resized to screenshot_size, since they run once per action instead of once per frame.
+the executor passes the config's screenshot_size to conditions and effects as utils["screenshot_size"].
+"""
+
+from typing import Optional, Tuple
+
+from PIL import Image
+
+# (frame width / screenshot width, frame height / screenshot height)
+Scale = Tuple[float, float]
+
+
+def frame_scale(pil_image, utils):
+    # type: (Image.Image, dict) -> Optional[Scale]
+    """The frame's scale relative to the config's screenshot_size, or None if it's at that size (or there isn't one)."""
+    screenshot_size = utils.get("screenshot_size", None)
+    if not screenshot_size or tuple(pil_image.size) == tuple(screenshot_size):
+        return None
+    return (
+        pil_image.size[0] / screenshot_size[0],
+        pil_image.size[1] / screenshot_size[1],
+    )
+
+
+def screen_size(pil_image, utils):
+    # type: (Image.Image, dict) -> Tuple[int, int]
+    """The size of the screen, in the coordinates conditions use."""
+    if frame_scale(pil_image, utils) is None:
+        return pil_image.size
+    return tuple(utils["screenshot_size"])
+
+
+def to_frame_point(x, y, scale, frame_size):
+    # type: (float, float, Scale, Tuple[int, int]) -> Tuple[int, int]
+    """The frame pixel at (x, y) in screenshot_size coordinates."""
+    return (
+        min(int(x * scale[0]), frame_size[0] - 1),
+        min(int(y * scale[1]), frame_size[1] - 1),
+    )
+
+
+def to_frame_region(region, scale, frame_size):
+    # type: (Tuple[int, int, int, int], Scale, Tuple[int, int]) -> Tuple[int, int, int, int]
+    """A (left, upper, right, lower) region in screenshot_size coordinates, in the frame's, kept inside the frame."""
+    left, upper, right, lower = region
+    return (
+        max(0, int(left * scale[0])),
+        max(0, int(upper * scale[1])),
+        min(frame_size[0], int(round(right * scale[0]))),
+        min(frame_size[1], int(round(lower * scale[1]))),
+    )
+
+
+def from_frame_box(box, scale):
+    # type: (Tuple[int, int, int, int], Scale) -> Tuple[int, int, int, int]
+    """An (x, y, width, height) box in the frame's coordinates, in screenshot_size coordinates."""
+    x, y, width, height = box
+    return (
+        int(round(x / scale[0])),
+        int(round(y / scale[1])),
+        int(round(width / scale[0])),
+        int(round(height / scale[1])),
+    )
+
+
+def resize_to_screenshot_size(pil_image, utils):
+    # type: (Image.Image, dict) -> Image.Image
+    """The frame as screen_capture would have returned it."""
+    if frame_scale(pil_image, utils) is None:
+        return pil_image
+    return pil_image.resize(tuple(utils["screenshot_size"]), Image.LANCZOS)
@@ -0,0 +1,55 @@
+"""
+lazy_import.py
+
+defers importing heavy modules (cv2, numpy, device backends) until they're used, so that tools which never match
+templates or open a device (listing configs, --help) start quickly.
+"""
+
+import importlib
+import threading
+
+
+class LazyModule:
+    """Stands in for a module, which is imported on first attribute access."""
+
+    def __init__(self, name):
+        # type: (str) -> None
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            module = importlib.import_module(self.__dict__["_name"])
+            self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_module"] else "not loaded"
+        return f"<lazy module '{self.__dict__['_name']}' ({state})>"
+
+
+def import_class(path):
+    # type: (str) -> type
+    """Imports "package.module.ClassName" and returns the class."""
+    module_name, class_name = path.rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def preload(*module_names):
+    # type: (str) -> threading.Thread
+    """
+    Imports modules on a background thread, eg. cv2 while a device connects. A thread that needs one of them before
+    it's done waits on the import lock, rather than importing it twice.
+    """
+
+    def run():
+        for name in module_names:
+            importlib.import_module(name)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
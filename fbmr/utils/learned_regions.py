@@ -0,0 +1,152 @@
+"""
+learned_regions.py
+
+where each template has matched so far, for templates searched without an `intended_region`.
+the executor keeps one per config (in learned_regions.json, next to config.json) when `learned_search_regions = true`
+in settings.txt, and passes it to conditions as utils["learned_regions"]. a template is then searched for in the
+(padded) box around its past matches first, and in the whole screenshot only if it isn't found there.
+"""
+
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from fbmr.utils.detect_image import pad_region
+from fbmr.utils.persistent_stats import PersistentStats
+
+LEARNED_REGIONS_FILENAME = "learned_regions.json"
+
+# (strength, (x, y, width, height)) in screenshot coordinates; `region` is the (padded) region to search, or None
+MatchFunction = Callable[
+    [Optional[Tuple[int, int, int, int]]], Tuple[float, Tuple[int, int, int, int]]
+]
+
+
+class LearnedRegions:
+    def __init__(self, save_name):
+        # type: (str) -> None
+        # {template reference: entry}, see new_entry
+        self.stats = PersistentStats(save_name, write_behind=True)
+
+    @staticmethod
+    def new_entry(screen_size):
+        # type: (Tuple[int, int]) -> dict
+        return {
+            "screen_size": list(screen_size),
+            # (left, upper, right, lower) around every match so far
+            "region": None,
+            # searches of the learned region that found the template, and that didn't
+            "hits": 0,
+            "misses": 0,
+            "region_seconds": 0.0,
+            "full_frame_searches": 0,
+            "full_frame_seconds": 0.0,
+        }
+
+    def region(self, ref, screen_size):
+        # type: (str, Tuple[int, int]) -> Optional[Tuple[int, int, int, int]]
+        """The learned region for the template, if it has been matched on screenshots of this size."""
+        entry = self.stats.get_value(ref, None)
+        if entry is None or entry["region"] is None:
+            return None
+        if tuple(entry["screen_size"]) != tuple(screen_size):
+            return None
+        return tuple(entry["region"])
+
+    def update(self, ref, screen_size, update):
+        # type: (str, Tuple[int, int], Callable[[dict], None]) -> None
+        with self.stats.lock:
+            entry = self.stats.get_value(ref, None)
+            if entry is None or tuple(entry["screen_size"]) != tuple(screen_size):
+                # new, or the device's resolution changed; start over
+                entry = LearnedRegions.new_entry(screen_size)
+            else:
+                entry = dict(entry)
+            update(entry)
+            self.stats.record_value(ref, entry)
+
+    def find(self, ref, screen_size, match, is_found):
+        # type: (str, Tuple[int, int], MatchFunction, Callable[[float], bool]) -> Tuple[float, Tuple[int, int, int, int]]
+        """
+        Matches the template in its learned region, then, if it wasn't found there, in the whole screenshot.
+        `match(region)` does the matching, and `is_found(strength)` decides whether the template is on screen.
+        """
+        region = self.region(ref, screen_size)
+        if region is not None:
+            start = time.perf_counter()
+            strength, box = match(pad_region(region, screen_size))
+            seconds = time.perf_counter() - start
+            found = is_found(strength)
+
+            def record_region_search(entry):
+                entry["hits" if found else "misses"] += 1
+                entry["region_seconds"] += seconds
+
+            self.update(ref, screen_size, record_region_search)
+            if found:
+                return strength, box
+
+        start = time.perf_counter()
+        strength, box = match(None)
+        seconds = time.perf_counter() - start
+        found = is_found(strength)
+
+        def record_full_frame_search(entry):
+            entry["full_frame_searches"] += 1
+            entry["full_frame_seconds"] += seconds
+            if found:
+                x, y, width, height = box
+                matched = [x, y, x + width, y + height]
+                if entry["region"] is None:
+                    entry["region"] = matched
+                else:
+                    entry["region"] = [
+                        min(entry["region"][0], matched[0]),
+                        min(entry["region"][1], matched[1]),
+                        max(entry["region"][2], matched[2]),
+                        max(entry["region"][3], matched[3]),
+                    ]
+
+        self.update(ref, screen_size, record_full_frame_search)
+        return strength, box
+
+    def report(self):
+        # type: () -> Dict[str, dict]
+        """{template reference: hit rate, searches, and the estimated seconds saved by searching the learned region}"""
+        report = {}
+        for ref, entry in sorted(self.stats.get_dict().items()):
+            searches = entry["hits"] + entry["misses"]
+            full_frame_mean = entry["full_frame_seconds"] / max(
+                1, entry["full_frame_searches"]
+            )
+            region_mean = entry["region_seconds"] / max(1, searches)
+            report[ref] = {
+                "region": entry["region"],
+                "searches": searches,
+                "hit_rate": entry["hits"] / searches if searches else None,
+                "full_frame_searches": entry["full_frame_searches"],
+                # every hit skipped a full frame search; every miss added a region search
+                "seconds_saved": entry["hits"] * full_frame_mean
+                - searches * region_mean,
+            }
+        return report
+
+    def close(self):
+        self.stats.close()
+
+
+_learned_regions = {}  # type: Dict[str, LearnedRegions]
+_learned_regions_lock = threading.Lock()
+
+
+def learned_regions_for(config_folder_path):
+    # type: (str) -> LearnedRegions
+    """The config's LearnedRegions; shared by every executor in the process running it."""
+    save_name = os.path.abspath(
+        os.path.join(config_folder_path, LEARNED_REGIONS_FILENAME)
+    )
+    with _learned_regions_lock:
+        if save_name not in _learned_regions:
+            _learned_regions[save_name] = LearnedRegions(save_name)
+        return _learned_regions[save_name]
@@ -0,0 +1,190 @@
+"""
+log_pipeline.py
+
+moves fbmr_logger's handlers (see logging.conf) off the calling thread.
+
+records are put on a queue by the caller and formatted/written by a listener thread, so a DEBUG record in the
+matching hot path costs an enqueue rather than a format + file write + flush. optionally, DEBUG records are sampled,
+and per-match records ("fbmr_logger.matches") go to a compact JSON-lines file instead of the text log.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+from typing import Optional
+
+FBMR_LOGGER = "fbmr_logger"
+# template match records; a child of fbmr_logger, so they go to the text log unless the JSON-lines sink is enabled
+MATCHES_LOGGER = "fbmr_logger.matches"
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    A QueueHandler that leaves formatting to the listener thread. (QueueHandler.prepare formats the message in the
+    calling thread.) Arguments are formatted later, so log immutable values rather than objects that might change.
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            # tracebacks reference live frames; render them now
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class SampledDebugFilter(logging.Filter):
+    """Passes every INFO+ record, and one in `every_nth` DEBUG records from each call site."""
+
+    def __init__(self, every_nth):
+        # type: (int) -> None
+        super(SampledDebugFilter, self).__init__()
+        self.every_nth = every_nth
+        self.counts = {}  # type: dict[tuple[str, int], int]
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.every_nth <= 1:
+            return True
+        key = (record.pathname, record.lineno)
+        with self.lock:
+            count = self.counts.get(key, 0)
+            self.counts[key] = count + 1
+        return count % self.every_nth == 0
+
+
+class JSONLinesHandler(logging.Handler):
+    """
+    Writes one compact JSON object per record: the time, the unformatted message and its arguments.
+    Much smaller (and cheaper to write) than formatted text; format `msg % args` when reading.
+    """
+
+    def __init__(self, filename):
+        # type: (str) -> None
+        super(JSONLinesHandler, self).__init__()
+        self.filename = filename
+        self.stream = open(filename, "a", encoding="utf-8")
+
+    def emit(self, record):
+        try:
+            line = json.dumps(
+                {
+                    "t": round(record.created, 4),
+                    "msg": record.msg,
+                    "args": record.args or [],
+                },
+                default=str,
+                separators=(",", ":"),
+            )
+            self.stream.write(line + "\n")
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        with self.lock:
+            self.stream.flush()
+
+    def close(self):
+        with self.lock:
+            self.stream.close()
+        super(JSONLinesHandler, self).close()
+
+
+class MatchRouter(logging.Handler):
+    """
+    Sends match records (from a "matches" child logger) to the JSON-lines handler, and everything else to the text
+    handlers.
+    """
+
+    def __init__(self, text_handlers, matches_handler):
+        # type: (list[logging.Handler], logging.Handler) -> None
+        super(MatchRouter, self).__init__()
+        self.text_handlers = text_handlers
+        self.matches_handler = matches_handler
+
+    def handle(self, record):
+        if record.name.endswith(".matches"):
+            self.matches_handler.handle(record)
+            return True
+        for handler in self.text_handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+        return True
+
+    def emit(self, record):
+        self.handle(record)
+
+    def flush(self):
+        for handler in self.text_handlers + [self.matches_handler]:
+            handler.flush()
+
+    def close(self):
+        self.matches_handler.close()
+        super(MatchRouter, self).close()
+
+
+class LogPipeline:
+    def __init__(self, logger, original_handlers, listener, queue_handler):
+        # type: (logging.Logger, list[logging.Handler], logging.handlers.QueueListener, LazyQueueHandler) -> None
+        self.logger = logger
+        self.original_handlers = original_handlers
+        self.listener = listener
+        self.queue_handler = queue_handler
+        self.stopped = False
+
+    def stop(self):
+        """Writes out queued records, stops the listener thread and gives the logger back its original handlers."""
+        if self.stopped:
+            return
+        self.stopped = True
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            try:
+                handler.flush()
+                if handler not in self.original_handlers:
+                    handler.close()
+            except (OSError, ValueError):
+                # the stream was already closed (as logging.shutdown() allows for)
+                pass
+        self.logger.removeHandler(self.queue_handler)
+        for handler in self.original_handlers:
+            self.logger.addHandler(handler)
+
+
+def start_log_pipeline(
+    debug_sample_rate=1, matches_jsonl_path=None, logger_name=FBMR_LOGGER
+):
+    # type: (int, Optional[str], str) -> LogPipeline
+    """
+    Replaces the logger's (by default, fbmr_logger's) handlers with a queue, drained by a listener thread that runs the original handlers.
+    `debug_sample_rate` > 1 keeps one in N DEBUG records per call site. With `matches_jsonl_path`, match records are
+    written there as JSON lines instead of going to the text handlers. The pipeline is stopped (and flushed) at exit.
+    """
+    logger = logging.getLogger(logger_name)
+    original_handlers = list(logger.handlers)
+    for handler in original_handlers:
+        logger.removeHandler(handler)
+
+    handlers = original_handlers
+
+    if matches_jsonl_path:
+        os.makedirs(os.path.dirname(os.path.abspath(matches_jsonl_path)), exist_ok=True)
+        matches_handler = JSONLinesHandler(matches_jsonl_path)
+        handlers = [MatchRouter(handlers, matches_handler)]
+
+    record_queue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(record_queue)
+    if debug_sample_rate > 1:
+        queue_handler.addFilter(SampledDebugFilter(debug_sample_rate))
+    logger.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(
+        record_queue, *handlers, respect_handler_level=True
+    )
+    listener.start()
+    pipeline = LogPipeline(logger, original_handlers, listener, queue_handler)
+    atexit.register(pipeline.stop)
+    return pipeline
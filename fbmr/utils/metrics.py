@@ -0,0 +1,232 @@
+"""
+metrics.py
+
+in-process counters and histograms, exported in the Prometheus text format.
+
+the instruments at the bottom of this file are updated from the capture/match/act hot paths; updating one takes a
+single uncontended lock. serving them over HTTP is optional; see MetricsRegistry.start_http_server.
+"""
+
+import bisect
+import contextlib
+import threading
+import time
+from typing import List, Optional
+
+# seconds; covers a fast template match (~1ms) through a slow adb screencap (~10s)
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        # type: (str, str) -> None
+        self.name = name
+        self.help_text = help_text
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        # type: (float) -> None
+        with self.lock:
+            self.value += amount
+
+    def render(self):
+        # type: () -> List[str]
+        return [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} counter",
+            f"{self.name} {self.value}",
+        ]
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        # type: (str, str, tuple[float, ...]) -> None
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        # per-bucket (not cumulative) counts; the last one is +Inf
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        # type: (float) -> None
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.bucket_counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextlib.contextmanager
+    def time(self):
+        """Observes the duration of the `with` block, in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def render(self):
+        # type: () -> List[str]
+        with self.lock:
+            bucket_counts = list(self.bucket_counts)
+            total, count = self.sum, self.count
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} histogram",
+        ]
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, bucket_counts):
+            cumulative += bucket_count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {count}')
+        lines.append(f"{self.name}_sum {total}")
+        lines.append(f"{self.name}_count {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}  # type: dict[str, Counter | Histogram]
+        self.lock = threading.Lock()
+        self.http_server = None  # type: Optional[ThreadingHTTPServer]
+
+    def counter(self, name, help_text):
+        # type: (str, str) -> Counter
+        return self._get_or_create(name, lambda: Counter(name, help_text))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        # type: (str, str, tuple[float, ...]) -> Histogram
+        return self._get_or_create(name, lambda: Histogram(name, help_text, buckets))
+
+    def _get_or_create(self, name, constructor):
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = constructor()
+            return self.metrics[name]
+
+    def render(self):
+        # type: () -> str
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def start_http_server(self, port, host="127.0.0.1"):
+        # type: (int, str) -> ThreadingHTTPServer
+        """Serves render() at http://host:port/metrics from a daemon thread."""
+        # only needed with --metrics_port
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+        registry = self
+
+        class MetricsRequestHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.http_server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+        self.http_server.daemon_threads = True
+        threading.Thread(target=self.http_server.serve_forever, daemon=True).start()
+        return self.http_server
+
+    def stop_http_server(self):
+        if self.http_server is not None:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+            self.http_server = None
+
+
+registry = MetricsRegistry()
+
+captures = registry.counter("fbmr_captures_total", "Screen captures.")
+capture_seconds = registry.histogram(
+    "fbmr_capture_seconds", "Time spent in Device.screen_capture."
+)
+match_template_calls = registry.counter(
+    "fbmr_match_template_total", "cv2.matchTemplate calls."
+)
+match_template_seconds = registry.histogram(
+    "fbmr_match_template_seconds", "Time spent in cv2.matchTemplate."
+)
+action_decisions = registry.counter(
+    "fbmr_action_decisions_total", "Actions chosen and applied."
+)
+action_retries = registry.counter(
+    "fbmr_action_retries_total",
+    "Actions re-applied while waiting to advance (see apply_and_wait).",
+)
+search_failures = registry.counter(
+    "fbmr_search_failures_total", "Frames on which no action was viable."
+)
+tracked_matches = registry.counter(
+    "fbmr_tracked_matches_total",
+    "Templates found near their last match, skipping the full search (see TemplateTracker).",
+)
+tracking_misses = registry.counter(
+    "fbmr_tracking_misses_total",
+    "Templates not found near their last match, so searched for again in full.",
+)
+fingerprint_lookups = registry.counter(
+    "fbmr_fingerprint_lookups_total",
+    "Frames where any action could be next, scored from the fingerprint index's candidates.",
+)
+fingerprint_fallbacks = registry.counter(
+    "fbmr_fingerprint_fallbacks_total",
+    "Fingerprint index lookups where no candidate was viable, so every action was scored.",
+)
+prefilter_checks = registry.counter(
+    "fbmr_prefilter_checks_total",
+    "Templates bounded by the match prefilter before matching (see MatchPrefilter).",
+)
+prefilter_rejections = registry.counter(
+    "fbmr_prefilter_rejections_total",
+    "Templates the match prefilter showed couldn't match, so weren't matched.",
+)
+prefilter_seconds = registry.histogram(
+    "fbmr_prefilter_seconds", "Time spent bounding templates in the match prefilter."
+)
+prefilter_match_seconds_skipped = registry.counter(
+    "fbmr_prefilter_match_seconds_skipped_total",
+    "Estimated matching time skipped by the match prefilter's rejections.",
+)
+adb_errors = registry.counter("fbmr_adb_errors_total", "adb commands that failed.")
+frame_age_seconds = registry.histogram(
+    "fbmr_frame_age_seconds",
+    "Time from a frame's capture to applying the action chosen on it.",
+)
+debug_images_written = registry.counter(
+    "fbmr_debug_images_written_total", "Debug images saved with --debug."
+)
+debug_images_dropped = registry.counter(
+    "fbmr_debug_images_dropped_total",
+    "Debug images skipped by DebugImageWriter's queue, sampling or rate limit.",
+)
@@ -1,16 +1,31 @@
+import atexit
 import io
 import json
 import os
+import signal
+import tempfile
+import threading
 import datetime
-from typing import Union, Any
+import weakref
+from typing import Union, Any, Optional
 
 
 class JSONFile:
     @staticmethod
     def save_json(filename, data):
         # type: (str, Union[dict, list]) -> None
-        with io.open(filename, "w", encoding="utf-8") as f:
-            f.write(json.dumps(data, ensure_ascii=False, sort_keys=True, indent=2))
+        # write to a temporary file and swap it in, so a crash mid-write can't leave a truncated file behind
+        directory = os.path.dirname(os.path.abspath(filename))
+        fd, temp_path = tempfile.mkstemp(
+            dir=directory, prefix=os.path.basename(filename), suffix=".tmp"
+        )
+        try:
+            with io.open(fd, "w", encoding="utf-8") as f:
+                f.write(json.dumps(data, ensure_ascii=False, sort_keys=True, indent=2))
+            os.replace(temp_path, filename)
+        except BaseException:
+            os.path.exists(temp_path) and os.remove(temp_path)
+            raise
 
     @staticmethod
     def read_json(filename):
@@ -26,28 +41,115 @@ class JSONFile:
 
 
 class PersistentStats:
-    def __init__(self, save_name):
-        # type: (str) -> PersistentStats
-        self.stats = JSONFile.read_json(save_name)
+    """
+    A dict of stats, saved as JSON.
+
+    By default, every update rewrites the file. With `write_behind`, updates are made in memory and the file is
+    rewritten from a background thread every `flush_interval` seconds, after `flush_every` updates, and when the
+    process exits. SIGTERM skips that unless the entry point calls exit_on_sigterm(). Updates never wait for the
+    file to be written: it's written from a copy of the stats, outside the lock.
+
+    With `journal` (which implies write_behind), updates are appended to `save_name + ".journal"` instead, and flushing
+    just flushes the journal; the journal is folded into the JSON file every `compact_every` updates and on close.
+    While the JSON file is rewritten, the previous journal is kept as `save_name + ".journal.old"` and new updates go
+    to a new journal. A crash loses at most the updates since the last flush, and both journals are replayed on the
+    next load. Journal entries record the stat's new value, so replaying an entry that was already compacted is
+    harmless.
+    """
+
+    def __init__(
+        self,
+        save_name,
+        write_behind=False,
+        flush_interval=5.0,
+        flush_every=100,
+        journal=False,
+        compact_every=1000,
+    ):
+        # type: (str, bool, float, int, bool, int) -> PersistentStats
         self.save_name = save_name
-        JSONFile.save_json(self.save_name, self.stats)
+        self.write_behind = write_behind or journal
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+        self.compact_every = compact_every
+        self.lock = threading.RLock()
+        # serializes writing the JSON file, so a newer copy of the stats is never overwritten by an older one
+        self.save_lock = threading.RLock()
+        self.dirty = 0
+        self.journal_entries = 0
+        self.flush_count = 0
+
+        self.stats = JSONFile.read_json(save_name)
+        self.journal_path = save_name + ".journal" if journal else None
+        self.old_journal_path = save_name + ".journal.old" if journal else None
+        self.journal_file = None  # type: Optional[io.TextIOWrapper]
+        if self.journal_path:
+            self.replay_journal()
+            JSONFile.save_json(self.save_name, self.stats)
+            self.journal_file = open(self.journal_path, "w", encoding="utf-8")
+            _remove_if_exists(self.old_journal_path)
+        else:
+            JSONFile.save_json(self.save_name, self.stats)
+
+        if self.write_behind:
+            self.stop_event = threading.Event()
+            # set by updates once flush_every (or compact_every) is reached
+            self.flush_requested = threading.Event()
+            self.flush_thread = threading.Thread(
+                target=self._flush_periodically, daemon=True
+            )
+            self.flush_thread.start()
+            _open_stats.add(self)
+            _install_exit_handlers()
+
+    def replay_journal(self):
+        # the old journal is only left behind by a crash while compacting; its entries are older
+        for path in [self.old_journal_path, self.journal_path]:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except json.JSONDecodeError:
+                            # a partially written last line
+                            break
+                        self.stats[entry["k"]] = entry["v"]
+            except FileNotFoundError:
+                pass
+
+    def _set(self, stat, value):
+        # type: (str, Any) -> None
+        with self.lock:
+            self.stats[stat] = value
+            if not self.write_behind:
+                JSONFile.save_json(self.save_name, self.stats)
+                return
+            self.dirty += 1
+            if self.journal_file:
+                self.journal_file.write(
+                    json.dumps({"k": stat, "v": value}, ensure_ascii=False) + "\n"
+                )
+                self.journal_entries += 1
+            if (
+                self.dirty >= self.flush_every
+                or self.journal_entries >= self.compact_every
+            ):
+                self.flush_requested.set()
 
     def increment(self, stat):
         # type: (str) -> None
-        self.stats[stat] = 1 + self.stats.get(stat, 0)
-        JSONFile.save_json(self.save_name, self.stats)
+        with self.lock:
+            self._set(stat, 1 + self.stats.get(stat, 0))
 
     def record_date(self, stat):
         # type: (str) -> None
         # This code formats the current date and time in the following format:
         # `dd-mm-yyyy (hh:mm:ss.sss)`
-        self.stats[stat] = datetime.datetime.now().strftime("%d-%b-%Y (%H:%M:%S.%f)")
-        JSONFile.save_json(self.save_name, self.stats)
+        self._set(stat, datetime.datetime.now().strftime("%d-%b-%Y (%H:%M:%S.%f)"))
 
     def record_value(self, stat, value):
         # type: (str, Any) -> None
-        self.stats[stat] = value
-        JSONFile.save_json(self.save_name, self.stats)
+        self._set(stat, value)
 
     def get_value(self, stat, default):
         # type: (str, Any) -> Any
@@ -56,3 +158,105 @@ class PersistentStats:
     def get_dict(self):
         # type: () -> dict
         return self.stats
+
+    def flush(self):
+        """Writes out pending updates: to the journal if there is one, otherwise by rewriting the JSON file."""
+        with self.save_lock:
+            with self.lock:
+                if self.dirty == 0:
+                    return
+                self.dirty = 0
+                self.flush_count += 1
+                if self.journal_file:
+                    self.journal_file.flush()
+                    return
+                stats = dict(self.stats)
+            JSONFile.save_json(self.save_name, stats)
+
+    def compact(self):
+        """Rewrites the JSON file and empties the journal."""
+        with self.save_lock:
+            with self.lock:
+                if not self.journal_file or self.journal_entries == 0:
+                    return self.flush()
+                stats = dict(self.stats)
+                # updates made while the JSON file is written go to a new journal
+                self.journal_file.close()
+                os.replace(self.journal_path, self.old_journal_path)
+                self.journal_file = open(self.journal_path, "w", encoding="utf-8")
+                self.dirty = 0
+                self.journal_entries = 0
+                self.flush_count += 1
+            JSONFile.save_json(self.save_name, stats)
+            os.remove(self.old_journal_path)
+
+    def _flush_periodically(self):
+        while not self.stop_event.is_set():
+            self.flush_requested.wait(self.flush_interval)
+            self.flush_requested.clear()
+            if self.stop_event.is_set():
+                return
+            if self.journal_entries >= self.compact_every:
+                self.compact()
+            else:
+                self.flush()
+
+    def close(self):
+        """Writes out pending updates and stops the background thread. Later updates are saved immediately."""
+        if not self.write_behind:
+            return
+        self.stop_event.set()
+        self.flush_requested.set()
+        with self.save_lock, self.lock:
+            self.compact()
+            if self.journal_file:
+                self.journal_file.close()
+                self.journal_file = None
+                _remove_if_exists(self.journal_path)
+            self.write_behind = False
+        _open_stats.discard(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, value, traceback):
+        self.close()
+
+
+_open_stats = weakref.WeakSet()  # type: weakref.WeakSet[PersistentStats]
+_exit_handlers_installed = False
+
+
+def _remove_if_exists(path):
+    # type: (str) -> None
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def flush_all_stats():
+    for stats in list(_open_stats):
+        stats.close()
+
+
+def _install_exit_handlers():
+    global _exit_handlers_installed
+    if _exit_handlers_installed:
+        return
+    _exit_handlers_installed = True
+    atexit.register(flush_all_stats)
+
+
+def exit_on_sigterm():
+    """
+    For entry points that own the process: SIGTERM skips atexit (and finally blocks) by default, so turn it into a
+    normal exit, unless something else is already handling it. Call from the main thread.
+    """
+    if signal.getsignal(signal.SIGTERM) != signal.SIG_DFL:
+        return
+
+    def on_sigterm(signum, frame):
+        raise SystemExit(128 + signum)
+
+    signal.signal(signal.SIGTERM, on_sigterm)
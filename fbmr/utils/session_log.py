@@ -0,0 +1,77 @@
+"""
+session_log.py
+
+structured events from the executors (chain start/end, candidate scores, decisions, effect time, cooldowns, waits,
+retries and per-template match time), one JSON object per line. unlike the debug log, these don't need to be scraped
+with regexes; see tools/latency_report.py.
+"""
+
+import atexit
+import datetime
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+from fbmr.utils.debug_settings import debug_settings
+
+
+class SessionLog:
+    """
+    Writes events to a JSON-lines file, once start() is called. Each line is an object with the time ("t"), the event
+    name ("event") and the event's fields. Until then (or after close()), event() does nothing.
+    Shared by every executor in the process; events carry the config name to tell them apart.
+    """
+
+    def __init__(self):
+        self.path = None  # type: Optional[str]
+        self.stream = None
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        # type: () -> bool
+        return self.stream is not None
+
+    def start(self, path=None):
+        # type: (Optional[str]) -> None
+        """Opens `path` (by default, a new session_*.jsonl in /logs) for appending. Does nothing if already started."""
+        with self.lock:
+            if self.stream is not None:
+                return
+            if path is None:
+                formatted_time = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+                path = os.path.join(
+                    debug_settings.log_folder, f"session_{formatted_time}.jsonl"
+                )
+            self.path = path
+            self.stream = open(path, "a", encoding="utf-8")
+
+    def event(self, event, **fields):
+        # type: (str, ...) -> None
+        if self.stream is None:
+            return
+        line = json.dumps(
+            {"t": round(time.time(), 4), "event": event, **fields},
+            default=str,
+            separators=(",", ":"),
+        )
+        with self.lock:
+            if self.stream is not None:
+                self.stream.write(line + "\n")
+
+    def flush(self):
+        with self.lock:
+            if self.stream is not None:
+                self.stream.flush()
+
+    def close(self):
+        with self.lock:
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+
+
+session_log = SessionLog()
+atexit.register(session_log.close)
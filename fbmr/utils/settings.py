@@ -38,6 +38,10 @@ class SettingsManager:
         """
         return self.get_setting(setting_name, default_value)
 
+    def get_setting_as_float(self, setting_name, default_value):
+        # type: (str, float) -> float
+        return float(self.get_setting(setting_name, default_value))
+
     def get_setting_as_seconds(self, setting_name, default_value):
         # type: (str, str) -> int
         """
@@ -64,10 +68,74 @@ class SettingsManager:
         # type: () -> int
         return self.get_setting_as_int("fbmr.action_retry_duration", 4)
 
+    def get_fbmr_wait_min_interval(self):
+        # type: () -> float
+        return self.get_setting_as_float("fbmr.wait_min_interval", 0.05)
+
+    def get_fbmr_wait_max_interval(self):
+        # type: () -> float
+        return self.get_setting_as_float("fbmr.wait_max_interval", 0.5)
+
+    def get_fbmr_speculative_scoring(self):
+        # type: () -> bool
+        return bool(self.get_setting("fbmr.speculative_scoring", False))
+
+    def get_fbmr_speculative_max_frame_age(self):
+        # type: () -> float
+        return self.get_setting_as_float("fbmr.speculative_max_frame_age", 0.25)
+
+    def get_fbmr_compiled_configs(self):
+        # type: () -> bool
+        return bool(self.get_setting("fbmr.compiled_configs", False))
+
+    def get_fbmr_learned_search_regions(self):
+        # type: () -> bool
+        return bool(self.get_setting("fbmr.learned_search_regions", False))
+
+    def get_fbmr_track_templates(self):
+        # type: () -> bool
+        return bool(self.get_setting("fbmr.track_templates", False))
+
+    def get_fbmr_fingerprint_index(self):
+        # type: () -> bool
+        return bool(self.get_setting("fbmr.fingerprint_index", False))
+
+    def get_fbmr_fingerprint_candidates(self):
+        # type: () -> int
+        return self.get_setting_as_int("fbmr.fingerprint_candidates", 8)
+
+    def get_fbmr_transition_stats(self):
+        # type: () -> bool
+        return bool(self.get_setting("fbmr.transition_stats", False))
+
+    def get_fbmr_strict_scoring(self):
+        # type: () -> bool
+        return bool(self.get_setting("fbmr.strict_scoring", True))
+
+    def get_fbmr_early_stop_margin(self):
+        # type: () -> float
+        return self.get_setting_as_float("fbmr.early_stop_margin", 30)
+
+    def get_fbmr_batch_matching(self):
+        # type: () -> bool
+        return bool(self.get_setting("fbmr.batch_matching", False))
+
+    def get_fbmr_match_prefilter(self):
+        # type: () -> bool
+        return bool(self.get_setting("fbmr.match_prefilter", False))
+
+    def get_fbmr_native_resolution_capture(self):
+        # type: () -> bool
+        return bool(self.get_setting("fbmr.native_resolution_capture", False))
+
     def get_macrorecorder_click_image_size(self):
         # type: () -> list[int, int]
         return self.get_setting("MacroRecorder.click_image_size", [50, 50])
 
+    def get_macrorecorder_save_templates_to_store(self):
+        # type: () -> bool
+        return bool(self.get_setting("MacroRecorder.save_templates_to_store", False))
+
     def get_scrcpydevice_capture_fps(self):
         # type: () -> int
         return self.get_setting_as_int("ScrcpyDevice.capture_fps", 10)
@@ -88,6 +156,64 @@ class SettingsManager:
             "DebugSettings.debug_log_expire_time", "7 days"
         )
 
+    def get_debug_image_queue_size(self):
+        # type: () -> int
+        return self.get_setting_as_int("DebugSettings.debug_image_queue_size", 32)
+
+    def get_debug_image_every_nth(self):
+        # type: () -> int
+        return self.get_setting_as_int("DebugSettings.debug_image_every_nth", 1)
+
+    def get_debug_image_failures_only(self):
+        # type: () -> bool
+        return bool(self.get_setting("DebugSettings.debug_image_failures_only", False))
+
+    def get_debug_image_failure_strength(self):
+        # type: () -> float
+        return self.get_setting_as_float(
+            "DebugSettings.debug_image_failure_strength", 0.8
+        )
+
+    def get_debug_image_max_mb_per_second(self):
+        # type: () -> float
+        return self.get_setting_as_float(
+            "DebugSettings.debug_image_max_mb_per_second", 0
+        )
+
+    def get_debug_flight_recorder(self):
+        # type: () -> bool
+        return bool(self.get_setting("DebugSettings.flight_recorder", False))
+
+    def get_debug_flight_recorder_seconds(self):
+        # type: () -> float
+        return self.get_setting_as_float("DebugSettings.flight_recorder_seconds", 30)
+
+    def get_debug_flight_recorder_megabytes(self):
+        # type: () -> float
+        return self.get_setting_as_float("DebugSettings.flight_recorder_megabytes", 100)
+
+    def get_debug_flight_recorder_failure_streak(self):
+        # type: () -> int
+        return self.get_setting_as_int(
+            "DebugSettings.flight_recorder_failure_streak", 20
+        )
+
+    def get_debug_async_logging(self):
+        # type: () -> bool
+        return bool(self.get_setting("DebugSettings.async_logging", False))
+
+    def get_debug_log_debug_sample_rate(self):
+        # type: () -> int
+        return self.get_setting_as_int("DebugSettings.log_debug_sample_rate", 1)
+
+    def get_debug_log_matches_as_jsonl(self):
+        # type: () -> bool
+        return bool(self.get_setting("DebugSettings.log_matches_as_jsonl", False))
+
+    def get_debug_session_log(self):
+        # type: () -> bool
+        return bool(self.get_setting("DebugSettings.session_log", False))
+
 
 settings = SettingsManager(DEFAULT_SETTINGS)
 settings.load_settings()
@@ -0,0 +1,102 @@
+"""
+template_store.py
+
+a content-addressed store for template images, shared by every config under a configs root:
+    configs/_store/<first 2 characters of the hash>/<hash>.png
+a config refers to a stored image as "store:<hash>" wherever it'd otherwise have a file name (eg. `image_path`).
+the hash is of the decoded pixels (plus the mode and size), so the same crop saved twice, or re-encoded, is stored once;
+and since every config resolves it to the same path, it's also decoded and cached (see template_cache) once.
+
+files in the store are never modified once written. to move existing configs over, see `python -m tools.migrate_to_store`.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+from PIL import Image
+
+STORE_PREFIX = "store:"
+STORE_FOLDER = "_store"
+DEFAULT_CONFIGS_ROOT = "configs"
+# hex characters of the sha256 kept in a reference; 128 bits
+HASH_LENGTH = 32
+
+
+def is_store_ref(path):
+    # type: (str) -> bool
+    return isinstance(path, str) and path.startswith(STORE_PREFIX)
+
+
+def store_folder(configs_root=DEFAULT_CONFIGS_ROOT):
+    # type: (str) -> str
+    return os.path.join(configs_root, STORE_FOLDER)
+
+
+def configs_root_of(config_folder_path):
+    # type: (Optional[str]) -> str
+    """The configs root a config folder (configs/<name>) is in."""
+    if not config_folder_path:
+        return DEFAULT_CONFIGS_ROOT
+    return os.path.dirname(os.path.normpath(config_folder_path))
+
+
+def image_hash(pil_image):
+    # type: (Image.Image) -> str
+    digest = hashlib.sha256()
+    digest.update(
+        f"{pil_image.mode} {pil_image.size[0]}x{pil_image.size[1]}\n".encode("ascii")
+    )
+    digest.update(pil_image.tobytes())
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def resolve(ref, configs_root=DEFAULT_CONFIGS_ROOT):
+    # type: (str, str) -> str
+    """The path of the file a "store:<hash>" reference points to."""
+    image_hash_ = ref[len(STORE_PREFIX) :]
+    return os.path.join(
+        store_folder(configs_root), image_hash_[:2], image_hash_ + ".png"
+    )
+
+
+def _write_atomically(path, write):
+    # readers either see the whole file or no file; two processes storing the same image both end up with a complete one
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.path.exists(tmp_path) and os.unlink(tmp_path)
+        raise
+
+
+def put_file(path, configs_root=DEFAULT_CONFIGS_ROOT):
+    # type: (str, str) -> str
+    """Adds the image at `path` to the store (as is, if it's a PNG) and returns its reference."""
+    with Image.open(path) as image:
+        ref = STORE_PREFIX + image_hash(image)
+        stored_path = resolve(ref, configs_root)
+        if os.path.exists(stored_path):
+            return ref
+        if image.format == "PNG":
+            with open(path, "rb") as source:
+                _write_atomically(stored_path, lambda f: shutil.copyfileobj(source, f))
+        else:
+            _write_atomically(stored_path, lambda f: image.save(f, format="PNG"))
+    return ref
+
+
+def put_image(pil_image, configs_root=DEFAULT_CONFIGS_ROOT):
+    # type: (Image.Image, str) -> str
+    """Adds `pil_image` to the store and returns its reference."""
+    ref = STORE_PREFIX + image_hash(pil_image)
+    stored_path = resolve(ref, configs_root)
+    if not os.path.exists(stored_path):
+        _write_atomically(stored_path, lambda f: pil_image.save(f, format="PNG"))
+    return ref
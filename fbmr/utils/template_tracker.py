@@ -0,0 +1,95 @@
+"""
+template_tracker.py
+
+remembers where each condition's template last matched, so the next frame can be searched in a small window around it
+before the condition's usual region. when the template hasn't moved (eg. while an advance_if_condition is polled, or a
+chain revisits a screen), this matches a few template sizes of pixels instead of the whole region.
+
+matchTemplate scores each position using only the pixels under the template, so when the best match is inside the
+window, its score and box are the same as a full search's.
+the executor keeps one tracker per device and passes it to conditions as utils["template_tracker"], when
+`track_templates = true` in settings.txt.
+"""
+
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+from fbmr.utils import metrics
+
+# (strength, (x, y, width, height)) in screenshot coordinates; `region` is the region to search, or None for all of it
+MatchFunction = Callable[
+    [Optional[Tuple[int, int, int, int]]], Tuple[float, Tuple[int, int, int, int]]
+]
+
+# how far the window extends past the last match, on each side, in multiples of the template's size
+WINDOW_MARGIN = 1.0
+
+
+def window_around(box, screen_size, bounds=None, margin=WINDOW_MARGIN):
+    # type: (Tuple[int, int, int, int], Tuple[int, int], Optional[Tuple[int, int, int, int]], float) -> Tuple[int, int, int, int]
+    """The (left, upper, right, lower) window around an (x, y, width, height) box, kept inside `bounds`."""
+    x, y, width, height = box
+    left, upper, right, lower = bounds or (0, 0, screen_size[0], screen_size[1])
+    return (
+        int(max(left, x - margin * width)),
+        int(max(upper, y - margin * height)),
+        int(min(right, x + width + margin * width)),
+        int(min(lower, y + height + margin * height)),
+    )
+
+
+class TemplateTracker:
+    def __init__(self, margin=WINDOW_MARGIN):
+        # type: (float) -> None
+        self.margin = margin
+        # {condition: (screen size, (x, y, width, height))}
+        self.last_boxes = {}  # type: Dict[object, tuple]
+        self.lock = threading.Lock()
+        # local searches that found the template, and that had to fall back to the usual search
+        self.hits = 0
+        self.misses = 0
+
+    def find(self, key, screen_size, bounds, match, is_found):
+        # type: (object, Tuple[int, int], Optional[Tuple[int, int, int, int]], MatchFunction, Callable[[float], bool]) -> Optional[Tuple[float, Tuple[int, int, int, int]]]
+        """
+        Matches in the window around `key`'s last match. Returns the result if `is_found(strength)`, and None (so the
+        caller does its usual search, and reports it with `update`) if it isn't, or there's no last match.
+        `bounds` is the region the usual search covers (None for the whole screenshot); the window stays inside it.
+        """
+        with self.lock:
+            last = self.last_boxes.get(key, None)
+        if last is None or last[0] != tuple(screen_size):
+            return None
+        window = window_around(last[1], screen_size, bounds, self.margin)
+        strength, box = match(window)
+        found = is_found(strength)
+        with self.lock:
+            if found:
+                self.hits += 1
+                self.last_boxes[key] = (tuple(screen_size), box)
+            else:
+                self.misses += 1
+        if found:
+            metrics.tracked_matches.inc()
+            return strength, box
+        metrics.tracking_misses.inc()
+        return None
+
+    def is_tracking(self, key):
+        # type: (object) -> bool
+        """Whether `key`'s next search starts in the window around its last match."""
+        with self.lock:
+            return key in self.last_boxes
+
+    def update(self, key, screen_size, box, found):
+        # type: (object, Tuple[int, int], Tuple[int, int, int, int], bool) -> None
+        """Records the result of the usual search."""
+        with self.lock:
+            if found:
+                self.last_boxes[key] = (tuple(screen_size), box)
+            else:
+                self.last_boxes.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.last_boxes = {}
@@ -0,0 +1,62 @@
+"""
+transition_stats.py
+
+how often each action has followed each other action in a config, kept across runs in transitions.json (next to
+config.json) when `transition_stats = true` in settings.txt.
+the executor scores candidates in order of how often they've followed the previous action; with
+`strict_scoring = false`, it stops at the first one that's viable by a margin, instead of scoring them all.
+"""
+
+import os
+import threading
+from typing import Dict, List, Optional
+
+from fbmr.utils.persistent_stats import PersistentStats
+
+TRANSITIONS_FILENAME = "transitions.json"
+# the "previous action" for the first action the executor applies
+START = ""
+
+
+class TransitionStats:
+    def __init__(self, save_name):
+        # type: (str) -> None
+        # {previous action: {next action: count}}
+        self.stats = PersistentStats(save_name, write_behind=True)
+
+    def record(self, previous_action_name, action_name):
+        # type: (Optional[str], str) -> None
+        previous_action_name = previous_action_name or START
+        with self.stats.lock:
+            counts = dict(self.stats.get_value(previous_action_name, {}))
+            counts[action_name] = counts.get(action_name, 0) + 1
+            self.stats.record_value(previous_action_name, counts)
+
+    def counts(self, previous_action_name):
+        # type: (Optional[str]) -> Dict[str, int]
+        return self.stats.get_value(previous_action_name or START, {})
+
+    def order(self, previous_action_name, action_names):
+        # type: (Optional[str], List[str]) -> List[str]
+        """action_names, most frequent after previous_action_name first; ties (and unseen actions) keep their order."""
+        counts = self.counts(previous_action_name)
+        if not counts:
+            return list(action_names)
+        return sorted(action_names, key=lambda name: -counts.get(name, 0))
+
+    def close(self):
+        self.stats.close()
+
+
+_transition_stats = {}  # type: Dict[str, TransitionStats]
+_transition_stats_lock = threading.Lock()
+
+
+def transition_stats_for(config_folder_path):
+    # type: (str) -> TransitionStats
+    """The config's TransitionStats; shared by every executor in the process running it."""
+    save_name = os.path.abspath(os.path.join(config_folder_path, TRANSITIONS_FILENAME))
+    with _transition_stats_lock:
+        if save_name not in _transition_stats:
+            _transition_stats[save_name] = TransitionStats(save_name)
+        return _transition_stats[save_name]
@@ -0,0 +1,80 @@
+import os
+import shutil
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from fbmr.conditions import SubimageCondition
+from fbmr.config import Config, Action
+from fbmr.effects import ClickSubimageEffect
+
+TESTDATA_COND = "tests/test_data_conditions/"
+# the part of contained.png around the button; matching in it is fast
+BUTTON_REGION = (603, 914, 603 + 503, 914 + 346)
+
+
+def nuke_test_folder(folder):
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    Path(folder).mkdir(parents=True, exist_ok=True)
+
+
+class MockDevice(object):
+    def __init__(self, image_path, crop=None, capture_delay=0.0):
+        self.image = Image.open(image_path).convert("RGB")
+        if crop:
+            self.image = self.image.crop(crop)
+        self.image.load()
+        self.capture_delay = capture_delay
+        self.capture_times = []
+        self.clicks = []
+        self.closed = False
+
+    def screen_capture(self):
+        self.capture_times.append(time.time())
+        if self.capture_delay:
+            time.sleep(self.capture_delay)
+        return self.image
+
+    def click(self, x, y):
+        self.clicks.append((x, y))
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, value, traceback):
+        self.close()
+
+
+def write_loop_config(configs_root, name, cooldown=0.0):
+    """Writes a config with a two action loop, 'first' -> 'second' -> 'first', that clicks the button."""
+    config = Config(configs_root, name, create_if_missing=True)
+    shutil.copyfile(TESTDATA_COND + "button.png", config.folder_path + "/button.png")
+    for action_name, next_action_names in [
+        ("first", ["second"]),
+        ("second", ["first"]),
+    ]:
+        action = Action(
+            action_name,
+            [SubimageCondition("button.png", None, 80)],
+            [ClickSubimageEffect("button.png", None, None)],
+            True,
+            next_action_names,
+            cooldown,
+            None,
+            config.folder_path,
+        )
+        action.set_folder_path(config.folder_path)
+        config.add_action(action)
+    return config
+
+
+def wait_for(predicate, timeout=5.0):
+    start = time.time()
+    while not predicate():
+        assert time.time() - start < timeout
+        time.sleep(0.01)
@@ -1,6 +1,21 @@
 from PIL import Image
 
-from fbmr.conditions import SubimageCondition, NotSubimageCondition
+from fbmr.conditions import (
+    AllOf,
+    AnyOf,
+    Not,
+    SubimageCondition,
+    NotSubimageCondition,
+    PixelProbeCondition,
+    RegionHashCondition,
+    leaf_conditions,
+    load_condition,
+)
+from fbmr.editor import pixel_probe_condition_json, region_hash_condition_json
+from fbmr.utils.detect_image import match_prefilter, pad_region
+from fbmr.utils.frame_scale import frame_scale
+from fbmr.utils.learned_regions import LearnedRegions
+from fbmr.utils.template_tracker import TemplateTracker, window_around
 
 TESTDATA_ROOT = "tests/test_data_conditions/"
 
@@ -131,3 +146,226 @@ def test_not_subimage_condition():
         condition2.is_valid(Image.open(TESTDATA_ROOT + "contained.png"), state_dict, {})
         != 0
     )
+
+
+def test_learned_search_region(tmp_path):
+    learned_regions = LearnedRegions(str(tmp_path / "learned_regions.json"))
+    utils = {"learned_regions": learned_regions}
+    condition = SubimageCondition(TESTDATA_ROOT + "button.png", None, 80)
+    contained = Image.open(TESTDATA_ROOT + "contained.png")
+    not_contained = Image.open(TESTDATA_ROOT + "not_contained.png")
+
+    # the first match is a full frame search, and sets the region
+    state_dict = {}
+    condition.save_region_as = "button"
+    assert condition.is_valid(contained, state_dict, utils) > 80
+    full_frame_box = state_dict["button"]
+    region = learned_regions.region(condition.image_path, contained.size)
+    assert region is not None
+    assert (region[2] - region[0]) * (region[3] - region[1]) < 0.1 * (
+        contained.size[0] * contained.size[1]
+    )
+
+    # later ones search the region, and find the same box
+    assert condition.is_valid(contained, state_dict, utils) > 80
+    assert state_dict["button"] == full_frame_box
+    # misses fall back to the full frame
+    assert condition.is_valid(not_contained, {}, utils) == 0
+    (stats,) = learned_regions.report().values()
+    assert stats["searches"] == 2
+    assert stats["hit_rate"] == 0.5
+    assert stats["full_frame_searches"] == 2
+
+    # NotSubimageCondition only passes when the full frame search doesn't find it either
+    not_condition = NotSubimageCondition(TESTDATA_ROOT + "button.png", None, 80)
+    assert not_condition.is_valid(contained, {}, utils) == 0
+    assert not_condition.is_valid(not_contained, {}, utils) > 0
+
+    learned_regions.close()
+    reloaded = LearnedRegions(str(tmp_path / "learned_regions.json"))
+    assert reloaded.region(condition.image_path, contained.size) == region
+    assert reloaded.region(condition.image_path, (100, 100)) is None
+
+
+def test_template_tracking():
+    tracker = TemplateTracker()
+    utils = {"template_tracker": tracker}
+    condition = SubimageCondition(
+        TESTDATA_ROOT + "button.png", None, 80, save_region_as="button"
+    )
+    contained = Image.open(TESTDATA_ROOT + "contained.png").convert("RGB")
+
+    full_state = {}
+    full_score = condition.is_valid(contained, full_state, {})
+    state = {}
+    assert condition.is_valid(contained, state, utils) == full_score
+    assert tracker.hits == 0
+    # tracked: same score and box as a full search
+    assert condition.is_valid(contained, state, utils) == full_score
+    assert state["button"] == full_state["button"]
+    assert tracker.hits == 1
+
+    # when it moves out of the window, it's found by the full search
+    moved = Image.new("RGB", contained.size)
+    moved.paste(contained.crop((0, 0, 1500, 1200)), (300, 0))
+    moved_state = {}
+    assert condition.is_valid(moved, moved_state, utils) == condition.is_valid(
+        moved, {}, {}
+    )
+    assert tracker.misses == 1
+    x, y, _w, _h = moved_state["button"]
+    assert (x, y) == (full_state["button"][0] + 300, full_state["button"][1])
+
+    # the window stays inside the intended region
+    assert window_around((10, 10, 20, 20), (100, 100), (5, 5, 40, 40)) == (
+        5,
+        5,
+        40,
+        40,
+    )
+
+
+def test_match_prefilter():
+    button_region = [721, 1026, 929, 1084]
+    condition = SubimageCondition(TESTDATA_ROOT + "button.png", button_region, 80)
+    contained = Image.open(TESTDATA_ROOT + "contained.png")
+    not_contained = Image.open(TESTDATA_ROOT + "not_contained.png")
+    utils = {"match_prefilter": True}
+
+    # the same results as matching; only the match on the wrong screen is skipped
+    checks, rejections = match_prefilter.checks, match_prefilter.rejections
+    assert condition.find_valid_rect(contained, {}, utils) == condition.find_valid_rect(
+        contained, {}, {}
+    )
+    assert match_prefilter.rejections == rejections
+    assert condition.is_valid(not_contained, {}, utils) == 0
+    assert match_prefilter.checks == checks + 2
+    assert match_prefilter.rejections == rejections + 1
+
+    # a NotSubimageCondition's result depends on the strength of a failed match, so it's always matched
+    not_condition = NotSubimageCondition(
+        TESTDATA_ROOT + "button.png", button_region, 80
+    )
+    assert not_condition.is_valid(not_contained, {}, utils) == not_condition.is_valid(
+        not_contained, {}, {}
+    )
+    assert match_prefilter.checks == checks + 2
+
+
+def test_pixel_probe_condition():
+    contained = Image.open(TESTDATA_ROOT + "contained.png").convert("RGB")
+    not_contained = Image.open(TESTDATA_ROOT + "not_contained.png").convert("RGB")
+    condition_json = pixel_probe_condition_json(contained, [[800, 1050], [750, 1040]])
+    condition = load_condition(condition_json, TESTDATA_ROOT)
+    assert isinstance(condition, PixelProbeCondition)
+    assert condition.make_json() == condition_json
+
+    assert condition.find_valid_rect(contained, {}, {}) == (100, (750, 1040, 51, 11))
+    assert condition.is_valid(not_contained, {}, {}) == 0
+    # within the threshold's tolerance of each channel
+    shifted = contained.point(lambda v: min(255, v + 10))
+    assert condition.is_valid(shifted, {}, {}) > 94
+
+
+def test_region_hash_condition():
+    contained = Image.open(TESTDATA_ROOT + "contained.png").convert("RGB")
+    not_contained = Image.open(TESTDATA_ROOT + "not_contained.png").convert("RGB")
+    condition_json = region_hash_condition_json(contained, [721, 1026, 929, 1084])
+    condition = load_condition(condition_json, TESTDATA_ROOT)
+    assert isinstance(condition, RegionHashCondition)
+    assert condition.make_json() == condition_json
+
+    assert condition.find_valid_rect(contained, {}, {}) == (100, (721, 1026, 208, 58))
+    assert condition.is_valid(not_contained, {}, {}) == 0
+    # small changes in brightness and scale don't matter
+    brighter = contained.point(lambda v: min(255, v + 20))
+    assert condition.is_valid(brighter, {}, {}) > 90
+    rescaled = contained.resize((675, 899)).resize(contained.size)
+    assert condition.is_valid(rescaled, {}, {}) > 90
+
+
+def test_composite_conditions():
+    contained = Image.open(TESTDATA_ROOT + "contained.png").convert("RGB")
+    not_contained = Image.open(TESTDATA_ROOT + "not_contained.png").convert("RGB")
+    probe_json = pixel_probe_condition_json(contained, [[800, 1050], [750, 1040]])
+    button_json = SubimageCondition(
+        "button.png", None, 80, 1.0, save_region_as="button"
+    ).make_json()
+
+    # test jsonification, nested
+    condition_json = {
+        "type": "AnyOf",
+        "conditions": [
+            button_json,
+            {"type": "AllOf", "conditions": [{"type": "Not", "condition": probe_json}]},
+        ],
+    }
+    condition = load_condition(condition_json, TESTDATA_ROOT)
+    assert condition.make_json() == condition_json
+    button, probe = leaf_conditions([condition])
+    assert button.adjust_file_path(button.image_path) == TESTDATA_ROOT + "button.png"
+    assert isinstance(probe, PixelProbeCondition)
+
+    # the cheap probe is checked first; the template is only matched if the result isn't decided yet
+    state_dict = {}
+    assert AnyOf([button, probe]).is_valid(contained, state_dict, {}) == 100
+    assert "button" not in state_dict
+    assert AllOf([button, Not(probe)]).is_valid(contained, state_dict, {}) == 0
+    assert "button" not in state_dict
+    validity = AllOf([button, probe]).is_valid(contained, state_dict, {})
+    assert validity == button.is_valid(contained, {}, {}) > 80
+    assert "button" in state_dict
+
+    assert AnyOf([button, probe]).is_valid(not_contained, {}, {}) == 0
+    assert Not(AnyOf([button, probe])).is_valid(not_contained, {}, {}) == 100
+    assert Not(button).is_valid(contained, {}, {}) == 0
+
+
+def test_native_resolution_matching():
+    # frames captured at the device's resolution, matched with resized templates, should score as they would have
+    # if they'd been resized to the config's screenshot_size
+    button_path = TESTDATA_ROOT + "button.png"
+    button_region = (721, 1026, 929, 1084)
+    contained = Image.open(TESTDATA_ROOT + "contained.png").convert("RGB")
+    conditions = [
+        SubimageCondition(button_path, None, 80),
+        SubimageCondition(button_path, list(button_region), 80),
+        load_condition(
+            pixel_probe_condition_json(contained, [[800, 1050], [750, 1040]]),
+            TESTDATA_ROOT,
+        ),
+        load_condition(
+            region_hash_condition_json(contained, list(button_region)), TESTDATA_ROOT
+        ),
+    ]
+    for name in ("contained.png", "not_contained.png"):
+        screenshot = Image.open(TESTDATA_ROOT + name).convert("RGB")
+        utils = {"screenshot_size": screenshot.size}
+        for scale in (0.75, 1.5):
+            native = screenshot.resize(
+                (round(screenshot.width * scale), round(screenshot.height * scale)),
+                Image.LANCZOS,
+            )
+            resized = native.resize(screenshot.size, Image.LANCZOS)
+            assert frame_scale(native, utils) == (
+                native.width / screenshot.width,
+                native.height / screenshot.height,
+            )
+            assert frame_scale(resized, utils) is None
+
+            for condition in conditions:
+                validity, rect = condition.find_valid_rect(resized, {}, {})
+                native_validity, native_rect = condition.find_valid_rect(
+                    native, {}, utils
+                )
+                assert abs(native_validity - validity) < 2
+                if validity > 0:
+                    assert all(abs(a - b) <= 2 for a, b in zip(rect, native_rect))
+
+            # including how weak failed matches are, which NotSubimageConditions depend on
+            for region in (None, pad_region(button_region, screenshot.size)):
+                strength, _box = conditions[0].match(button_path, resized, region)
+                native_strength, _box = conditions[0].match(
+                    button_path, native, region, None, frame_scale(native, utils)
+                )
+                assert abs(native_strength - strength) < 0.02
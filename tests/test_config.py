@@ -4,9 +4,16 @@ import shutil
 from pathlib import Path
 import pytest
 
+import cv2
+import numpy as np
+from PIL import Image
+
 from fbmr.conditions import SubimageCondition
 from fbmr.config import Config, Action
 from fbmr.effects import ClickSubimageEffect
+from fbmr.utils.compiled_config import CompiledConfig
+from fbmr.utils.detect_image import template_cache
+from fbmr.utils.settings import settings
 
 TESTDATA_COND = "tests/test_data_conditions/"
 TESTDATA_CONFIG = "tests/test_data_config/"
@@ -115,3 +122,57 @@ def test_create2(setup_and_teardown):
     assert len(config2.make_json()["actions"]) == 2
     action_names = sorted([aj["name"] for aj in config2.make_json()["actions"]])
     assert action_names == ["action1", "action2"]
+
+
+def test_compiled_config(setup_and_teardown, monkeypatch):
+    monkeypatch.setattr(settings, "get_fbmr_compiled_configs", lambda: True)
+    config = Config(TESTDATA_CONFIG, "compiled", create_if_missing=True)
+    image_path = os.path.join(config.folder_path, "button.png")
+    shutil.copy(TESTDATA_COND + "button.png", image_path)
+    action = Action(
+        "find",
+        [SubimageCondition("button.png", None, 80)],
+        [],
+        True,
+        [],
+        0,
+        None,
+        config.folder_path,
+    )
+    action.set_folder_path(config.folder_path)
+    config.add_action(action)
+
+    # the first load compiles it
+    Config(TESTDATA_CONFIG, "compiled")
+    compiled = CompiledConfig.open(config.compiled_path)
+    decoded = cv2.imread(image_path)
+    assert np.array_equal(compiled.templates["button.png"], decoded)
+
+    # later loads don't parse config.json or decode the images
+    def fail(*args, **kwargs):
+        raise AssertionError("config.json was parsed")
+
+    template_cache.clear()
+    with monkeypatch.context() as m:
+        m.setattr(pyjson5, "load", fail)
+        loaded = Config(TESTDATA_CONFIG, "compiled")
+    assert loaded.make_json() == config.make_json()
+    cached = template_cache.templates[image_path][1]
+    assert not cached.flags.writeable
+    scene = Image.open(TESTDATA_COND + "contained.png")
+    assert loaded.get_action("find").is_valid(scene, {}, {}) > 80
+    assert template_cache.templates[image_path][1] is cached
+
+    # it's rebuilt when an image changes, or if it's unreadable
+    stat = os.stat(image_path)
+    os.utime(image_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    Config(TESTDATA_CONFIG, "compiled")
+    compiled = CompiledConfig.open(config.compiled_path)
+    assert not compiled.is_stale("button.png", image_path)
+
+    # (replaced rather than overwritten, as overwriting a mapped file in place invalidates the mapping)
+    os.remove(config.compiled_path)
+    with open(config.compiled_path, "wb") as f:
+        f.write(b"garbage")
+    assert Config(TESTDATA_CONFIG, "compiled").make_json() == config.make_json()
+    assert CompiledConfig.open(config.compiled_path) is not None
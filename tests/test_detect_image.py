@@ -0,0 +1,131 @@
+import os
+
+import cv2
+import numpy as np
+
+from fbmr.utils.detect_image import (
+    DebugImageWriter,
+    SceneMatcher,
+    TemplateBlocks,
+    find_location_cv,
+    find_locations_cv,
+    ncc_upper_bound,
+)
+
+BOX = (10, 10, 20, 20)
+
+
+def scene():
+    return np.zeros((100, 100, 3), dtype=np.uint8)
+
+
+def test_debug_image_writer(tmp_path):
+    writer = DebugImageWriter(
+        queue_size=10, every_nth=1, failures_only=False, max_mb_per_second=0
+    )
+    image = scene()
+    path = str(tmp_path / "match.png")
+    assert writer.submit(image, 0.9, [BOX], path)
+    writer.flush()
+
+    # the caller's image isn't drawn on
+    assert not image.any()
+    written = cv2.imread(path)
+    assert tuple(written[10, 10]) == (255, 0, 0)
+    assert writer.written == 1
+    assert "1 written" in writer.report()
+
+
+def test_debug_image_writer_policies(tmp_path):
+    sampled = DebugImageWriter(queue_size=10, every_nth=3, failures_only=False)
+    results = [
+        sampled.submit(scene(), 0.9, [BOX], str(tmp_path / f"sampled_{i}.png"))
+        for i in range(6)
+    ]
+    sampled.flush()
+    assert results == [True, False, False, True, False, False]
+    assert sampled.dropped["sampled"] == 4
+
+    failures = DebugImageWriter(
+        queue_size=10, every_nth=1, failures_only=True, failure_strength=0.8
+    )
+    assert not failures.submit(scene(), 0.95, [BOX], str(tmp_path / "success.png"))
+    assert failures.submit(scene(), 0.5, [BOX], str(tmp_path / "failure.png"))
+    failures.flush()
+    assert failures.dropped["succeeded"] == 1
+    assert not os.path.exists(tmp_path / "success.png")
+
+    # the budget starts at one second's worth; once it's spent, images are dropped until it refills
+    limited = DebugImageWriter(
+        queue_size=10, every_nth=1, failures_only=False, max_mb_per_second=0.000001
+    )
+    assert limited.submit(scene(), 0.5, [BOX], str(tmp_path / "limited_1.png"))
+    limited.flush()
+    assert not limited.submit(scene(), 0.5, [BOX], str(tmp_path / "limited_2.png"))
+    assert limited.dropped["rate_limited"] == 1
+
+
+def test_debug_image_writer_drops_when_full(tmp_path):
+    writer = DebugImageWriter(queue_size=1, every_nth=1, failures_only=False)
+    # the thread isn't started until the first successful submit, so nothing drains the queue here
+    writer.queue.put_nowait(None)
+    assert not writer.submit(scene(), 0.5, [BOX], str(tmp_path / "dropped.png"))
+    assert writer.dropped["queue_full"] == 1
+
+
+def test_find_locations_cv():
+    screenshot = cv2.imread("tests/test_data_conditions/contained.png")
+    button = cv2.imread("tests/test_data_conditions/button.png")
+    scene_cvimg = screenshot[914:1260, 603:1106]
+    rng = np.random.default_rng(0)
+    templates = [
+        button,
+        scene_cvimg[100:150, 200:250].copy(),
+        rng.integers(0, 255, (50, 50, 3), dtype=np.uint8),
+        np.full((50, 50, 3), 128, dtype=np.uint8),
+    ]
+    batched = find_locations_cv(templates, scene_cvimg)
+    for template, (strength, box) in zip(templates, batched):
+        expected_strength, expected_box = find_location_cv(template, scene_cvimg)
+        assert box == expected_box
+        assert abs(strength - expected_strength) < 1e-3
+
+    # the scene's spectra are computed once, and the normalization once per template size
+    matcher = SceneMatcher(scene_cvimg)
+    matcher.match(templates[1])
+    spectra = matcher.scene_spectra
+    matcher.match(templates[2])
+    assert matcher.scene_spectra is spectra
+    assert list(matcher.window_norms) == [(50, 50)]
+
+
+def test_ncc_upper_bound():
+    screenshot = cv2.imread("tests/test_data_conditions/contained.png")
+    gradient = cv2.imread("tests/test_data_conditions/not_contained.png")
+    rng = np.random.default_rng(0)
+    rejected = 0
+    for i in range(60):
+        source = screenshot if i % 2 else gradient
+        height, width = rng.integers(60, 160), rng.integers(60, 200)
+        y = rng.integers(0, source.shape[0] - height)
+        x = rng.integers(0, source.shape[1] - width)
+        scene_cvimg = source[y : y + height, x : x + width].copy()
+        if i % 5 == 1:
+            # flat, and nearly flat, windows; where cv2's float32 rounding is largest
+            scene_cvimg[: height // 2] = 200
+            scene_cvimg[: height // 4, ::7] = 201
+        h, w = rng.integers(8, 60), rng.integers(8, 60)
+        if i % 3 == 0:
+            template = scene_cvimg[10 : 10 + h, 5 : 5 + w].copy()
+        else:
+            ty, tx = rng.integers(0, 1700), rng.integers(0, 1250)
+            template = screenshot[ty : ty + h, tx : tx + w].copy()
+
+        result = cv2.matchTemplate(scene_cvimg, template, cv2.TM_CCOEFF_NORMED)
+        for grid in (1, 2, 4):
+            bound = ncc_upper_bound(TemplateBlocks(template, grid), scene_cvimg)
+            assert bound.shape == result.shape
+            assert (result <= bound).all()
+        rejected += bound.max() < 0.8
+    # and it's tight enough to be useful
+    assert rejected > 20
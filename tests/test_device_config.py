@@ -1,3 +1,5 @@
+import sys
+
 import tomlkit
 from fbmr.devices import (
     StreamingAndroidDeviceConfig,
@@ -81,3 +83,10 @@ window_title = "KLJ"
 """
     class_type = WindowsAppDeviceConfig
     base_test_config_load(class_type, input_dict, input_string)
+
+
+def test_backends_are_imported_lazily():
+    # backends need platform-specific packages, so listing and validating configs mustn't import them
+    for parser in all_device_config_parsers().values():
+        module_name = parser.device_class_path.rsplit(".", 1)[0]
+        assert module_name not in sys.modules
@@ -0,0 +1,431 @@
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from fbmr.conditions import MatchCache, SubimageCondition
+from fbmr.config import Config, Action
+from fbmr.effects import Effect
+from fbmr.executor import Executor, UnreachedExitActionException
+from fbmr.pipelined_executor import PipelinedExecutor
+from fbmr.async_executor import AsyncExecutor
+from fbmr.utils import metrics, template_store
+from fbmr.utils.fingerprint_index import FingerprintIndex
+from fbmr.utils.flight_recorder import FlightRecorder
+from fbmr.utils.session_log import session_log
+from fbmr.utils.transition_stats import TransitionStats
+
+from tests.helpers import (
+    BUTTON_REGION,
+    TESTDATA_COND,
+    MockDevice,
+    nuke_test_folder,
+    write_loop_config,
+)
+
+TESTDATA_CONFIG = "tests/test_data_executor/"
+
+
+@pytest.fixture
+def setup_and_teardown():
+    """Setup and teardown code."""
+    nuke_test_folder(TESTDATA_CONFIG)
+    yield
+    nuke_test_folder(TESTDATA_CONFIG)
+
+
+class RecordTimeEffect(Effect):
+    def __init__(self, log, name):
+        super(RecordTimeEffect, self).__init__()
+        self.log = log
+        self.name = name
+
+    def apply(self, pil_image, state_dict, utils):
+        self.log.append((self.name, time.time()))
+
+
+def make_chain_config(log, cooldown=0.0):
+    """A two action loop, 'first' -> 'second' -> 'first', where both actions are valid on contained.png."""
+    config = Config(TESTDATA_CONFIG, "chain", create_if_missing=True)
+    for name, next_action_names in [("first", ["second"]), ("second", ["first"])]:
+        condition = SubimageCondition(TESTDATA_COND + "button.png", None, 80)
+        action = Action(
+            name,
+            [condition],
+            [RecordTimeEffect(log, name)],
+            True,
+            next_action_names,
+            cooldown if name == "first" else 0,
+            None,
+            TESTDATA_CONFIG + "chain",
+        )
+        config.add_action(action, temp=True)
+    return config
+
+
+def test_execute_chain(setup_and_teardown):
+    log = []
+    executor = Executor()
+    executor.set_config(make_chain_config(log))
+    device = MockDevice(TESTDATA_COND + "contained.png")
+
+    executed = executor.execute_chain("first", ["second"], {}, {"device": device})
+    assert executed.name == "second"
+    assert [name for name, _ts in log] == ["first", "second"]
+
+
+def test_speculative_scoring(setup_and_teardown):
+    log = []
+    cooldown = 0.5
+    executor = Executor()
+    executor.set_config(make_chain_config(log, cooldown=cooldown))
+    executor.speculative_scoring = True
+    executor.speculative_max_frame_age = cooldown
+    device = MockDevice(TESTDATA_COND + "contained.png", crop=BUTTON_REGION)
+    taken = []
+    take_speculative_result = executor.take_speculative_result
+
+    def record_take(state_dict):
+        taken.append(take_speculative_result(state_dict))
+        return taken[-1]
+
+    executor.take_speculative_result = record_take
+
+    executed = executor.execute_chain("first", ["second"], {}, {"device": device})
+    assert executed.name == "second"
+    (_first, first_ts), (_second, second_ts) = log
+    # effects never run before the cooldown elapses
+    assert second_ts - first_ts >= cooldown
+    # 'second' was decided on a frame captured during the cooldown
+    assert device.capture_times[-1] < second_ts
+    speculative_image, _scores = taken[-1]
+    assert speculative_image is not None
+    assert executor.speculative_result is None
+
+
+def test_pipelined_execute_chain(setup_and_teardown):
+    log = []
+    executor = PipelinedExecutor()
+    executor.set_config(make_chain_config(log, cooldown=0.2))
+    device = MockDevice(TESTDATA_COND + "contained.png", crop=BUTTON_REGION)
+
+    executed = executor.execute_chain("first", ["second"], {}, {"device": device})
+    assert executed.name == "second"
+    (_first, first_ts), (_second, second_ts) = log
+    assert second_ts - first_ts >= 0.2
+    # 'second' was decided on a frame captured after 'first' finished
+    decided_frame_ts = device.capture_times[executor.last_decision_frame_index - 1]
+    assert decided_frame_ts > first_ts + 0.2
+
+
+def test_pipelined_capture_pauses_during_actuation(setup_and_teardown):
+    log = []
+    executor = PipelinedExecutor()
+    executor.set_config(make_chain_config(log, cooldown=0.3))
+    device = MockDevice(TESTDATA_COND + "contained.png", crop=BUTTON_REGION)
+    # (start, end, thread) of each capture
+    captures = []
+    screen_capture = device.screen_capture
+
+    def slow_screen_capture():
+        start = time.time()
+        image = screen_capture()
+        time.sleep(0.01)
+        captures.append((start, time.time(), threading.get_ident()))
+        return image
+
+    device.screen_capture = slow_screen_capture
+    # (start, end) of each apply, including its cooldown
+    actuations = []
+    apply_and_wait = executor.apply_and_wait
+
+    def record_apply_and_wait(*args, **kwargs):
+        start = time.time()
+        result = apply_and_wait(*args, **kwargs)
+        actuations.append((start, time.time()))
+        return result
+
+    executor.apply_and_wait = record_apply_and_wait
+
+    executed = executor.execute_chain("first", ["second"], {}, {"device": device})
+    assert executed.name == "second"
+    assert len(actuations) == 2
+    main_thread = threading.get_ident()
+    stage_captures = [c for c in captures if c[2] != main_thread]
+    assert stage_captures
+    for capture_start, capture_end, _thread in stage_captures:
+        for actuation_start, actuation_end in actuations:
+            assert capture_end <= actuation_start or capture_start >= actuation_end
+
+
+def test_pipelined_recovers_from_adb_error(setup_and_teardown):
+    executor = PipelinedExecutor()
+    executor.set_config(write_loop_config(TESTDATA_CONFIG, "clicks"))
+    executor.adb_error_wait = 0
+    device = MockDevice(TESTDATA_COND + "contained.png", crop=BUTTON_REGION)
+    click = device.click
+
+    def flaky_click(x, y):
+        click(x, y)
+        if len(device.clicks) == 1:
+            raise subprocess.CalledProcessError(1, "adb shell input tap")
+
+    device.click = flaky_click
+    adb_errors = metrics.adb_errors.value
+
+    executed = executor.execute_chain("first", ["second"], {}, {"device": device})
+    assert executed.name == "second"
+    # the failed click on 'first' is retried, then the chain carries on
+    assert len(device.clicks) == 3
+    assert metrics.adb_errors.value == adb_errors + 1
+
+
+def test_async_execute_chain(setup_and_teardown):
+    log = []
+    executor = AsyncExecutor()
+    executor.set_config(make_chain_config(log, cooldown=0.2))
+    device = MockDevice(TESTDATA_COND + "contained.png", crop=BUTTON_REGION)
+
+    executed = asyncio.run(
+        executor.execute_chain("first", ["second"], {}, {"device": device})
+    )
+    assert executed.name == "second"
+    assert [name for name, _ts in log] == ["first", "second"]
+
+
+def test_async_execute_chain_cancel(setup_and_teardown):
+    log = []
+    executor = AsyncExecutor()
+    executor.set_config(make_chain_config(log))
+    # the button is never found, so the chain would run forever
+    device = MockDevice(TESTDATA_COND + "not_contained.png", crop=BUTTON_REGION)
+
+    async def run_and_cancel():
+        task = asyncio.create_task(
+            executor.execute_chain(
+                "first", ["second"], {}, {"device": device}, min_action_delay=0.05
+            )
+        )
+        await asyncio.sleep(0.3)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    start = time.time()
+    asyncio.run(run_and_cancel())
+    assert time.time() - start < 2
+    assert len(device.capture_times) > 0
+    assert log == []
+
+
+def test_flight_recorder_dumps_on_unreached_exit(setup_and_teardown, tmp_path):
+    log = []
+    executor = Executor()
+    config = make_chain_config(log)
+    config.get_action("second").next_action_names = []
+    executor.set_config(config)
+    executor.throw_if_end_action_not_reached = True
+    executor.flight_recorder = FlightRecorder(
+        max_seconds=60, max_megabytes=100, failure_streak=0, folder=str(tmp_path)
+    )
+    device = MockDevice(TESTDATA_COND + "contained.png", crop=BUTTON_REGION)
+
+    with pytest.raises(UnreachedExitActionException):
+        executor.execute_chain("first", ["unreachable"], {}, {"device": device})
+    assert len(executor.flight_recorder.dumps) == 1
+    assert "UnreachedExitActionException" in executor.flight_recorder.dumps[0]
+    assert len(os.listdir(executor.flight_recorder.dumps[0])) == 3
+
+
+def test_session_log(setup_and_teardown, tmp_path):
+    log = []
+    executor = Executor()
+    executor.set_config(make_chain_config(log, cooldown=0.1))
+    device = MockDevice(TESTDATA_COND + "contained.png", crop=BUTTON_REGION)
+
+    path = str(tmp_path / "session.jsonl")
+    session_log.start(path)
+    try:
+        executor.execute_chain("first", ["second"], {}, {"device": device})
+    finally:
+        session_log.close()
+
+    with open(path) as f:
+        events = [json.loads(line) for line in f]
+    assert [e["event"] for e in events] == [
+        "chain_start",
+        "match",
+        "score",
+        "decision",
+        "effect",
+        "cooldown",
+        "match",
+        "score",
+        "decision",
+        "effect",
+        "chain_end",
+    ]
+    assert all(e["config"] == "chain" for e in events if e["event"] != "match")
+    score = events[2]
+    assert score["actions"][0][0] == "first"
+    assert score["actions"][0][1] > 80
+    assert events[3]["action"] == "first"
+    assert events[-1]["last_action"] == "second"
+    assert events[-1]["error"] is None
+    assert events[-1]["chain_id"] == events[0]["chain_id"]
+
+
+def test_fingerprint_index(setup_and_teardown):
+    config = Config(TESTDATA_CONFIG, "indexed", create_if_missing=True)
+    contained = Image.open(TESTDATA_COND + "contained.png")
+    outlines = {
+        "on_contained": contained,
+        "on_other": Image.open(TESTDATA_COND + "not_contained.png"),
+        "flipped": contained.transpose(Image.Transpose.FLIP_TOP_BOTTOM),
+        "unindexed": None,
+    }
+    for name, outline in outlines.items():
+        tap_name = f"{name}_tap.png" if outline else f"{name}.png"
+        shutil.copy(
+            TESTDATA_COND + "button.png", os.path.join(config.folder_path, tap_name)
+        )
+        if outline:
+            outline.save(os.path.join(config.folder_path, f"{name}_outline.png"))
+        action = Action(
+            name,
+            [SubimageCondition(tap_name, None, 80)],
+            [],
+            True,
+            [],
+            0,
+            None,
+            config.folder_path,
+        )
+        action.set_folder_path(config.folder_path)
+        config.add_action(action, temp=True)
+
+    executor = Executor()
+    executor.set_config(config)
+    executor.use_fingerprint_index = True
+    executor.fingerprint_candidates = 1
+    scored = []
+    score_actions = executor.score_actions
+
+    def record_scored(pil_image, state_dict, utils, action_names):
+        scored.append(list(action_names))
+        return score_actions(pil_image, state_dict, utils, action_names)
+
+    executor.score_actions = record_scored
+
+    # only the action recorded on this screen, and the one that can't be ranked
+    action_scores = executor.score_all_actions(contained, {}, {})
+    assert scored == [["on_contained", "unindexed"]]
+    assert action_scores[0].score > 80
+    assert os.path.exists(os.path.join(config.folder_path, "fingerprints.json"))
+
+    # when none of the candidates are viable, the rest are scored too
+    scored.clear()
+    action_scores = executor.score_all_actions(
+        Image.open(TESTDATA_COND + "not_contained.png"), {}, {}
+    )
+    assert scored == [["on_other", "unindexed"], ["on_contained", "flipped"]]
+    assert len(action_scores) == 4
+    assert action_scores[0].score == 0
+
+
+def test_fingerprint_index_store_refs(setup_and_teardown, caplog):
+    config = Config(TESTDATA_CONFIG, "stored", create_if_missing=True)
+    store_ref = template_store.put_file(TESTDATA_COND + "button.png", TESTDATA_CONFIG)
+    Image.open(TESTDATA_COND + "contained.png").save(
+        os.path.join(config.folder_path, "linked_outline.png")
+    )
+    for name, outline_path in [("linked", "linked_outline.png"), ("unlinked", None)]:
+        condition = SubimageCondition(store_ref, None, 80, outline_path=outline_path)
+        action = Action(name, [condition], [], True, [], 0, None, config.folder_path)
+        action.set_folder_path(config.folder_path)
+        config.add_action(action, temp=True)
+
+    with caplog.at_level("INFO", logger="fbmr_logger"):
+        index = FingerprintIndex.build(config)
+    # a store reference doesn't name the outline screenshot; outline_path does
+    assert index.action_names == ["linked"]
+    assert index.unindexed_action_names == ["unlinked"]
+    unindexed_logs = [r for r in caplog.records if "always scored" in r.message]
+    assert len(unindexed_logs) == 1
+    assert "1 of 2 actions" in unindexed_logs[0].message
+
+
+def test_transition_ordering(setup_and_teardown, tmp_path):
+    log = []
+    config = make_chain_config(log)
+    for name in ["third", "fourth"]:
+        condition = SubimageCondition(TESTDATA_COND + "button.png", None, 80)
+        config.add_action(
+            Action(name, [condition], [], True, [], 0, None, TESTDATA_CONFIG + "chain"),
+            temp=True,
+        )
+    executor = Executor()
+    executor.set_config(config)
+    executor.transition_stats = TransitionStats(str(tmp_path / "transitions.json"))
+    device = MockDevice(TESTDATA_COND + "contained.png", crop=BUTTON_REGION)
+
+    # transitions are counted as actions are applied
+    executor.execute_chain("first", ["second"], {}, {"device": device})
+    assert executor.transition_stats.counts("first") == {"second": 1}
+
+    executor.transition_stats.record("second", "fourth")
+    executor.transition_stats.record("second", "fourth")
+    executor.transition_stats.record("second", "third")
+    candidates = ["first", "third", "fourth"]
+    image = device.screen_capture()
+    # strict: every candidate is scored, most likely first
+    scores = executor.score_actions(image, {}, {}, candidates)
+    assert sorted(s.action_name for s in scores) == sorted(candidates)
+    # otherwise, scoring stops at the first clearly viable one
+    executor.strict_scoring = False
+    scores = executor.score_actions(image, {}, {}, candidates)
+    assert [s.action_name for s in scores] == ["fourth"]
+    executor.transition_stats.close()
+
+
+def test_batch_matching(setup_and_teardown):
+    config = Config(TESTDATA_CONFIG, "batch", create_if_missing=True)
+    device = MockDevice(TESTDATA_COND + "contained.png", crop=BUTTON_REGION)
+    image = device.screen_capture()
+    image.crop((200, 100, 250, 150)).save(os.path.join(config.folder_path, "crop.png"))
+    shutil.copy(TESTDATA_COND + "button.png", config.folder_path)
+    conditions = {
+        "button": SubimageCondition("button.png", None, 80),
+        "crop": SubimageCondition("crop.png", None, 80),
+        "button_again": SubimageCondition("button.png", None, 80),
+        "missing": SubimageCondition(
+            "button.png", [0, 0, 300, 100], 80, should_pad_region=False
+        ),
+    }
+    for name, condition in conditions.items():
+        action = Action(name, [condition], [], True, [], 0, None, config.folder_path)
+        action.set_folder_path(config.folder_path)
+        config.add_action(action, temp=True)
+
+    # the templates searched for in the whole frame are matched once each; the region with one template is left alone
+    match_cache = MatchCache(image)
+    match_cache.prefetch(list(conditions.values()), {})
+    assert len(match_cache.matches) == 2
+    button_path = conditions["button"].adjust_file_path("button.png")
+    assert match_cache.get(image, button_path, None)[1] == (118, 112, 208, 58)
+    assert match_cache.get(image.copy(), button_path, None) is None
+
+    def scores(batch_matching):
+        executor = Executor()
+        executor.set_config(config)
+        executor.batch_matching = batch_matching
+        action_scores = executor.score_actions(image, {}, {}, list(conditions))
+        return {(s.action_name, round(s.score)) for s in action_scores}
+
+    assert scores(True) == scores(False)
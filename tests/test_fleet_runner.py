@@ -0,0 +1,66 @@
+import pytest
+
+from tests.helpers import (
+    BUTTON_REGION,
+    TESTDATA_COND,
+    MockDevice,
+    nuke_test_folder,
+    write_loop_config,
+)
+from tools.fleet_runner import FleetRunner, FleetJob
+
+TESTDATA_CONFIG = "tests/test_data_fleet/"
+
+
+@pytest.fixture
+def setup_and_teardown():
+    """Setup and teardown code."""
+    nuke_test_folder(TESTDATA_CONFIG)
+    yield
+    nuke_test_folder(TESTDATA_CONFIG)
+
+
+def make_device(image_name):
+    return MockDevice(
+        TESTDATA_COND + image_name, crop=BUTTON_REGION, capture_delay=0.01
+    )
+
+
+def test_fleet_runner(setup_and_teardown):
+    write_loop_config(TESTDATA_CONFIG, "chain")
+    devices = {
+        "device_a": make_device("contained.png"),
+        "device_b": make_device("contained.png"),
+        "device_c": make_device("not_contained.png"),
+    }
+    jobs = [
+        FleetJob(name, "chain", next_actions=["first"], exit_actions=["second"])
+        for name in ["device_a", "device_b"]
+    ]
+    jobs.append(
+        FleetJob("device_c", "chain", next_actions=["first"], max_minutes=0.005)
+    )
+    fleet = FleetRunner(
+        jobs,
+        configs_root=TESTDATA_CONFIG,
+        device_constructors={n: lambda x=n: devices[x] for n in devices},
+    )
+    stats = fleet.run()
+
+    # the config is loaded once and shared
+    assert list(fleet.configs.keys()) == ["chain"]
+    for name in ["device_a", "device_b"]:
+        assert stats[name].actions == 2
+        assert stats[name].error is None
+        assert stats[name].actions_per_minute > 0
+        assert len(devices[name].clicks) == 2
+        assert devices[name].closed
+    assert stats["device_c"].actions == 0
+    assert stats["device_c"].search_failures > 0
+    assert "device_a (chain): 2 actions" in fleet.report()
+
+
+def test_fleet_runner_rejects_shared_devices():
+    jobs = [FleetJob("device_a", "chain"), FleetJob("device_a", "other")]
+    with pytest.raises(ValueError):
+        FleetRunner(jobs, device_constructors={})
@@ -0,0 +1,68 @@
+import json
+import os
+import time
+
+from PIL import Image
+
+from fbmr.utils.flight_recorder import FlightRecorder
+
+FRAME_BYTES = 10 * 10 * 3
+
+
+def frame():
+    return Image.new("RGB", (10, 10))
+
+
+def test_ring_buffer_limits(tmp_path):
+    recorder = FlightRecorder(
+        max_seconds=60,
+        max_megabytes=5 * FRAME_BYTES / (1024 * 1024),
+        failure_streak=0,
+        folder=str(tmp_path),
+    )
+    for i in range(8):
+        recorder.record_frame(frame(), [("a", 90, (0, 0, 1, 1))], "a")
+    recorder.record_event("an event without a frame")
+    assert len(recorder.records) == 6
+    assert recorder.size == 5 * FRAME_BYTES
+
+    recorder.max_seconds = 0.05
+    time.sleep(0.1)
+    recorder.record_event("later")
+    assert [r.description for r in recorder.records] == ["later"]
+    assert recorder.size == 0
+
+
+def test_dump(tmp_path):
+    recorder = FlightRecorder(
+        max_seconds=60, max_megabytes=10, failure_streak=3, folder=str(tmp_path)
+    )
+    recorder.record_event("starting chain ['a']")
+    recorder.record_frame(frame(), [("a", 90, (0, 0, 5, 5))], "a")
+    recorder.record_frame(frame(), [("a", 10, (0, 0, 5, 5))], None)
+    recorder.record_frame(frame(), [("a", 10, (0, 0, 5, 5))], None)
+    assert recorder.dumps == []
+
+    # the third failure in a row triggers a dump
+    recorder.record_frame(frame(), [("a", 10, (0, 0, 5, 5))], None)
+    assert len(recorder.dumps) == 1
+    with open(os.path.join(recorder.dumps[0], "timeline.json")) as f:
+        timeline = json.load(f)
+    assert timeline["reason"] == "3 searches in a row failed"
+    descriptions = [r["description"] for r in timeline["records"]]
+    assert descriptions == [
+        "starting chain ['a']",
+        "chose a",
+        "no viable action",
+        "no viable action",
+        "no viable action",
+    ]
+    assert "image" not in timeline["records"][0]
+    assert os.path.exists(
+        os.path.join(recorder.dumps[0], timeline["records"][1]["image"])
+    )
+
+    # dumps are rate limited
+    assert recorder.dump("adb error") is None
+    recorder.last_dump_time = 0
+    assert recorder.dump("adb error").endswith("adb error")
@@ -0,0 +1,65 @@
+import threading
+import time
+
+from fbmr.helpers import FrameWaiter
+
+
+class MockPullDevice(object):
+    def __init__(self):
+        self.capture_times = []
+
+    def screen_capture(self):
+        self.capture_times.append(time.time())
+        return len(self.capture_times)
+
+
+class MockStreamingDevice(MockPullDevice):
+    def __init__(self):
+        super(MockStreamingDevice, self).__init__()
+        self.new_frame = threading.Event()
+        self.waits = 0
+
+    def wait_for_new_frame(self, timeout):
+        self.waits += 1
+        result = self.new_frame.wait(timeout)
+        self.new_frame.clear()
+        return result
+
+
+def test_frame_waiter_backoff():
+    device = MockPullDevice()
+    waiter = FrameWaiter(device, min_interval=0.01, max_interval=0.04, backoff=2)
+
+    # the first capture doesn't wait
+    assert waiter.next_frame() == 1
+    assert waiter.interval == 0.01
+
+    waiter.next_frame()
+    assert waiter.interval == 0.02
+    waiter.next_frame()
+    waiter.next_frame()
+    assert waiter.interval == 0.04
+    waiter.next_frame()
+    assert waiter.interval == 0.04
+
+    waiter.reset()
+    assert waiter.interval == 0.01
+    assert len(device.capture_times) == 5
+
+
+def test_frame_waiter_streaming():
+    device = MockStreamingDevice()
+    waiter = FrameWaiter(device, min_interval=0.01, max_interval=5)
+    waiter.next_frame()
+    assert device.waits == 0
+
+    def deliver_frame():
+        time.sleep(0.05)
+        device.new_frame.set()
+
+    threading.Thread(target=deliver_frame).start()
+    start = time.time()
+    waiter.next_frame()
+    # woken by the frame, rather than by the 5 second timeout
+    assert time.time() - start < 1
+    assert device.waits == 1
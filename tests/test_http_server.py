@@ -0,0 +1,209 @@
+import json
+import shutil
+import threading
+import time
+import urllib.request
+
+import pytest
+
+from fbmr.conditions import SubimageCondition
+from fbmr.config import Config, Action
+from fbmr.effects import ClickSubimageEffect
+from tools.http_server import (
+    ControlServer,
+    CoalescingCommandQueue,
+    HttpExecutionHook,
+    LatencyStats,
+    SUBSCRIBER_QUEUE_SIZE,
+)
+from tools.runner import Runner, RunnerStartCommand, RunnerInterruptCommand
+from tests.helpers import (
+    BUTTON_REGION,
+    TESTDATA_COND,
+    MockDevice,
+    nuke_test_folder,
+    wait_for,
+    write_loop_config,
+)
+
+TESTDATA_CONFIG = "tests/test_data_http_server/"
+
+
+@pytest.fixture
+def setup_and_teardown():
+    """Setup and teardown code."""
+    nuke_test_folder(TESTDATA_CONFIG)
+    yield
+    nuke_test_folder(TESTDATA_CONFIG)
+
+
+def button_device():
+    return MockDevice(
+        TESTDATA_COND + "contained.png", crop=BUTTON_REGION, capture_delay=0.01
+    )
+
+
+def request(server, method, path, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(
+        f"http://127.0.0.1:{server.port}{path}", data=data, method=method
+    )
+    with urllib.request.urlopen(req, timeout=5) as response:
+        return json.loads(response.read())
+
+
+def test_coalescing_command_queue():
+    queue = CoalescingCommandQueue()
+    first = RunnerStartCommand(next_actions=["first"])
+    second = RunnerStartCommand(next_actions=["second"])
+    interrupt = RunnerInterruptCommand()
+    assert queue.put(first) == 0
+    assert queue.put(interrupt) == 0
+    assert queue.put(RunnerInterruptCommand()) == 1
+    assert queue.put(second) == 1
+    assert queue.superseded == 2
+    assert queue.qsize() == 2
+    assert isinstance(queue.get(), RunnerInterruptCommand)
+    assert queue.get() is second
+    assert queue.current is second
+    assert queue.empty()
+
+
+def test_stalled_subscriber_drops_events():
+    hook = HttpExecutionHook(CoalescingCommandQueue(), LatencyStats())
+    stalled = hook.subscribe()
+    for i in range(SUBSCRIBER_QUEUE_SIZE + 10):
+        hook.publish("searching", next_action_names=[str(i)])
+    assert stalled.qsize() == SUBSCRIBER_QUEUE_SIZE
+    assert hook.dropped_events == 10
+    # a subscriber that keeps up gets everything from when it subscribed
+    hook.unsubscribe(stalled)
+    live = hook.subscribe()
+    hook.publish("searching", next_action_names=["last"])
+    assert live.get_nowait()["next_action_names"] == ["last"]
+    assert hook.dropped_events == 10
+
+
+def test_control_server(setup_and_teardown):
+    write_loop_config(TESTDATA_CONFIG, "loop", cooldown=0.05)
+    devices = []
+
+    def make_device():
+        devices.append(button_device())
+        return devices[-1]
+
+    runner = Runner(
+        "loop",
+        "mock",
+        configs_root=TESTDATA_CONFIG,
+        device_constructors={"mock": make_device},
+    )
+    server = ControlServer(runner, port=0)
+    server.start()
+    try:
+        events = []
+        stream = urllib.request.urlopen(
+            f"http://127.0.0.1:{server.port}/events", timeout=5
+        )
+
+        def read_events():
+            for line in stream:
+                if line.startswith(b"data: "):
+                    events.append(json.loads(line[len(b"data: ") :]))
+
+        threading.Thread(target=read_events, daemon=True).start()
+        wait_for(lambda: len(server.hook.subscribers) == 1)
+
+        # a burst of concurrent starts; queued starts are superseded by newer ones
+        responses = []
+        threads = [
+            threading.Thread(
+                target=lambda: responses.append(
+                    request(server, "POST", "/start", {"next_actions": ["first"]})
+                )
+            )
+            for _ in range(20)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(responses) == 20
+        wait_for(lambda: request(server, "GET", "/state")["running"])
+        wait_for(lambda: len(devices[0].clicks) >= 2)
+
+        # the device is created once and kept between chains
+        assert len(devices) == 1
+
+        request(server, "POST", "/interrupt")
+        wait_for(lambda: not request(server, "GET", "/state")["running"])
+        assert request(server, "GET", "/state")["status"] == "interrupted"
+
+        wait_for(lambda: any(e["event"] == "interrupted" for e in events))
+        assert any(e["event"] == "performing_action" for e in events)
+
+        metrics = request(server, "GET", "/metrics")
+        assert metrics["latency"]["queue_to_start"]["count"] >= 1
+        assert metrics["latency"]["interrupt"]["count"] == 1
+        assert metrics["latency"]["POST /start"]["count"] == 20
+        # every start either ran or was superseded by a newer one
+        assert (
+            metrics["latency"]["queue_to_start"]["count"]
+            + metrics["superseded_commands"]
+            == 20
+        )
+    finally:
+        server.shutdown()
+
+
+def test_control_server_publishes_how_chains_end(setup_and_teardown):
+    config = Config(TESTDATA_CONFIG, "once", create_if_missing=True)
+    shutil.copyfile(TESTDATA_COND + "button.png", config.folder_path + "/button.png")
+    # no next actions: the chain ends after clicking once, without completing
+    action = Action(
+        "only",
+        [SubimageCondition("button.png", None, 80)],
+        [ClickSubimageEffect("button.png", None, None)],
+        True,
+        [],
+        0,
+        None,
+        config.folder_path,
+    )
+    action.set_folder_path(config.folder_path)
+    config.add_action(action)
+    devices = []
+
+    def make_device():
+        if not devices:
+            devices.append(None)
+            raise RuntimeError("device not connected")
+        devices.append(button_device())
+        return devices[-1]
+
+    runner = Runner(
+        "once",
+        "mock",
+        configs_root=TESTDATA_CONFIG,
+        device_constructors={"mock": make_device},
+    )
+    server = ControlServer(runner, port=0)
+    server.start()
+    try:
+        # run() raising is published as an error
+        request(server, "POST", "/start", {"next_actions": ["only"]})
+        wait_for(lambda: request(server, "GET", "/state")["status"] == "error")
+        state = request(server, "GET", "/state")
+        assert not state["running"]
+        assert state["error"] == "device not connected"
+
+        # run() returning without completing goes back to idle
+        request(server, "POST", "/start", {"next_actions": ["only"]})
+        wait_for(lambda: len(devices) == 2 and len(devices[1].clicks) == 1)
+        wait_for(lambda: request(server, "GET", "/state")["status"] == "idle")
+        state = request(server, "GET", "/state")
+        assert not state["running"]
+        assert state["error"] is None
+        assert state["last_action"] == "only"
+    finally:
+        server.shutdown()
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from tools.latency_report import (
+    build_report,
+    format_report,
+    read_events,
+    session_files,
+)
+
+
+def event(event_name, **fields):
+    return {"t": 0, "event": event_name, "config": "farm", **fields}
+
+
+def test_latency_report(tmp_path):
+    events = [event("chain_start", start_action_names=["a"], end_action_names=["b"])]
+    for i in range(100):
+        scores = [["a", 90, 0.001 * (i + 1)], ["b", 0, 0.5]]
+        events.append(event("score", actions=scores))
+        events.append(event("match", template="a.png", seconds=0.001 * (i + 1)))
+        events.append(event("match", template="b.png", seconds=0.5))
+        events.append(event("decision", action="a" if i % 2 else None, frame_age=0.2))
+    events.append(event("effect", action="a", seconds=0.05))
+    events.append(event("retry", action="a", viability=50))
+    events.append(event("cooldown", action="a", seconds=1.5))
+    events.append(
+        event("chain_end", seconds=12.0, last_action=None, error="GlobalTimeoutError")
+    )
+
+    with open(tmp_path / "session_1.jsonl", "w") as f:
+        for e in events:
+            f.write(json.dumps(e) + "\n")
+        f.write('{"t": 0, "event": "ma')
+    (tmp_path / "debug_1.log").write_text("not a session log")
+
+    files = session_files([str(tmp_path)])
+    assert files == [str(tmp_path / "session_1.jsonl")]
+    report = build_report(read_events(files))
+
+    score = report["actions"][("farm", "a", "score")]
+    assert score["count"] == 100
+    assert score["p50"] == pytest.approx(0.051)
+    assert score["p95"] == pytest.approx(0.096)
+    assert score["p99"] == pytest.approx(0.1)
+    assert report["actions"][("farm", "a", "frame_age")]["count"] == 50
+    assert report["chain_errors"] == {("farm", "a"): 1}
+    assert report["counts"]["decisions"] == 50
+    assert report["counts"]["failed_searches"] == 50
+    assert report["counts"]["retries"] == 1
+
+    text = format_report(report, top=1)
+    assert "farm/a score" in text
+    slowest = text.split("slowest templates")[1].split("template time share")[0]
+    assert "b.png" in slowest
+    assert "a.png" not in slowest
+
+
+def test_latency_report_pairs_concurrent_chains():
+    events = [
+        event("chain_start", chain_id=1, start_action_names=["a"], end_action_names=[]),
+        event("chain_start", chain_id=2, start_action_names=["b"], end_action_names=[]),
+        event("chain_end", chain_id=2, seconds=1.0, last_action="b", error=None),
+        event("chain_end", chain_id=1, seconds=5.0, last_action=None, error="Timeout"),
+        # logs from before chain ids were added are paired by config
+        event("chain_start", start_action_names=["c"], end_action_names=[]),
+        event("chain_end", seconds=2.0, last_action="c", error=None),
+    ]
+    report = build_report(events)
+    assert report["chains"][("farm", "a")]["max"] == 5.0
+    assert report["chains"][("farm", "b")]["max"] == 1.0
+    assert report["chains"][("farm", "c")]["max"] == 2.0
+    assert report["chain_errors"] == {("farm", "a"): 1}
+
+
+def test_latency_report_zero_match_time():
+    events = [event("match", template="a.png", seconds=0.0) for _ in range(3)]
+    text = format_report(build_report(events))
+    assert "a.png" in text
+    assert "template time share" not in text
@@ -0,0 +1,81 @@
+import json
+import logging
+
+from fbmr.utils.log_pipeline import SampledDebugFilter, start_log_pipeline
+
+LOGGER_NAME = "fbmr_test_logger"
+
+
+def make_logger(tmp_path):
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    handler = logging.FileHandler(str(tmp_path / "debug.log"))
+    handler.setFormatter(logging.Formatter("%(levelname)s - %(message)s"))
+    logger.addHandler(handler)
+    return logger, handler
+
+
+def test_pipeline_writes_and_restores(tmp_path):
+    logger, handler = make_logger(tmp_path)
+    pipeline = start_log_pipeline(logger_name=LOGGER_NAME)
+    assert handler not in logger.handlers
+
+    values = [1, 2]
+    for i in range(100):
+        logger.debug("record %d %s", i, values)
+    try:
+        raise ValueError("oops")
+    except ValueError:
+        logger.exception("failed")
+    pipeline.stop()
+    pipeline.stop()
+
+    assert logger.handlers == [handler]
+    with open(tmp_path / "debug.log") as f:
+        text = f.read()
+    assert "DEBUG - record 99 [1, 2]" in text
+    assert "ValueError: oops" in text
+    logger.removeHandler(handler)
+    handler.close()
+
+
+def test_sampling_and_jsonl(tmp_path):
+    logger, handler = make_logger(tmp_path)
+    pipeline = start_log_pipeline(
+        debug_sample_rate=10,
+        matches_jsonl_path=str(tmp_path / "matches.jsonl"),
+        logger_name=LOGGER_NAME,
+    )
+    matches_logger = logging.getLogger(LOGGER_NAME + ".matches")
+    for i in range(30):
+        logger.debug("sampled %d", i)
+        matches_logger.debug("match %d at (%s, %s)", i, 5, 6)
+    logger.info("not sampled")
+    pipeline.stop()
+
+    with open(tmp_path / "debug.log") as f:
+        lines = f.read().splitlines()
+    assert lines == [
+        "DEBUG - sampled 0",
+        "DEBUG - sampled 10",
+        "DEBUG - sampled 20",
+        "INFO - not sampled",
+    ]
+    with open(tmp_path / "matches.jsonl") as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 3
+    assert records[1]["msg"] % tuple(records[1]["args"]) == "match 10 at (5, 6)"
+    logger.removeHandler(handler)
+    handler.close()
+
+
+def test_sampled_debug_filter_is_per_call_site():
+    sample = SampledDebugFilter(2)
+
+    def record(lineno, level=logging.DEBUG):
+        return logging.LogRecord("x", level, "a.py", lineno, "msg", None, None)
+
+    assert [sample.filter(record(1)) for _ in range(3)] == [True, False, True]
+    assert sample.filter(record(2))
+    assert sample.filter(record(1, logging.WARNING))
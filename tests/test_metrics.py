@@ -0,0 +1,60 @@
+import threading
+import urllib.request
+
+from PIL import Image
+
+from fbmr.utils import metrics
+from fbmr.utils.detect_image import find_location_pil
+from fbmr.utils.metrics import MetricsRegistry
+
+TESTDATA_FOLDER = "tests/test_data_conditions/"
+
+
+def test_counter_and_histogram_render():
+    registry = MetricsRegistry()
+    counter = registry.counter("test_total", "A counter.")
+    histogram = registry.histogram("test_seconds", "A histogram.", buckets=(0.1, 1.0))
+    assert registry.counter("test_total", "A counter.") is counter
+
+    threads = [
+        threading.Thread(target=lambda: [counter.inc() for _ in range(1000)])
+        for _ in range(4)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for value in [0.05, 0.1, 0.5, 2.0]:
+        histogram.observe(value)
+
+    text = registry.render()
+    assert "# TYPE test_total counter\ntest_total 4000.0\n" in text
+    assert 'test_seconds_bucket{le="0.1"} 2\n' in text
+    assert 'test_seconds_bucket{le="1.0"} 3\n' in text
+    assert 'test_seconds_bucket{le="+Inf"} 4\n' in text
+    assert "test_seconds_sum 2.65\n" in text
+    assert "test_seconds_count 4\n" in text
+
+
+def test_http_endpoint():
+    registry = MetricsRegistry()
+    registry.counter("test_total", "A counter.").inc(3)
+    server = registry.start_http_server(0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert "test_total 3.0" in response.read().decode()
+    finally:
+        registry.stop_http_server()
+
+
+def test_match_template_is_instrumented():
+    calls = metrics.match_template_calls.value
+    count = metrics.match_template_seconds.count
+    find_location_pil(
+        Image.open(TESTDATA_FOLDER + "button.png").convert("RGB"),
+        Image.open(TESTDATA_FOLDER + "contained.png").convert("RGB"),
+    )
+    assert metrics.match_template_calls.value == calls + 1
+    assert metrics.match_template_seconds.count == count + 1
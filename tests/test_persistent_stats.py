@@ -0,0 +1,152 @@
+import json
+import os
+import signal
+import threading
+import time
+
+from fbmr.utils import persistent_stats
+from fbmr.utils.persistent_stats import PersistentStats, JSONFile
+
+
+def wait_for(predicate, timeout=5.0):
+    start = time.time()
+    while not predicate():
+        assert time.time() - start < timeout
+        time.sleep(0.01)
+
+
+def crash(stats):
+    """Stops the stats' flush thread without writing anything, as if the process had died."""
+    stats.stop_event.set()
+    stats.flush_requested.set()
+    persistent_stats._open_stats.discard(stats)
+
+
+def journal_lines(path):
+    with open(path + ".journal") as f:
+        return f.readlines()
+
+
+def test_synchronous(tmp_path):
+    path = str(tmp_path / "stats.json")
+    stats = PersistentStats(path)
+    stats.increment("wins")
+    stats.record_value("level", 3)
+    assert JSONFile.read_json(path) == {"wins": 1, "level": 3}
+    assert os.listdir(tmp_path) == ["stats.json"]
+
+
+def test_write_behind(tmp_path):
+    path = str(tmp_path / "stats.json")
+    stats = PersistentStats(path, write_behind=True, flush_interval=60, flush_every=10)
+    for _ in range(9):
+        stats.increment("wins")
+    assert stats.get_value("wins", 0) == 9
+    assert JSONFile.read_json(path) == {}
+
+    # the 10th update wakes the flush thread
+    stats.increment("wins")
+    wait_for(lambda: JSONFile.read_json(path) == {"wins": 10})
+
+    stats.increment("wins")
+    stats.close()
+    assert JSONFile.read_json(path) == {"wins": 11}
+    # after closing, updates are saved immediately
+    stats.increment("wins")
+    assert JSONFile.read_json(path) == {"wins": 12}
+
+
+def test_write_behind_interval(tmp_path):
+    path = str(tmp_path / "stats.json")
+    stats = PersistentStats(path, write_behind=True, flush_interval=0.05)
+    stats.increment("wins")
+    time.sleep(0.2)
+    assert JSONFile.read_json(path) == {"wins": 1}
+    stats.close()
+
+
+def test_journal_replay(tmp_path):
+    path = str(tmp_path / "stats.json")
+    stats = PersistentStats(path, journal=True, flush_every=1, compact_every=100)
+    for _ in range(5):
+        stats.increment("wins")
+    stats.record_value("level", 2)
+    # "crash" without closing: the JSON file is stale, but the journal has every update
+    wait_for(lambda: len(journal_lines(path)) == 6)
+    assert JSONFile.read_json(path) == {}
+    crash(stats)
+
+    reloaded = PersistentStats(path, journal=True)
+    assert reloaded.get_dict() == {"wins": 5, "level": 2}
+    reloaded.increment("wins")
+    reloaded.close()
+    assert JSONFile.read_json(path) == {"wins": 6, "level": 2}
+    assert not os.path.exists(path + ".journal")
+
+
+def test_journal_compaction(tmp_path):
+    path = str(tmp_path / "stats.json")
+    stats = PersistentStats(path, journal=True, flush_every=1, compact_every=4)
+    for _ in range(4):
+        stats.increment("wins")
+    wait_for(lambda: JSONFile.read_json(path) == {"wins": 4})
+    wait_for(lambda: not os.path.exists(path + ".journal.old"))
+    for _ in range(2):
+        stats.increment("wins")
+    wait_for(lambda: len(journal_lines(path)) == 2)
+    assert [json.loads(line) for line in journal_lines(path)] == [
+        {"k": "wins", "v": 5},
+        {"k": "wins", "v": 6},
+    ]
+    crash(stats)
+    # entries that were already compacted can be replayed safely, and a torn last line is ignored
+    with open(path + ".journal", "a") as f:
+        f.write('{"k": "wins", "v": 6}\n{"k": "wi')
+    reloaded = PersistentStats(path, journal=True)
+    assert reloaded.get_value("wins", 0) == 6
+    reloaded.close()
+
+
+def test_write_behind_leaves_sigterm_alone(tmp_path):
+    # only entry points that own the process install a SIGTERM handler (see exit_on_sigterm)
+    stats = PersistentStats(str(tmp_path / "stats.json"), write_behind=True)
+    stats.close()
+    assert signal.getsignal(signal.SIGTERM) == signal.SIG_DFL
+
+
+def test_journal_replays_old_journal(tmp_path):
+    # a crash while compacting leaves the previous journal behind, next to the new one
+    path = str(tmp_path / "stats.json")
+    JSONFile.save_json(path, {"wins": 1})
+    with open(path + ".journal.old", "w") as f:
+        f.write('{"k": "wins", "v": 2}\n{"k": "level", "v": 1}\n')
+    with open(path + ".journal", "w") as f:
+        f.write('{"k": "wins", "v": 3}\n')
+    stats = PersistentStats(path, journal=True)
+    assert stats.get_dict() == {"wins": 3, "level": 1}
+    assert not os.path.exists(path + ".journal.old")
+    stats.close()
+
+
+def test_write_behind_writes_off_the_callers_thread(tmp_path, monkeypatch):
+    path = str(tmp_path / "stats.json")
+    writers = []
+    save_json = JSONFile.save_json
+
+    def record_save_json(filename, data):
+        writers.append(threading.get_ident())
+        save_json(filename, data)
+
+    for journal in [False, True]:
+        stats = PersistentStats(
+            path, journal=journal, write_behind=True, flush_every=1, compact_every=2
+        )
+        monkeypatch.setattr(JSONFile, "save_json", record_save_json)
+        for _ in range(10):
+            stats.increment("wins")
+        wait_for(lambda: stats.dirty == 0 and stats.journal_entries < 2)
+        monkeypatch.setattr(JSONFile, "save_json", save_json)
+        stats.close()
+        assert writers
+        assert threading.get_ident() not in writers
+        writers.clear()
@@ -0,0 +1,185 @@
+import datetime
+import threading
+import time
+
+import pytest
+
+from tests.helpers import (
+    BUTTON_REGION,
+    TESTDATA_COND,
+    MockDevice,
+    wait_for,
+    write_loop_config,
+)
+from tools.scheduler import (
+    CronSchedule,
+    IntervalSchedule,
+    JobStore,
+    MacroScheduler,
+    ScheduledJob,
+    parse_schedule,
+)
+
+
+def timestamp(*args):
+    return datetime.datetime(*args).timestamp()
+
+
+def test_interval_schedule():
+    assert parse_schedule("every 30m").next_run_after(100) == 100 + 30 * 60
+    assert parse_schedule("every 2h").next_run_after(0) == 2 * 60 * 60
+    assert parse_schedule("every 45").next_run_after(0) == 45
+    with pytest.raises(AssertionError):
+        IntervalSchedule.parse("every 0s")
+
+
+def test_cron_schedule():
+    # 2023-01-02 is a Monday
+    every_15 = CronSchedule("*/15 * * * *")
+    assert every_15.next_run_after(timestamp(2023, 1, 2, 10, 7)) == timestamp(
+        2023, 1, 2, 10, 15
+    )
+    assert every_15.next_run_after(timestamp(2023, 1, 2, 10, 15)) == timestamp(
+        2023, 1, 2, 10, 30
+    )
+
+    workday_mornings = CronSchedule("30 8-9 * * 1-5")
+    assert workday_mornings.next_run_after(timestamp(2023, 1, 2, 9, 45)) == timestamp(
+        2023, 1, 3, 8, 30
+    )
+    # friday evening -> monday morning
+    assert workday_mornings.next_run_after(timestamp(2023, 1, 6, 18, 0)) == timestamp(
+        2023, 1, 9, 8, 30
+    )
+
+    leap_day = CronSchedule("0 0 29 2 *")
+    assert leap_day.next_run_after(timestamp(2023, 1, 1)) == timestamp(2024, 2, 29)
+
+    # day-of-month OR day-of-week, like cron
+    first_or_sunday = CronSchedule("0 12 1 * 0")
+    assert first_or_sunday.next_run_after(timestamp(2023, 1, 2)) == timestamp(
+        2023, 1, 8, 12
+    )
+
+    with pytest.raises(ValueError):
+        CronSchedule("61 * * * *")
+    with pytest.raises(ValueError):
+        CronSchedule("* * *")
+
+
+def test_job_store_persists(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    store = JobStore(path)
+    store.add_job(
+        ScheduledJob(
+            "daily",
+            "my_config",
+            "my_device",
+            "0 6 * * *",
+            priority=2,
+            next_actions=["start"],
+            next_run=100,
+        )
+    )
+    store.add_job(ScheduledJob("often", "my_config", "my_device", "every 5m"))
+    store.close()
+
+    store = JobStore(path)
+    jobs = store.jobs()
+    assert [j.name for j in jobs] == ["daily", "often"]
+    assert jobs[0].next_actions == ["start"]
+    assert jobs[0].priority == 2
+    assert [j.name for j in store.jobs(due_before=200)] == ["daily"]
+
+    store.record_run(jobs[1], 1000, "ok")
+    store.close()
+
+    store = JobStore(path)
+    often = store.jobs()[1]
+    assert often.last_status == "ok"
+    assert often.next_run == 1000 + 5 * 60
+    assert store.remove_job("daily")
+    assert [j.name for j in store.jobs()] == ["often"]
+    store.close()
+
+
+class RecordingScheduler(MacroScheduler):
+    def __init__(self, store):
+        super(RecordingScheduler, self).__init__(
+            store, device_constructors={"a": object, "b": object}
+        )
+        self.order = []
+        self.running = {}
+        self.overlaps = []
+        self.record_lock = threading.Lock()
+
+    def run_job(self, job):
+        with self.record_lock:
+            self.order.append(job.name)
+            if self.running.get(job.device_name):
+                self.overlaps.append(job.name)
+            self.running[job.device_name] = True
+        self.get_device(job.device_name)
+        time.sleep(0.1)
+        with self.record_lock:
+            self.running[job.device_name] = False
+
+
+def test_scheduler_priority_and_device_locks(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    for name, device, priority in [
+        ("low", "a", 0),
+        ("high", "a", 10),
+        ("mid", "a", 5),
+        ("other_device", "b", 0),
+    ]:
+        store.add_job(
+            ScheduledJob(name, "config", device, "every 1h", priority, next_run=1)
+        )
+    scheduler = RecordingScheduler(store)
+
+    start = time.time()
+    while len(scheduler.order) < 4 and time.time() - start < 5:
+        scheduler.tick(now=10)
+        time.sleep(0.01)
+    scheduler.wait_idle()
+
+    # device 'a' runs its jobs one at a time, by priority; device 'b' doesn't wait for 'a'
+    assert [n for n in scheduler.order if n != "other_device"] == ["high", "mid", "low"]
+    assert scheduler.order.index("other_device") < 2
+    assert scheduler.overlaps == []
+    # devices are created once and kept warm between jobs
+    assert sorted(scheduler.devices.keys()) == ["a", "b"]
+    assert all(j.next_run > 10 for j in store.jobs())
+    store.close()
+
+
+def test_scheduler_stop_interrupts_running_chain(tmp_path):
+    # a 'first' -> 'second' -> 'first' loop with no end action and no time limit never finishes by itself
+    write_loop_config(str(tmp_path), "loop")
+
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    store.add_job(
+        ScheduledJob(
+            "loop", "loop", "device", "every 1h", next_actions=["first"], next_run=1
+        )
+    )
+    device = MockDevice(
+        TESTDATA_COND + "contained.png", crop=BUTTON_REGION, capture_delay=0.01
+    )
+    scheduler = MacroScheduler(
+        store,
+        configs_root=str(tmp_path),
+        device_constructors={"device": lambda: device},
+    )
+    thread = threading.Thread(target=scheduler.run_forever, daemon=True)
+    thread.start()
+
+    wait_for(lambda: len(device.clicks) >= 2, timeout=10)
+    scheduler.stop()
+    thread.join(5)
+
+    assert not thread.is_alive()
+    assert scheduler.wait_idle(0) == []
+    assert [j.last_status for j in store.jobs()] == ["interrupted"]
+    store.close()
@@ -0,0 +1,110 @@
+import os
+import shutil
+from pathlib import Path
+
+import pyjson5
+import pytest
+from PIL import Image
+
+from fbmr.conditions import SubimageCondition
+from fbmr.config import Config, Action
+from fbmr.utils import template_store
+from fbmr.utils.detect_image import template_cache
+from tools.migrate_to_store import migrate_config
+
+TESTDATA_COND = "tests/test_data_conditions/"
+TESTDATA_CONFIG = "tests/test_data_config/"
+
+
+@pytest.fixture
+def setup_and_teardown():
+    """Setup and teardown code."""
+    nuke_test_folder()
+    yield
+    nuke_test_folder()
+
+
+def nuke_test_folder():
+    if os.path.exists(TESTDATA_CONFIG):
+        shutil.rmtree(TESTDATA_CONFIG)
+    Path(TESTDATA_CONFIG).mkdir(parents=True, exist_ok=True)
+
+
+def make_config(name, image_name):
+    config = Config(TESTDATA_CONFIG, name, create_if_missing=True)
+    shutil.copy(
+        TESTDATA_COND + "button.png", os.path.join(config.folder_path, image_name)
+    )
+    action = Action(
+        "find",
+        [SubimageCondition(image_name, None, 80)],
+        [],
+        True,
+        [],
+        0,
+        None,
+        config.folder_path,
+    )
+    action.set_folder_path(config.folder_path)
+    config.add_action(action)
+    return config
+
+
+def test_put_is_content_addressed(setup_and_teardown):
+    ref = template_store.put_file(TESTDATA_COND + "button.png", TESTDATA_CONFIG)
+    assert template_store.is_store_ref(ref)
+    # the same pixels, encoded differently
+    image = Image.open(TESTDATA_COND + "button.png")
+    assert template_store.put_image(image, TESTDATA_CONFIG) == ref
+    stored_path = template_store.resolve(ref, TESTDATA_CONFIG)
+    with open(stored_path, "rb") as stored, open(
+        TESTDATA_COND + "button.png", "rb"
+    ) as original:
+        assert stored.read() == original.read()
+    assert template_store.put_image(image.crop((0, 0, 10, 10)), TESTDATA_CONFIG) != ref
+
+
+def test_migrate_to_store(setup_and_teardown):
+    first = make_config("first", "button_tap.png")
+    second = make_config("second", "renamed_tap.png")
+    outline_path = os.path.join(first.folder_path, "button_outline.png")
+    shutil.copy(TESTDATA_COND + "contained.png", outline_path)
+
+    refs = migrate_config(first, TESTDATA_CONFIG, delete_originals=True)
+    migrate_config(second, TESTDATA_CONFIG)
+    assert list(refs) == ["button_tap.png"]
+    store_ref = refs["button_tap.png"]
+    assert not os.path.exists(os.path.join(first.folder_path, "button_tap.png"))
+    assert os.path.exists(os.path.join(second.folder_path, "renamed_tap.png"))
+    assert os.path.exists(first.json_path + ".bak")
+
+    # both configs refer to the one stored image
+    with open(second.json_path) as f:
+        assert pyjson5.load(f)["actions"][0]["conditions"][0]["image_path"] == (
+            store_ref
+        )
+    store_files = [
+        files
+        for _root, _dirs, files in os.walk(template_store.store_folder(TESTDATA_CONFIG))
+    ]
+    assert sum(len(files) for files in store_files) == 1
+
+    # which is decoded once, for both
+    template_cache.clear()
+    misses = template_cache.misses
+    scene = Image.open(TESTDATA_COND + "contained.png")
+    for name in ["first", "second"]:
+        config = Config(TESTDATA_CONFIG, name)
+        assert config.template_paths() == {
+            store_ref: template_store.resolve(store_ref, TESTDATA_CONFIG)
+        }
+        assert config.get_action("find").is_valid(scene, {}, {}) > 80
+    assert template_cache.misses == misses + 1
+
+    # the outline screenshot stays associated with the moved template
+    condition = Config(TESTDATA_CONFIG, "first").get_action("find").conditions[0]
+    assert condition.outline_path == "button_outline.png"
+    assert condition.outline_file_path() == outline_path
+    condition = Config(TESTDATA_CONFIG, "second").get_action("find").conditions[0]
+    assert condition.outline_path is None
+    assert condition.outline_file_path() is None
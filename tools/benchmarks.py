@@ -0,0 +1,690 @@
+"""
+benchmarks.py
+
+micro-benchmarks for fbmr's hot paths.
+
+usage: python -m tools.benchmarks [benchmark name] [options]
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from fbmr.conditions import AllOf, AnyOf, SubimageCondition, load_condition
+from fbmr.config import Action, Config
+from fbmr.editor import pixel_probe_condition_json, region_hash_condition_json
+from fbmr.executor import Executor
+from fbmr.utils.detect_image import (
+    find_location_cv,
+    find_locations_cv,
+    match_prefilter,
+    template_cache,
+)
+from fbmr.utils import metrics
+from fbmr.utils.settings import settings
+from fbmr.utils.debug_settings import debug_settings
+from fbmr.utils.learned_regions import LearnedRegions
+from fbmr.utils.log_pipeline import FBMR_LOGGER, start_log_pipeline
+from fbmr.utils.persistent_stats import PersistentStats, JSONFile
+from fbmr.utils.template_tracker import TemplateTracker
+from fbmr.utils.transition_stats import TransitionStats
+
+CONDITIONS_TESTDATA_ROOT = "tests/test_data_conditions/"
+
+
+def benchmark_persistent_stats(args):
+    """
+    Stat updates per second, in each of PersistentStats' modes.
+    Runs a tight loop of increments over a file of `args.stats` stats, like a long-running macro's success counters.
+    """
+    modes = [
+        ("synchronous", {}),
+        ("write_behind", {"write_behind": True}),
+        ("journal", {"journal": True}),
+    ]
+    with tempfile.TemporaryDirectory() as folder:
+        for mode, kwargs in modes:
+            path = os.path.join(folder, f"{mode}.json")
+            JSONFile.save_json(path, {f"stat_{i}": 0 for i in range(args.stats)})
+            stats = PersistentStats(path, **kwargs)
+            start = time.perf_counter()
+            for i in range(args.updates):
+                stats.increment(f"stat_{i % args.stats}")
+            elapsed = time.perf_counter() - start
+            stats.close()
+            assert sum(JSONFile.read_json(path).values()) == args.updates
+            print(
+                f"{mode:>12}: {args.updates / elapsed:12.0f} updates/s"
+                f" ({1e6 * elapsed / args.updates:.1f} us/update, {stats.flush_count} flushes)"
+            )
+
+
+def benchmark_logging(args):
+    """
+    Condition evaluations per second with fbmr_logger at DEBUG, for each way of writing the log.
+    The scene is cropped to just around the button, so matching is cheap and the logging overhead shows.
+    """
+    condition = SubimageCondition(
+        CONDITIONS_TESTDATA_ROOT + "button.png", None, 80, 1.0
+    )
+    scene = Image.open(CONDITIONS_TESTDATA_ROOT + "contained.png").convert("RGB")
+    scene = scene.crop((681, 986, 721 + 208 + 40, 1026 + 58 + 40))
+
+    logger = logging.getLogger(FBMR_LOGGER)
+    if debug_settings.log_pipeline:
+        debug_settings.log_pipeline.stop()
+    original_handlers = list(logger.handlers)
+    original_level = logger.level
+    for handler in original_handlers:
+        logger.removeHandler(handler)
+
+    modes = [
+        ("off", {}),
+        ("synchronous", {}),
+        ("queue", {"pipeline": True}),
+        ("sampled", {"pipeline": True, "debug_sample_rate": 10}),
+        ("jsonl", {"pipeline": True, "matches_jsonl": True}),
+    ]
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            for mode, options in modes:
+                log_path = os.path.join(folder, f"{mode}.log")
+                file_handler = logging.FileHandler(log_path)
+                file_handler.setFormatter(
+                    logging.Formatter(
+                        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+                    )
+                )
+                logger.addHandler(file_handler)
+                logger.setLevel(logging.INFO if mode == "off" else logging.DEBUG)
+                pipeline = None
+                if options.get("pipeline"):
+                    pipeline = start_log_pipeline(
+                        debug_sample_rate=options.get("debug_sample_rate", 1),
+                        matches_jsonl_path=(
+                            os.path.join(folder, f"{mode}.jsonl")
+                            if options.get("matches_jsonl")
+                            else None
+                        ),
+                    )
+
+                start = time.perf_counter()
+                for _ in range(args.evaluations):
+                    condition.is_valid(scene, {}, {})
+                elapsed = time.perf_counter() - start
+                drain_start = time.perf_counter()
+                if pipeline:
+                    pipeline.stop()
+                drain = time.perf_counter() - drain_start
+                logger.removeHandler(file_handler)
+                file_handler.close()
+
+                written = sum(
+                    os.path.getsize(os.path.join(folder, name))
+                    for name in os.listdir(folder)
+                    if name.startswith(mode + ".")
+                )
+                print(
+                    f"{mode:>12}: {args.evaluations / elapsed:10.0f} evaluations/s"
+                    f" ({1e6 * elapsed / args.evaluations:.1f} us/evaluation,"
+                    f" {1e3 * drain:.1f} ms to drain, {written / 1024:.0f} KB written)"
+                )
+    finally:
+        logger.setLevel(original_level)
+        for handler in original_handlers:
+            logger.addHandler(handler)
+
+
+def benchmark_config_load(args):
+    """
+    Time to load a config and read each of its templates once (as the first search would), from config.json and PNGs
+    vs. from config.compiled. Uses a generated config with `args.templates` noisy (so, poorly compressed) templates.
+    """
+    with tempfile.TemporaryDirectory() as configs_root:
+        config = Config(configs_root, "benchmark", create_if_missing=True)
+        rng = np.random.default_rng(0)
+        for i in range(args.templates):
+            image = Image.fromarray(
+                rng.integers(0, 255, (args.size, args.size, 3), dtype=np.uint8)
+            )
+            image.save(os.path.join(config.folder_path, f"template_{i}.png"))
+            condition = SubimageCondition(f"template_{i}.png", None, 80)
+            action = Action(
+                f"action_{i}", [condition], [], True, [], 0, None, config.folder_path
+            )
+            action.set_folder_path(config.folder_path)
+            config.add_action(action, temp=True)
+        config.write()
+
+        def load():
+            template_cache.clear()
+            start = time.perf_counter()
+            loaded = Config(configs_root, "benchmark")
+            for path in loaded.template_paths().values():
+                template_cache.read(path)
+            return time.perf_counter() - start
+
+        get_compiled_configs = settings.get_fbmr_compiled_configs
+        try:
+            settings.get_fbmr_compiled_configs = lambda: False
+            json_time = statistics.median(load() for _ in range(args.runs))
+            settings.get_fbmr_compiled_configs = lambda: True
+            compile_time = load()
+            compiled_time = statistics.median(load() for _ in range(args.runs))
+        finally:
+            settings.get_fbmr_compiled_configs = get_compiled_configs
+        template_cache.clear()
+
+        print(f"{'config.json':>16}: {1000 * json_time:8.1f} ms")
+        print(f"{'compiling':>16}: {1000 * compile_time:8.1f} ms (once)")
+        print(f"{'config.compiled':>16}: {1000 * compiled_time:8.1f} ms")
+
+
+def benchmark_search(args):
+    """
+    Time to check a condition without an intended_region on the same frame, `args.evaluations` times: searching the
+    whole screenshot each time, vs. a learned search region, vs. tracking the template from its last match.
+    """
+    scene = Image.open(CONDITIONS_TESTDATA_ROOT + "contained.png").convert("RGB")
+    scene.load()
+
+    def run(make_utils):
+        condition = SubimageCondition(CONDITIONS_TESTDATA_ROOT + "button.png", None, 80)
+        utils = make_utils()
+        # the first check is always a full search; it's where the others learn the template's location from
+        condition.is_valid(scene, {}, utils)
+        start = time.perf_counter()
+        for _ in range(args.evaluations):
+            assert condition.is_valid(scene, {}, utils) > 80
+        return (time.perf_counter() - start) / args.evaluations
+
+    with tempfile.TemporaryDirectory() as folder:
+        learned_regions = LearnedRegions(os.path.join(folder, "learned_regions.json"))
+        timings = [
+            ("full frame", run(lambda: {})),
+            ("learned region", run(lambda: {"learned_regions": learned_regions})),
+            ("tracked", run(lambda: {"template_tracker": TemplateTracker()})),
+        ]
+        learned_regions.close()
+    for label, seconds in timings:
+        print(f"{label:>16}: {1000 * seconds:8.2f} ms per check")
+
+
+def benchmark_fingerprints(args):
+    """
+    Time to decide on a frame when any action could be next (next_action_names is empty), scoring every action vs.
+    the fingerprint index's candidates, for configs of increasing size. Each generated action is recorded on its own
+    screen, and the frame is one of them.
+    """
+    rng = np.random.default_rng(0)
+    for action_count in args.actions:
+        with tempfile.TemporaryDirectory() as configs_root:
+            config = Config(configs_root, "benchmark", create_if_missing=True)
+            screens = []
+            for i in range(action_count):
+                # blocky, so that screens differ at fingerprint scale, as real ones do
+                screen = Image.fromarray(
+                    rng.integers(0, 255, (12, 16, 3), dtype=np.uint8)
+                ).resize((320, 240), Image.NEAREST)
+                screen.save(os.path.join(config.folder_path, f"a{i}_outline.png"))
+                screen.crop((100, 100, 140, 140)).save(
+                    os.path.join(config.folder_path, f"a{i}_tap.png")
+                )
+                screens.append(screen)
+                condition = SubimageCondition(f"a{i}_tap.png", None, 95)
+                action = Action(
+                    f"a{i}", [condition], [], True, [], 0, None, config.folder_path
+                )
+                action.set_folder_path(config.folder_path)
+                config.add_action(action, temp=True)
+            frame = screens[action_count // 2]
+
+            timings = []
+            for use_index in (False, True):
+                executor = Executor()
+                executor.set_config(config)
+                executor.use_fingerprint_index = use_index
+                executor.score_all_actions(frame, {}, {})
+                start = time.perf_counter()
+                for _ in range(args.runs):
+                    action_scores = executor.score_all_actions(frame, {}, {})
+                    assert action_scores[0].action_name == f"a{action_count // 2}"
+                timings.append((time.perf_counter() - start) / args.runs)
+        print(
+            f"{action_count:>5} actions: {1000 * timings[0]:8.1f} ms scoring all,"
+            f" {1000 * timings[1]:8.1f} ms with the fingerprint index"
+        )
+
+
+def benchmark_transitions(args):
+    """
+    Template matches and time per decision on a branching action ("click_gamble" -> `args.branches` results, as in
+    docs/advanced_usage.md), scoring every branch vs. scoring them in transition order and stopping early.
+    The result that shows up is the one that usually does.
+    """
+    scene = Image.open(CONDITIONS_TESTDATA_ROOT + "contained.png").convert("RGB")
+    scene = scene.crop((603, 914, 1106, 1260))
+    scene.load()
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as configs_root:
+        config = Config(configs_root, "benchmark", create_if_missing=True)
+        result_names = [f"result_{i}" for i in range(args.branches)]
+        for i, name in enumerate(result_names):
+            if i == args.branches - 1:
+                template = Image.open(CONDITIONS_TESTDATA_ROOT + "button.png")
+            else:
+                template = Image.fromarray(
+                    rng.integers(0, 255, (58, 208, 3), dtype=np.uint8)
+                )
+            template.save(os.path.join(config.folder_path, f"{name}.png"))
+            action = Action(
+                name,
+                [SubimageCondition(f"{name}.png", None, 80)],
+                [],
+                True,
+                ["click_gamble"],
+                0,
+                None,
+                config.folder_path,
+            )
+            action.set_folder_path(config.folder_path)
+            config.add_action(action, temp=True)
+
+        for strict in (True, False):
+            executor = Executor()
+            executor.set_config(config)
+            executor.strict_scoring = strict
+            executor.transition_stats = TransitionStats(
+                os.path.join(configs_root, f"transitions_{strict}.json")
+            )
+            executor.last_action_name = "click_gamble"
+            for _ in range(3):
+                executor.transition_stats.record("click_gamble", result_names[-1])
+            calls = metrics.match_template_calls.value
+            start = time.perf_counter()
+            for _ in range(args.decisions):
+                action_scores = executor.score_actions(scene, {}, {}, result_names)
+                assert action_scores[0].action_name == result_names[-1]
+            seconds = (time.perf_counter() - start) / args.decisions
+            matches = (metrics.match_template_calls.value - calls) / args.decisions
+            executor.transition_stats.close()
+            label = "strict" if strict else "early stop"
+            print(
+                f"{label:>12}: {matches:4.1f} template matches, {1000 * seconds:6.1f} ms per decision"
+            )
+
+
+def benchmark_batch_matching(args):
+    """
+    Time to match increasing numbers of (50x50, like the macro recorder's) templates against a whole screenshot: one
+    cv2.matchTemplate per template vs. find_locations_cv, which shares the screenshot's preprocessing between them.
+    """
+    scene = Image.open(CONDITIONS_TESTDATA_ROOT + "contained.png").convert("RGB")
+    scene_cvimg = np.array(scene)[:, :, ::-1].copy()
+    height, width = scene_cvimg.shape[:2]
+    rng = np.random.default_rng(0)
+    for template_count in args.templates:
+        templates = []
+        for _ in range(template_count):
+            x, y = rng.integers(0, width - 50), rng.integers(0, height - 50)
+            templates.append(scene_cvimg[y : y + 50, x : x + 50].copy())
+
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            separate = [find_location_cv(t, scene_cvimg) for t in templates]
+        separate_seconds = (time.perf_counter() - start) / args.runs
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            batched = find_locations_cv(templates, scene_cvimg)
+        batched_seconds = (time.perf_counter() - start) / args.runs
+        assert [box for _s, box in separate] == [box for _s, box in batched]
+        print(
+            f"{template_count:>5} templates: {1000 * separate_seconds:8.1f} ms separately,"
+            f" {1000 * batched_seconds:8.1f} ms batched ({separate_seconds / batched_seconds:.1f}x)"
+        )
+
+
+def benchmark_prefilter(args):
+    """
+    Time to check `args.conditions` conditions with intended regions, like the macro recorder's, with and without the
+    match prefilter. Each condition's template is a 50x50 crop of the screenshot, searched for somewhere it isn't
+    (as most candidates' templates are, on any frame), except for the button, which is where its region says.
+    """
+    scene = Image.open(CONDITIONS_TESTDATA_ROOT + "contained.png").convert("RGB")
+    scene.load()
+    width, height = scene.size
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as folder:
+        conditions = [
+            SubimageCondition(
+                CONDITIONS_TESTDATA_ROOT + "button.png", [721, 1026, 929, 1084], 80
+            )
+        ]
+        for i in range(args.conditions - 1):
+            x, y = rng.integers(0, width - 50), rng.integers(0, height - 50)
+            path = os.path.join(folder, f"template_{i}.png")
+            scene.crop((x, y, x + 50, y + 50)).save(path)
+            x, y = rng.integers(0, width - 50), rng.integers(0, height - 50)
+            conditions.append(SubimageCondition(path, [x, y, x + 50, y + 50], 80))
+
+        timings = []
+        for utils in ({}, {"match_prefilter": True}):
+            for c in conditions:
+                c.is_valid(scene, {}, utils)
+            rejections = match_prefilter.rejections
+            start = time.perf_counter()
+            for _ in range(args.runs):
+                results = [c.is_valid(scene, {}, utils) for c in conditions]
+                assert results[0] > 80
+            timings.append((time.perf_counter() - start) / args.runs)
+        rejected = (match_prefilter.rejections - rejections) / args.runs
+    print(
+        f"{args.conditions} conditions: {1000 * timings[0]:.1f} ms matching each,"
+        f" {1000 * timings[1]:.1f} ms with the prefilter ({rejected:.0f} rejected)"
+    )
+
+
+def benchmark_conditions(args):
+    """
+    Time to check whether the button is on screen, `args.evaluations` times: matching its template in its intended
+    region, vs. probing a few of its pixels, vs. hashing its region.
+    """
+    scene = Image.open(CONDITIONS_TESTDATA_ROOT + "contained.png").convert("RGB")
+    scene.load()
+    region = [721, 1026, 929, 1084]
+    conditions = [
+        (
+            "template",
+            SubimageCondition(CONDITIONS_TESTDATA_ROOT + "button.png", region, 80),
+        ),
+        (
+            "pixel probe",
+            load_condition(
+                pixel_probe_condition_json(
+                    scene, [[750, 1040], [800, 1050], [850, 1060], [900, 1070]]
+                ),
+                CONDITIONS_TESTDATA_ROOT,
+            ),
+        ),
+        (
+            "region hash",
+            load_condition(
+                region_hash_condition_json(scene, region), CONDITIONS_TESTDATA_ROOT
+            ),
+        ),
+    ]
+    for label, condition in conditions:
+        assert condition.is_valid(scene, {}, {}) > 0
+        start = time.perf_counter()
+        for _ in range(args.evaluations):
+            condition.is_valid(scene, {}, {})
+        seconds = (time.perf_counter() - start) / args.evaluations
+        print(f"{label:>12}: {1e6 * seconds:8.1f} us per check")
+
+
+def benchmark_composite(args):
+    """
+    Template matches and time per decision for `args.alternatives` ways a screen can look: one action per
+    alternative (each with the screen's pixel probe and its own template) vs. one action with
+    AllOf(probe, AnyOf(templates)). The first is scored on the screen, where the second alternative is showing,
+    and on a different screen, where none are.
+    """
+    scenes = {}
+    for name in ("contained", "not_contained"):
+        scenes[name] = Image.open(CONDITIONS_TESTDATA_ROOT + f"{name}.png").convert(
+            "RGB"
+        )
+        scenes[name] = scenes[name].crop((603, 914, 1106, 1260))
+        scenes[name].load()
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as configs_root:
+        config = Config(configs_root, "benchmark", create_if_missing=True)
+        probe_json = pixel_probe_condition_json(
+            scenes["contained"], [[197, 136], [147, 126]]
+        )
+        templates = []
+        for i in range(args.alternatives):
+            if i == 1:
+                template = Image.open(CONDITIONS_TESTDATA_ROOT + "button.png")
+            else:
+                template = Image.fromarray(
+                    rng.integers(0, 255, (58, 208, 3), dtype=np.uint8)
+                )
+            template.save(os.path.join(config.folder_path, f"alternative_{i}.png"))
+            templates.append(SubimageCondition(f"alternative_{i}.png", None, 80))
+
+        duplicated_names = []
+        for i, template in enumerate(templates):
+            duplicated_names.append(f"duplicated_{i}")
+            conditions = [load_condition(probe_json, config.folder_path), template]
+            config.add_action(
+                Action(f"duplicated_{i}", conditions, [], True, [], 0, None, ""),
+                temp=True,
+            )
+        composite = AllOf(
+            [load_condition(probe_json, config.folder_path), AnyOf(templates)]
+        )
+        config.add_action(
+            Action("composite", [composite], [], True, [], 0, None, ""), temp=True
+        )
+        for action in config.actions:
+            action.set_folder_path(config.folder_path)
+
+        executor = Executor()
+        executor.set_config(config)
+        for label, action_names in (
+            ("duplicated", duplicated_names),
+            ("composite", ["composite"]),
+        ):
+            for scene_name, scene in scenes.items():
+                calls = metrics.match_template_calls.value
+                start = time.perf_counter()
+                for _ in range(args.decisions):
+                    executor.score_actions(scene, {}, {}, action_names)
+                seconds = (time.perf_counter() - start) / args.decisions
+                matches = (metrics.match_template_calls.value - calls) / args.decisions
+                print(
+                    f"{label:>10} on {scene_name:<13}: {matches:4.1f} template matches,"
+                    f" {1000 * seconds:6.1f} ms per decision"
+                )
+
+
+def benchmark_native_capture(args):
+    """
+    Time per frame to check `args.conditions` conditions with intended regions, like the macro recorder's, on a device
+    whose resolution is `args.scale` times the config's screenshot_size: resizing the frame to screenshot_size first
+    (as screen_capture does), vs. leaving it at the device's resolution and matching resized templates.
+    """
+    screenshot = Image.open(CONDITIONS_TESTDATA_ROOT + "contained.png").convert("RGB")
+    width, height = screenshot.size
+    native = screenshot.resize(
+        (round(width * args.scale), round(height * args.scale)), Image.LANCZOS
+    )
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as folder:
+        conditions = [
+            SubimageCondition(
+                CONDITIONS_TESTDATA_ROOT + "button.png", [721, 1026, 929, 1084], 80
+            )
+        ]
+        for i in range(args.conditions - 1):
+            x, y = rng.integers(0, width - 50), rng.integers(0, height - 50)
+            path = os.path.join(folder, f"template_{i}.png")
+            screenshot.crop((x, y, x + 50, y + 50)).save(path)
+            conditions.append(SubimageCondition(path, [x, y, x + 50, y + 50], 80))
+
+        def resized_frame():
+            frame = native.resize(screenshot.size, Image.LANCZOS)
+            return [c.is_valid(frame, {}, {}) for c in conditions]
+
+        def native_frame():
+            utils = {"screenshot_size": screenshot.size}
+            return [c.is_valid(native, {}, utils) for c in conditions]
+
+        for label, check in (("resized", resized_frame), ("native", native_frame)):
+            # the first run resizes the templates
+            assert check()[0] > 80
+            start = time.perf_counter()
+            for _ in range(args.runs):
+                check()
+            seconds = (time.perf_counter() - start) / args.runs
+            print(f"{label:>8}: {1000 * seconds:6.1f} ms per frame")
+    start = time.perf_counter()
+    for _ in range(args.runs):
+        native.resize(screenshot.size, Image.LANCZOS)
+    seconds = (time.perf_counter() - start) / args.runs
+    print(f"(of which resizing the frame: {1000 * seconds:.1f} ms)")
+
+
+STARTUP_STATEMENTS = [
+    (
+        "list device configs",
+        "from fbmr.devices import all_device_configs; all_device_configs()",
+    ),
+    ("import fbmr.config", "import fbmr.config"),
+    ("import tools.runner", "import tools.runner"),
+]
+
+
+def benchmark_startup(args):
+    """
+    Wall time to start a fresh interpreter and run each statement (the median of `args.runs` runs), and which heavy
+    modules ended up imported.
+    """
+    heavy_modules = ["cv2", "numpy", "scrcpy", "win32gui"]
+    for label, statement in STARTUP_STATEMENTS:
+        check = f"import sys; print([m for m in {heavy_modules!r} if m in sys.modules])"
+        timings = []
+        imported = ""
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            result = subprocess.run(
+                [sys.executable, "-c", f"{statement}; {check}"],
+                capture_output=True,
+                text=True,
+            )
+            timings.append(time.perf_counter() - start)
+            if result.returncode != 0:
+                imported = "failed: " + result.stderr.strip().splitlines()[-1]
+                break
+            imported = result.stdout.strip().splitlines()[-1]
+        median = statistics.median(timings)
+        print(f"{label:>20}: {1000 * median:6.0f} ms (imported {imported})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    stats_parser = subparsers.add_parser(
+        "persistent_stats",
+        help="stat updates per second, in each of PersistentStats' modes",
+    )
+    stats_parser.add_argument("--updates", type=int, default=5000)
+    stats_parser.add_argument("--stats", type=int, default=50)
+    stats_parser.set_defaults(run=benchmark_persistent_stats)
+
+    logging_parser = subparsers.add_parser(
+        "logging",
+        help="condition evaluations per second, for each way of writing the debug log",
+    )
+    logging_parser.add_argument("--evaluations", type=int, default=500)
+    logging_parser.set_defaults(run=benchmark_logging)
+
+    config_load_parser = subparsers.add_parser(
+        "config_load",
+        help="time to load a config and its templates, from config.json vs. config.compiled",
+    )
+    config_load_parser.add_argument("--templates", type=int, default=50)
+    config_load_parser.add_argument("--size", type=int, default=100)
+    config_load_parser.add_argument("--runs", type=int, default=5)
+    config_load_parser.set_defaults(run=benchmark_config_load)
+
+    search_parser = subparsers.add_parser(
+        "search",
+        help="time to check a condition without an intended_region: full frame vs. learned region vs. tracked",
+    )
+    search_parser.add_argument("--evaluations", type=int, default=20)
+    search_parser.set_defaults(run=benchmark_search)
+
+    fingerprints_parser = subparsers.add_parser(
+        "fingerprints",
+        help="time to decide when any action could be next: scoring all actions vs. the fingerprint index",
+    )
+    fingerprints_parser.add_argument(
+        "--actions", type=int, nargs="+", default=[10, 50, 200]
+    )
+    fingerprints_parser.add_argument("--runs", type=int, default=5)
+    fingerprints_parser.set_defaults(run=benchmark_fingerprints)
+
+    transitions_parser = subparsers.add_parser(
+        "transitions",
+        help="template matches per decision on a branching action: strict scoring vs. transition order + early stop",
+    )
+    transitions_parser.add_argument("--branches", type=int, default=4)
+    transitions_parser.add_argument("--decisions", type=int, default=20)
+    transitions_parser.set_defaults(run=benchmark_transitions)
+
+    batch_matching_parser = subparsers.add_parser(
+        "batch_matching",
+        help="time to match many templates against one screenshot: one at a time vs. batched",
+    )
+    batch_matching_parser.add_argument(
+        "--templates", type=int, nargs="+", default=[1, 4, 16]
+    )
+    batch_matching_parser.add_argument("--runs", type=int, default=2)
+    batch_matching_parser.set_defaults(run=benchmark_batch_matching)
+
+    prefilter_parser = subparsers.add_parser(
+        "prefilter",
+        help="time to check conditions with intended regions, with and without the match prefilter",
+    )
+    prefilter_parser.add_argument("--conditions", type=int, default=40)
+    prefilter_parser.add_argument("--runs", type=int, default=10)
+    prefilter_parser.set_defaults(run=benchmark_prefilter)
+
+    conditions_parser = subparsers.add_parser(
+        "conditions",
+        help="time to check for a fixed element: template match vs. pixel probe vs. region hash",
+    )
+    conditions_parser.add_argument("--evaluations", type=int, default=200)
+    conditions_parser.set_defaults(run=benchmark_conditions)
+
+    composite_parser = subparsers.add_parser(
+        "composite",
+        help="template matches per decision: one action per alternative vs. one AllOf/AnyOf action",
+    )
+    composite_parser.add_argument("--alternatives", type=int, default=4)
+    composite_parser.add_argument("--decisions", type=int, default=20)
+    composite_parser.set_defaults(run=benchmark_composite)
+
+    native_capture_parser = subparsers.add_parser(
+        "native_capture",
+        help="time per frame: resizing frames to the config's screenshot_size vs. resizing templates to the frame",
+    )
+    native_capture_parser.add_argument("--scale", type=float, default=1.5)
+    native_capture_parser.add_argument("--conditions", type=int, default=10)
+    native_capture_parser.add_argument("--runs", type=int, default=10)
+    native_capture_parser.set_defaults(run=benchmark_native_capture)
+
+    startup_parser = subparsers.add_parser(
+        "startup",
+        help="time to start a fresh interpreter and import fbmr's entry points",
+    )
+    startup_parser.add_argument("--runs", type=int, default=7)
+    startup_parser.set_defaults(run=benchmark_startup)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+compile_configs.py
+
+writes config.compiled for each config (see fbmr/utils/compiled_config.py), or reports which ones are out of date.
+with `compiled_configs = true` in settings.txt, configs are compiled when they're loaded anyway; this is for doing it
+ahead of time, eg. after syncing configs to a machine.
+
+usage: python -m tools.compile_configs [config names] [--configs_root configs] [--check]
+"""
+
+import argparse
+import os
+import time
+
+from fbmr.config import Config
+from fbmr.utils.compiled_config import CompiledConfig
+
+
+def config_names(configs_root):
+    # type: (str) -> list[str]
+    return sorted(
+        name
+        for name in os.listdir(configs_root)
+        if os.path.isfile(os.path.join(configs_root, name, "config.json"))
+    )
+
+
+def is_stale(config):
+    # type: (Config) -> bool
+    compiled = (
+        CompiledConfig.open(config.compiled_path)
+        if os.path.exists(config.compiled_path)
+        else None
+    )
+    if compiled is None or compiled.is_stale("config.json", config.json_path):
+        return True
+    return any(
+        compiled.is_stale(ref, path) for ref, path in config.template_paths().items()
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="pre-decode each config's templates into a memory-mappable config.compiled"
+    )
+    parser.add_argument("names", nargs="*", help="configs to compile; all by default")
+    parser.add_argument("--configs_root", default="configs")
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="only list the configs whose config.compiled is missing or out of date",
+    )
+    args = parser.parse_args()
+
+    stale_count = 0
+    for name in args.names or config_names(args.configs_root):
+        config = Config(args.configs_root, name)
+        if args.check:
+            if is_stale(config):
+                stale_count += 1
+                print(f"{name}: out of date")
+            continue
+        start = time.perf_counter()
+        compiled = config.compile()
+        if compiled is None:
+            print(f"{name}: failed; see the log")
+            continue
+        print(
+            f"{name}: {len(compiled.templates)} templates,"
+            f" {os.path.getsize(config.compiled_path) / 1024:.0f} KB"
+            f" in {time.perf_counter() - start:.2f}s"
+        )
+    if args.check and stale_count:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+import argparse
+import asyncio
+import time
+from typing import Union, Optional, List, Callable
+
+from PIL import Image
+
+from fbmr.async_executor import AsyncExecutor
+from fbmr.config import Config, Action
+from fbmr.devicetypes.device import Device
+from fbmr.executor import ExecutionHook
+from fbmr.utils import metrics
+from fbmr.utils.debug_settings import debug_settings
+from fbmr.utils.detect_image import match_prefilter, template_cache
+from fbmr.utils.persistent_stats import exit_on_sigterm
+
+
+class FleetJob:
+    """One chain to run on one device."""
+
+    def __init__(
+        self,
+        device_name: str,
+        config_name: str,
+        next_actions: Union[str, List[str]] = None,
+        exit_actions: List[str] = None,
+        max_minutes: float = 0,
+        min_action_delay: float = 0,
+        state: Optional[dict] = None,
+    ):
+        self.device_name = device_name
+        self.config_name = config_name
+        self.next_actions = next_actions
+        self.exit_actions = exit_actions
+        self.max_minutes = max_minutes
+        self.min_action_delay = min_action_delay
+        self.state = state
+
+
+class FleetDeviceStats(ExecutionHook):
+    """Per-device counters for a FleetRunner, collected as an ExecutionHook."""
+
+    def __init__(self, device_name: str, config_name: str):
+        self.device_name = device_name
+        self.config_name = config_name
+        self.actions = 0
+        self.search_failures = 0
+        self.start_time = None  # type: Optional[float]
+        self.end_time = None  # type: Optional[float]
+        self.error = None  # type: Optional[BaseException]
+
+    @property
+    def duration(self) -> float:
+        if self.start_time is None:
+            return 0.0
+        return (self.end_time or time.time()) - self.start_time
+
+    @property
+    def actions_per_minute(self) -> float:
+        if self.duration <= 0:
+            return 0.0
+        return self.actions / (self.duration / 60)
+
+    def starting_chain(self, start_action_names: List[str], config: Config):
+        if self.start_time is None:
+            self.start_time = time.time()
+
+    def chain_completed(
+        self, start_action_names: List[str], last_action_name: str, config: Config
+    ):
+        pass
+
+    def chain_timed_out(
+        self, start_action_names: List[str], duration: float, config: Config
+    ):
+        pass
+
+    def searching_for_action(self, next_action_names: List[str], config: Config):
+        pass
+
+    def performing_action(self, action: Action, pil_image: Image, config: Config):
+        self.actions += 1
+
+    def after_action(self, action: Action, cooldown: float, config: Config):
+        pass
+
+    def waiting_to_advance(
+        self,
+        action: Action,
+        pil_image: Image,
+        waited_time: float,
+        retry_duration: float,
+        retries: int,
+        config: Config,
+    ):
+        pass
+
+    def action_search_failed(self, pil_image: Image, config: Config):
+        self.search_failures += 1
+
+    def check_condition_result(
+        self, description: str, success: bool, pil_image: Image, config: Config
+    ):
+        pass
+
+
+class FleetRunner:
+    """
+    Runs one chain per device, concurrently, on a single event loop (see AsyncExecutor).
+
+    Configs are loaded once and shared between the devices that use them, as are decoded templates (see
+    TemplateCache). Each device gets its own Executor, state dict and FleetDeviceStats, so each device can only have
+    one job.
+    """
+
+    def __init__(
+        self,
+        jobs: List[FleetJob],
+        configs_root: str = "configs",
+        device_constructors: Optional[dict[str, Callable[[], Device]]] = None,
+    ):
+        device_names = [job.device_name for job in jobs]
+        duplicates = sorted({n for n in device_names if device_names.count(n) > 1})
+        if duplicates:
+            raise ValueError(f"More than one job for device(s) {duplicates}")
+        self.jobs = jobs
+        self.configs_root = configs_root
+        if device_constructors is None:
+            from fbmr.devices import all_device_constructors
+
+            device_constructors = all_device_constructors()
+        self.device_constructors = device_constructors
+        self.configs = {}  # type: dict[str, Config]
+        self.stats = {
+            job.device_name: FleetDeviceStats(job.device_name, job.config_name)
+            for job in jobs
+        }
+
+    def get_config(self, config_name: str) -> Config:
+        if config_name not in self.configs:
+            self.configs[config_name] = Config(self.configs_root, config_name)
+        return self.configs[config_name]
+
+    async def run_job(self, job: FleetJob):
+        stats = self.stats[job.device_name]
+        e = AsyncExecutor()
+        e.set_config(self.get_config(job.config_name))
+        e.execution_hook = stats
+
+        state = job.state
+        if not state:
+            state = {"viability_adjustment": 0}
+
+        try:
+            d = await e.run_blocking(self.device_constructors[job.device_name])
+            with d:
+                await e.execute_chain(
+                    job.next_actions,
+                    job.exit_actions,
+                    state,
+                    {"device": d},
+                    min_action_delay=job.min_action_delay,
+                    max_minutes=job.max_minutes,
+                )
+        except Exception as ex:
+            stats.error = ex
+        finally:
+            stats.end_time = time.time()
+
+    async def run_async(self) -> dict[str, FleetDeviceStats]:
+        debug_settings.save_detect_subimage_images = False
+        for job in self.jobs:
+            self.get_config(job.config_name)
+        await asyncio.gather(*[self.run_job(job) for job in self.jobs])
+        return self.stats
+
+    def run(self) -> dict[str, FleetDeviceStats]:
+        return asyncio.run(self.run_async())
+
+    def report(self) -> str:
+        lines = []
+        for stats in self.stats.values():
+            line = (
+                f"{stats.device_name} ({stats.config_name}): {stats.actions} actions in {stats.duration:.1f}s;"
+                f" {stats.actions_per_minute:.2f} actions/minute; {stats.search_failures} failed searches"
+            )
+            if stats.error:
+                line += f"; error: {stats.error!r}"
+            lines.append(line)
+        total_minutes = max([s.duration for s in self.stats.values()] or [0.0]) / 60
+        total_actions = sum(s.actions for s in self.stats.values())
+        if total_minutes > 0:
+            lines.append(
+                f"fleet: {total_actions} actions; {total_actions / total_minutes:.2f} actions/minute"
+            )
+        lines.append(
+            f"templates: {len(template_cache.templates)} decoded, {template_cache.hits} cache hits"
+        )
+        if match_prefilter.checks:
+            lines.append(match_prefilter.report())
+        return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "devices",
+        help="the devices to run on; specified in devices/. use 'device=config' to override --config for a device.",
+        type=str,
+        nargs="+",
+    )
+    parser.add_argument(
+        "--config", help="the config file to use", type=str, default=None
+    )
+    parser.add_argument(
+        "--next_action", help="the first action to perform", type=str, default=None
+    )
+    parser.add_argument(
+        "--end_action",
+        help="terminate execution after this action",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--max_minutes",
+        help="stop each device after this many minutes",
+        type=float,
+        default=0,
+    )
+    parser.add_argument(
+        "--metrics_port",
+        help="serve Prometheus metrics at http://127.0.0.1:PORT/metrics",
+        type=int,
+        default=None,
+    )
+    args = parser.parse_args()
+    exit_on_sigterm()
+
+    if args.metrics_port:
+        metrics.registry.start_http_server(args.metrics_port)
+
+    jobs = []
+    for device_arg in args.devices:
+        device_name, _, config_name = device_arg.partition("=")
+        config_name = config_name or args.config
+        if not config_name:
+            parser.error(f"no config for device {device_name}; use --config")
+        jobs.append(
+            FleetJob(
+                device_name,
+                config_name,
+                next_actions=[args.next_action] if args.next_action else [],
+                exit_actions=[args.end_action] if args.end_action else [],
+                max_minutes=args.max_minutes,
+            )
+        )
+
+    try:
+        fleet = FleetRunner(jobs)
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        fleet.run()
+    finally:
+        print(fleet.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,445 @@
+import argparse
+import itertools
+import json
+import logging
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from queue import Queue, Empty, Full
+from typing import List, Optional
+
+from PIL import Image
+
+from fbmr.config import Config, Action
+from fbmr.executor import ExecutionHook
+from tools.runner import (
+    Runner,
+    RunnerCommand,
+    RunnerStartCommand,
+    RunnerInterruptCommand,
+    InterruptException,
+)
+
+# events queued for each /events subscriber; a subscriber that falls further behind misses events
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+class HttpStartCommand(RunnerStartCommand):
+    def __init__(self, request_id: int, **kwargs):
+        super(HttpStartCommand, self).__init__(**kwargs)
+        self.request_id = request_id
+        self.received_time = time.time()
+
+
+class HttpInterruptCommand(RunnerInterruptCommand):
+    def __init__(self, request_id: int):
+        super(HttpInterruptCommand, self).__init__()
+        self.request_id = request_id
+        self.received_time = time.time()
+
+
+class CoalescingCommandQueue:
+    """
+    A drop-in for the SimpleQueue consumed by Runner.threaded_run, which coalesces commands:
+    a newly queued start command supersedes any start command that hasn't started yet, and repeated
+    interrupts collapse into one. Bursts of requests only ever run the latest chain.
+    """
+
+    def __init__(self):
+        self.commands = []  # type: List[RunnerCommand]
+        self.condition = threading.Condition()
+        self.superseded = 0
+        # the last command handed to the runner
+        self.current = None  # type: Optional[RunnerCommand]
+
+    def put(self, command: RunnerCommand) -> int:
+        """Queue a command; returns the number of queued commands it superseded."""
+        with self.condition:
+            before = len(self.commands)
+            if isinstance(command, RunnerStartCommand):
+                self.commands = [
+                    c for c in self.commands if not isinstance(c, RunnerStartCommand)
+                ]
+            elif isinstance(command, RunnerInterruptCommand):
+                self.commands = [
+                    c
+                    for c in self.commands
+                    if not isinstance(c, RunnerInterruptCommand)
+                ]
+            dropped = before - len(self.commands)
+            self.superseded += dropped
+            self.commands.append(command)
+            self.condition.notify()
+            return dropped
+
+    def get(self, block: bool = True, timeout: Optional[float] = None):
+        with self.condition:
+            if block and not self.condition.wait_for(
+                lambda: self.commands, timeout=timeout
+            ):
+                raise Empty()
+            if not self.commands:
+                raise Empty()
+            self.current = self.commands.pop(0)
+            return self.current
+
+    def peek(self) -> Optional[RunnerCommand]:
+        with self.condition:
+            return self.commands[0] if self.commands else None
+
+    def empty(self) -> bool:
+        with self.condition:
+            return not self.commands
+
+    def qsize(self) -> int:
+        with self.condition:
+            return len(self.commands)
+
+
+class LatencyStats:
+    """Latencies (in seconds) recorded under a name, summarized as count/p50/p95/max."""
+
+    def __init__(self, max_samples: int = 1000):
+        self.max_samples = max_samples
+        self.samples = {}  # type: dict[str, list[float]]
+        self.lock = threading.Lock()
+
+    def record(self, name: str, seconds: float):
+        with self.lock:
+            samples = self.samples.setdefault(name, [])
+            samples.append(seconds)
+            if len(samples) > self.max_samples:
+                del samples[0]
+
+    def summary(self) -> dict:
+        with self.lock:
+            result = {}
+            for name, samples in self.samples.items():
+                ordered = sorted(samples)
+
+                def percentile(p):
+                    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+                result[name] = {
+                    "count": len(ordered),
+                    "p50_ms": 1000 * percentile(0.50),
+                    "p95_ms": 1000 * percentile(0.95),
+                    "max_ms": 1000 * ordered[-1],
+                }
+            return result
+
+
+class HttpExecutionHook(ExecutionHook):
+    """
+    Tracks the runner's state for /state, publishes hook events to /events subscribers, and interrupts the running
+    chain when a command is queued (like RunnerUIExecutionHook). Expected to be called in the runner thread.
+    """
+
+    def __init__(self, runner_queue: CoalescingCommandQueue, latency: LatencyStats):
+        self.runner_queue = runner_queue
+        self.latency = latency
+        self.subscribers = []  # type: List[Queue]
+        # events not delivered because a subscriber's queue was full
+        self.dropped_events = 0
+        self.lock = threading.Lock()
+        self.state = {
+            "running": False,
+            "status": "idle",
+            "request_id": None,
+            "next_action_names": [],
+            "last_action": None,
+            "actions": 0,
+            "error": None,
+        }
+
+    def subscribe(self) -> Queue:
+        queue = Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self.lock:
+            self.subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue: Queue):
+        with self.lock:
+            self.subscribers = [q for q in self.subscribers if q is not queue]
+
+    def publish(self, event: str, **kwargs):
+        with self.lock:
+            self.state.update(kwargs)
+            message = {"event": event, "time": time.time(), **self.state}
+            for queue in self.subscribers:
+                try:
+                    queue.put_nowait(message)
+                except Full:
+                    self.dropped_events += 1
+
+    def get_state(self) -> dict:
+        with self.lock:
+            return dict(self.state)
+
+    def check_for_queued_command(self):
+        command = self.runner_queue.peek()
+        if command is not None:
+            if isinstance(command, HttpInterruptCommand):
+                self.latency.record("interrupt", time.time() - command.received_time)
+            self.publish("interrupted", running=False, status="interrupted")
+            raise InterruptException("Queued RunnerCommand detected")
+
+    def starting_chain(self, start_action_names: List[str], config: Config):
+        command = self.runner_queue.current
+        request_id = None
+        if isinstance(command, HttpStartCommand):
+            request_id = command.request_id
+            self.latency.record("queue_to_start", time.time() - command.received_time)
+        self.check_for_queued_command()
+        self.publish(
+            "starting_chain",
+            running=True,
+            status="running",
+            request_id=request_id,
+            next_action_names=start_action_names,
+            actions=0,
+            error=None,
+        )
+
+    def chain_completed(
+        self, start_action_names: List[str], last_action_name: str, config: Config
+    ):
+        self.publish("chain_completed", running=False, status="completed")
+
+    def chain_timed_out(
+        self, start_action_names: List[str], duration: float, config: Config
+    ):
+        self.publish("chain_timed_out", running=False, status="timed out")
+
+    def searching_for_action(self, next_action_names: List[str], config: Config):
+        self.check_for_queued_command()
+        if self.state["next_action_names"] != next_action_names:
+            self.publish("searching", next_action_names=next_action_names)
+
+    def performing_action(self, action: Action, pil_image: Image, config: Config):
+        self.check_for_queued_command()
+        self.publish(
+            "performing_action",
+            last_action=action.name,
+            actions=self.state["actions"] + 1,
+        )
+
+    def after_action(self, action: Action, cooldown: float, config: Config):
+        self.check_for_queued_command()
+
+    def waiting_to_advance(
+        self,
+        action: Action,
+        pil_image: Image,
+        waited_time: float,
+        retry_duration: float,
+        retries: int,
+        config: Config,
+    ):
+        self.check_for_queued_command()
+
+    def action_search_failed(self, pil_image: Image, config: Config):
+        pass
+
+    def check_condition_result(
+        self, description: str, success: bool, pil_image: Image, config: Config
+    ):
+        pass
+
+
+class ControlHTTPServer(ThreadingHTTPServer):
+    # the default backlog of 5 resets connections during bursts of requests, which are exactly what gets coalesced
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class ControlServer:
+    """
+    A local HTTP server for driving a Runner from other applications:
+        POST /start      {"next_actions": [...], "exit_actions": [...], "max_minutes": 0, "min_action_delay": 0}
+        POST /interrupt
+        GET  /state
+        GET  /events     a text/event-stream of ExecutionHook events
+        GET  /metrics    latency percentiles (request handling, queue-to-start and interrupt latency) and dropped events
+    The config and device stay loaded between chains, and queued start commands are coalesced.
+    /state's status is one of "idle", "running", "completed", "timed out", "interrupted" or "error" (see "error").
+    """
+
+    def __init__(self, runner: Runner, host: str = "127.0.0.1", port: int = 8765):
+        runner.keep_resident = True
+        self.runner = runner
+        self.queue = CoalescingCommandQueue()
+        self.latency = LatencyStats()
+        self.hook = HttpExecutionHook(self.queue, self.latency)
+        self.request_ids = itertools.count(1)
+        self.httpd = ControlHTTPServer((host, port), make_handler(self))
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    def start_runner(self):
+        threading.Thread(target=self.run_commands, daemon=True).start()
+
+    def run_commands(self):
+        """
+        Runner.threaded_run, publishing how each chain ended: the hooks only see chains that complete, time out or
+        are interrupted, not ones that run out of next actions or raise.
+        """
+        while True:
+            command = self.queue.get(block=True)
+            if not isinstance(command, RunnerStartCommand):
+                continue
+            try:
+                self.runner.run(
+                    command.next_actions,
+                    command.exit_actions,
+                    command.max_minutes,
+                    command.min_action_delay,
+                    command.execution_hook,
+                    command.state,
+                )
+            except InterruptException:
+                pass
+            except Exception as e:
+                logging.getLogger("fbmr_logger").exception(
+                    f"ControlServer: {command} failed"
+                )
+                self.hook.publish("error", running=False, status="error", error=str(e))
+            else:
+                if self.hook.get_state()["running"]:
+                    self.hook.publish("idle", running=False, status="idle")
+
+    def start(self):
+        """Serves in background threads; see shutdown()."""
+        self.start_runner()
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def serve_forever(self):
+        self.start_runner()
+        self.httpd.serve_forever()
+
+    def shutdown(self):
+        self.queue.put(RunnerInterruptCommand())
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def start_chain(self, body: dict) -> dict:
+        request_id = next(self.request_ids)
+        command = HttpStartCommand(
+            request_id,
+            next_actions=body.get("next_actions", []),
+            exit_actions=body.get("exit_actions", []),
+            max_minutes=body.get("max_minutes", 0),
+            min_action_delay=body.get("min_action_delay", 0),
+            execution_hook=self.hook,
+            state=body.get("state", None),
+        )
+        superseded = self.queue.put(command)
+        return {"request_id": request_id, "superseded": superseded}
+
+    def interrupt(self) -> dict:
+        request_id = next(self.request_ids)
+        self.queue.put(HttpInterruptCommand(request_id))
+        return {"request_id": request_id}
+
+    def metrics(self) -> dict:
+        return {
+            "latency": self.latency.summary(),
+            "superseded_commands": self.queue.superseded,
+            "queued_commands": self.queue.qsize(),
+            "dropped_events": self.hook.dropped_events,
+        }
+
+
+def make_handler(server: ControlServer):
+    class ControlRequestHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status: int, data: dict):
+            body = json.dumps(data).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def read_json(self) -> dict:
+            length = int(self.headers.get("Content-Length", 0))
+            if not length:
+                return {}
+            return json.loads(self.rfile.read(length))
+
+        def do_POST(self):
+            start = time.time()
+            try:
+                if self.path == "/start":
+                    self.send_json(202, server.start_chain(self.read_json()))
+                elif self.path == "/interrupt":
+                    self.send_json(202, server.interrupt())
+                else:
+                    self.send_json(404, {"error": f"unknown path {self.path}"})
+            except json.JSONDecodeError as e:
+                self.send_json(400, {"error": f"invalid json: {e}"})
+            server.latency.record(f"POST {self.path}", time.time() - start)
+
+        def do_GET(self):
+            start = time.time()
+            if self.path == "/state":
+                self.send_json(200, server.hook.get_state())
+            elif self.path == "/metrics":
+                self.send_json(200, server.metrics())
+            elif self.path == "/events":
+                self.stream_events()
+                return
+            else:
+                self.send_json(404, {"error": f"unknown path {self.path}"})
+            server.latency.record(f"GET {self.path}", time.time() - start)
+
+        def stream_events(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            queue = server.hook.subscribe()
+            try:
+                while True:
+                    try:
+                        event = queue.get(timeout=15)
+                        self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+                    except Empty:
+                        self.wfile.write(b": keepalive\n\n")
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                server.hook.unsubscribe(queue)
+
+    return ControlRequestHandler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("config", help="the config file to use", type=str)
+    parser.add_argument(
+        "device",
+        help="the shorthand name for the device to use; specified in devices.py",
+        type=str,
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server = ControlServer(Runner(args.config, args.device), args.host, args.port)
+    print(f"Listening on http://{args.host}:{server.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.runner.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+latency_report.py
+
+summarizes session logs (see fbmr/utils/session_log.py; enable with `session_log = true` in settings.txt) into
+per-action latency percentiles, and lists the slowest templates.
+
+usage: python -m tools.latency_report logs [more session files or folders] [--top 10]
+"""
+
+import argparse
+import glob
+import json
+import os
+from typing import Dict, Iterable, List, Tuple, Union
+
+# the per-action latencies in the report, in display order
+ACTION_METRICS = ["score", "effect", "advance", "frame_age"]
+
+
+def session_files(paths):
+    # type: (List[str]) -> List[str]
+    """Expands folders into the session_*.jsonl files inside them."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "session_*.jsonl"))))
+        else:
+            files.append(path)
+    return files
+
+
+def read_events(files):
+    # type: (List[str]) -> Iterable[dict]
+    for file in files:
+        with open(file, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # a line cut short by a crash
+                    continue
+
+
+def percentile(ordered, p):
+    # type: (List[float], float) -> float
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+def summarize(samples):
+    # type: (List[float]) -> dict
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "p50": percentile(ordered, 0.50),
+        "p95": percentile(ordered, 0.95),
+        "p99": percentile(ordered, 0.99),
+        "max": ordered[-1],
+        "total": sum(ordered),
+    }
+
+
+def build_report(events):
+    # type: (Iterable[dict]) -> dict
+    """
+    Aggregates session events into:
+    - "actions": {(config, action, metric): summary}, for scoring, effect, advance_if wait times and frame ages
+    - "templates": {template: summary} of match times
+    - "chains": {(config, start actions): summary} of chain durations, plus "chain_errors" counts
+    - "counts": decisions, failed searches, retries, and total cooldown and delay seconds
+    """
+    action_samples = {}  # type: Dict[Tuple[str, str, str], List[float]]
+    template_samples = {}  # type: Dict[str, List[float]]
+    chain_samples = {}  # type: Dict[Tuple[str, str], List[float]]
+    chain_errors = {}  # type: Dict[Tuple[str, str], int]
+    chain_starts = {}  # type: Dict[Union[int, str], str]
+    counts = {
+        "decisions": 0,
+        "failed_searches": 0,
+        "retries": 0,
+        "cooldown_seconds": 0.0,
+        "delay_seconds": 0.0,
+    }
+
+    def add(key, seconds):
+        action_samples.setdefault(key, []).append(seconds)
+
+    for event in events:
+        kind = event.get("event")
+        config = event.get("config")
+        if kind == "score":
+            for action_name, _score, seconds in event["actions"]:
+                add((config, action_name, "score"), seconds)
+        elif kind in ("effect", "advance"):
+            add((config, event["action"], kind), event["seconds"])
+        elif kind == "decision":
+            if event["action"] is None:
+                counts["failed_searches"] += 1
+                continue
+            counts["decisions"] += 1
+            if event.get("frame_age") is not None:
+                add((config, event["action"], "frame_age"), event["frame_age"])
+        elif kind == "match":
+            template_samples.setdefault(event["template"], []).append(event["seconds"])
+        elif kind == "retry":
+            counts["retries"] += 1
+        elif kind == "cooldown":
+            counts["cooldown_seconds"] += event["seconds"]
+        elif kind == "delay":
+            counts["delay_seconds"] += event["seconds"]
+        elif kind == "chain_start":
+            # older logs have no chain_id; pair their chains by config
+            chain_id = event.get("chain_id", config)
+            chain_starts[chain_id] = ",".join(event["start_action_names"])
+        elif kind == "chain_end":
+            chain_id = event.get("chain_id", config)
+            key = (config, chain_starts.pop(chain_id, "?"))
+            chain_samples.setdefault(key, []).append(event["seconds"])
+            if event.get("error"):
+                chain_errors[key] = chain_errors.get(key, 0) + 1
+
+    return {
+        "actions": {key: summarize(s) for key, s in action_samples.items()},
+        "templates": {key: summarize(s) for key, s in template_samples.items()},
+        "chains": {key: summarize(s) for key, s in chain_samples.items()},
+        "chain_errors": chain_errors,
+        "counts": counts,
+    }
+
+
+def format_table(title, rows, unit_scale, unit):
+    # type: (str, List[Tuple[str, dict]], float, str) -> str
+    if not rows:
+        return f"{title}: none\n"
+    width = max(len(title), max(len(name) for name, _ in rows))
+    lines = [
+        f"{title:<{width}}  {'count':>7}  {'p50':>9}  {'p95':>9}  {'p99':>9}  {'max':>9}  ({unit})"
+    ]
+    for name, s in rows:
+        lines.append(
+            f"{name:<{width}}  {s['count']:>7}"
+            + "".join(
+                f"  {unit_scale * s[k]:>9.1f}" for k in ("p50", "p95", "p99", "max")
+            )
+        )
+    return "\n".join(lines) + "\n"
+
+
+def format_report(report, top=10):
+    # type: (dict, int) -> str
+    sections = []
+
+    action_rows = []
+    for config, action, metric in sorted(
+        report["actions"],
+        key=lambda k: (str(k[0]), str(k[1]), ACTION_METRICS.index(k[2])),
+    ):
+        action_rows.append(
+            (f"{config}/{action} {metric}", report["actions"][(config, action, metric)])
+        )
+    sections.append(format_table("action latency", action_rows, 1000, "ms"))
+
+    slowest = sorted(
+        report["templates"].items(), key=lambda item: item[1]["p95"], reverse=True
+    )[:top]
+    sections.append(format_table("slowest templates", slowest, 1000, "ms"))
+    total = sum(s["total"] for s in report["templates"].values())
+    # a log whose matches all took 0s has no time to share out
+    if slowest and total > 0:
+        sections.append(
+            "template time share: "
+            + ", ".join(
+                f"{name} {100 * s['total'] / total:.0f}%" for name, s in slowest[:5]
+            )
+            + "\n"
+        )
+
+    chain_rows = []
+    for (config, start), s in sorted(report["chains"].items()):
+        errors = report["chain_errors"].get((config, start), 0)
+        chain_rows.append((f"{config}/{start} ({errors} failed)", s))
+    sections.append(format_table("chain duration", chain_rows, 1, "s"))
+
+    counts = report["counts"]
+    sections.append(
+        f"{counts['decisions']} actions applied, {counts['failed_searches']} failed searches, "
+        f"{counts['retries']} retries; {counts['cooldown_seconds']:.1f}s in cooldowns, "
+        f"{counts['delay_seconds']:.1f}s in min_action_delay\n"
+    )
+    return "\n".join(sections)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="summarize session logs (session_*.jsonl) into latency tables"
+    )
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        help="session log files, or folders containing them (eg. logs)",
+    )
+    parser.add_argument(
+        "--top", type=int, default=10, help="how many of the slowest templates to list"
+    )
+    args = parser.parse_args()
+
+    files = session_files(args.paths)
+    if not files:
+        parser.error("no session logs found; set session_log = true in settings.txt")
+    print(format_report(build_report(read_events(files)), top=args.top))
+
+
+if __name__ == "__main__":
+    main()
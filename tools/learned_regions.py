@@ -0,0 +1,61 @@
+"""
+learned_regions.py
+
+reports, for each config, how often templates were found in their learned search regions and the time that saved
+(see fbmr/utils/learned_regions.py; enable with `learned_search_regions = true` in settings.txt).
+
+usage: python -m tools.learned_regions [config names] [--configs_root configs] [--reset]
+"""
+
+import argparse
+import os
+
+from fbmr.utils.learned_regions import LEARNED_REGIONS_FILENAME, LearnedRegions
+from tools.compile_configs import config_names
+
+
+def format_report(name, report):
+    # type: (str, dict) -> str
+    if not report:
+        return f"{name}: nothing learned yet\n"
+    width = max(len(name), max(len(ref) for ref in report))
+    lines = [
+        f"{name:<{width}}  {'searches':>8}  {'hit rate':>8}  {'full frame':>10}  {'saved':>8}  region"
+    ]
+    for ref, r in report.items():
+        hit_rate = "-" if r["hit_rate"] is None else f"{100 * r['hit_rate']:.0f}%"
+        lines.append(
+            f"{ref:<{width}}  {r['searches']:>8}  {hit_rate:>8}  {r['full_frame_searches']:>10}"
+            f"  {r['seconds_saved']:>7.1f}s  {r['region']}"
+        )
+    total = sum(r["seconds_saved"] for r in report.values())
+    lines.append(f"{'total':<{width}}  {'':>8}  {'':>8}  {'':>10}  {total:>7.1f}s")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="report the hit rates of learned search regions, and the time they saved"
+    )
+    parser.add_argument("names", nargs="*", help="configs to report on; all by default")
+    parser.add_argument("--configs_root", default="configs")
+    parser.add_argument(
+        "--reset",
+        action="store_true",
+        help="forget the learned regions, eg. after a game's layout changes",
+    )
+    args = parser.parse_args()
+
+    for name in args.names or config_names(args.configs_root):
+        path = os.path.join(args.configs_root, name, LEARNED_REGIONS_FILENAME)
+        if not os.path.exists(path):
+            continue
+        if args.reset:
+            os.remove(path)
+            print(f"{name}: reset")
+            continue
+        print(format_report(name, LearnedRegions(path).report()))
+
+
+if __name__ == "__main__":
+    main()
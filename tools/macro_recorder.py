@@ -27,6 +27,7 @@ from fbmr.devicetypes.windows_app_device import (
     transform_point_from_window_to_target_size,
 )
 from fbmr.devicetypes.device import WindowsAppInterfaceDevice
+from fbmr.utils import template_store
 from fbmr.utils.settings import settings
 
 
@@ -269,7 +270,7 @@ class ClickEvent:
         filename_region = filename_stem + "_tap.png"
         folder = config_recorder.config_folder()
         sc.save(os.path.join(folder, filename_stem + "_orig.png"))
-        sc_cropped.save(os.path.join(folder, filename_region))
+        image_ref = save_template(sc_cropped, folder, filename_region)
         sc_outline = sc.copy()
         sc_outline_draw = ImageDraw.Draw(sc_outline, "RGBA")
         sc_outline_draw.rectangle(crop_region, outline=(0, 255, 255, 127), width=3)
@@ -282,16 +283,17 @@ class ClickEvent:
             "conditions": [
                 {
                     "type": "SubimageCondition",
-                    "image_path": filename_region,
+                    "image_path": image_ref,
                     "threshold": 70,
                     "weight": 1.0,
                     "intended_region": crop_region,
+                    "outline_path": filename_stem + "_outline.png",
                 }
             ],
             "effects": [
                 {
                     "type": "ClickSubimageEffect",
-                    "image_path": filename_region,
+                    "image_path": image_ref,
                     "intended_region": crop_region,
                     "tap_xy_in_image": tap_xy_in_image,
                 }
@@ -329,7 +331,7 @@ class ClickEvent:
         filename_region = filename_stem + "_tap.png"
         folder = config_recorder.config_folder()
         sc.save(os.path.join(folder, filename_stem + "_orig.png"))
-        sc_cropped.save(os.path.join(folder, filename_region))
+        image_ref = save_template(sc_cropped, folder, filename_region)
         sc_outline = sc.copy()
         sc_outline_draw = ImageDraw.Draw(sc_outline, "RGBA")
         sc_outline_draw.rectangle(crop_region, outline=(0, 255, 255, 127), width=3)
@@ -350,16 +352,17 @@ class ClickEvent:
             "conditions": [
                 {
                     "type": "SubimageCondition",
-                    "image_path": filename_region,
+                    "image_path": image_ref,
                     "threshold": 70,
                     "weight": 1.0,
                     # "intended_region":crop_region
+                    "outline_path": filename_stem + "_outline.png",
                 }
             ],
             "effects": [
                 {
                     "type": "DragSubimageEffect",
-                    "image_path": filename_region,
+                    "image_path": image_ref,
                     # "intended_region":crop_region,
                     "tap_xy_in_image": tap_xy_in_image,
                     "movement_amount": movement_amount,
@@ -372,6 +375,15 @@ class ClickEvent:
         config_recorder.write_config_with_new_action(new_action_dict, sc)
 
 
+def save_template(pil_image, folder, filename):
+    # type: (Image.Image, str, str) -> str
+    """Saves a recorded template, and returns the path to refer to it by in config.json."""
+    if settings.get_macrorecorder_save_templates_to_store():
+        return template_store.put_image(pil_image, ConfigUtil.DIR_CONFIG_ROOT)
+    pil_image.save(os.path.join(folder, filename))
+    return filename
+
+
 def log_click(device, button_name):
     x, y = win32api.GetCursorPos()
     in_window, window_xy = transform_point_from_desktop_to_window(
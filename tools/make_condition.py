@@ -0,0 +1,77 @@
+"""
+make_condition.py
+
+makes a PixelProbeCondition or RegionHashCondition from a screenshot (eg. an `_orig.png` saved by the macro recorder),
+and prints its json, or adds it to an action's conditions.
+
+usage: python -m tools.make_condition [screenshot] probe [x,y ...] [--threshold 94] [--config name --action name]
+       python -m tools.make_condition [screenshot] hash [left,upper,right,lower] [--threshold 90] [--config ...]
+"""
+
+import argparse
+import json
+
+from PIL import Image
+
+from fbmr.editor import (
+    ConfigUtil,
+    pixel_probe_condition_json,
+    region_hash_condition_json,
+)
+
+
+def numbers(text):
+    # type: (str) -> list[int]
+    return [int(float(v)) for v in text.split(",")]
+
+
+def add_condition(config_name, action_name, condition_json):
+    # type: (str, str, dict) -> None
+    config_json = ConfigUtil.load_config(config_name)
+    action_json = ConfigUtil.get_action_json(config_json, action_name)
+    if action_json is None:
+        raise ValueError(f"{config_name} has no action named {action_name}")
+    action_json["conditions"].append(condition_json)
+    ConfigUtil.save_json_with_backup(config_name, config_json)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="make a pixel probe or region hash condition from a screenshot"
+    )
+    parser.add_argument("screenshot")
+    parser.add_argument("kind", choices=["probe", "hash"])
+    parser.add_argument(
+        "coordinates",
+        nargs="+",
+        help="x,y for each probed pixel, or left,upper,right,lower for the hashed region",
+    )
+    parser.add_argument("--threshold", type=float, default=None)
+    parser.add_argument("--config", help="add the condition to this config's action")
+    parser.add_argument("--action")
+    args = parser.parse_args()
+
+    screenshot = Image.open(args.screenshot).convert("RGB")
+    # the conditions' own defaults, unless --threshold is given
+    thresholds = {} if args.threshold is None else {"threshold": args.threshold}
+    if args.kind == "probe":
+        condition_json = pixel_probe_condition_json(
+            screenshot, [numbers(c) for c in args.coordinates], **thresholds
+        )
+    else:
+        if len(args.coordinates) != 1:
+            parser.error("hash takes one region")
+        condition_json = region_hash_condition_json(
+            screenshot, numbers(args.coordinates[0]), **thresholds
+        )
+
+    if args.config:
+        if not args.action:
+            parser.error("--config needs --action")
+        add_condition(args.config, args.action, condition_json)
+        print(f"added to {args.config}/{args.action}")
+    print(json.dumps(condition_json, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+migrate_to_store.py
+
+moves the templates of existing configs into the shared template store (see fbmr/utils/template_store.py), and points
+their config.json at it. identical templates, in one config or across several, end up as one file.
+the previous config.json is kept as config.json.bak. the images are left where they were unless --delete_originals is
+given; `_orig` and `_outline` screenshots aren't templates and are never moved. a store reference no longer names the
+`_outline` screenshot of a `_tap` template, so it's recorded as the condition's outline_path first.
+
+usage: python -m tools.migrate_to_store [config names] [--configs_root configs] [--dry_run] [--delete_originals]
+"""
+
+import argparse
+import json
+import os
+import shutil
+from typing import Dict
+
+import pyjson5
+from PIL import Image
+
+from fbmr.config import Config, NON_TEMPLATE_PATHS
+from fbmr.utils import template_store
+from tools.compile_configs import config_names
+
+# the conditions that record an outline_path; see ImageCondition.outline_file_path
+OUTLINE_CONDITION_TYPES = ["SubimageCondition", "NotSubimageCondition"]
+
+
+def rewrite_paths(json_blob, refs):
+    # type: (object, Dict[str, str]) -> int
+    """Replaces `*_path` values found in `refs` with their store reference, in place. Returns how many were replaced."""
+    replaced = 0
+    if isinstance(json_blob, dict):
+        for key, value in json_blob.items():
+            if (
+                key.endswith("_path")
+                and key not in NON_TEMPLATE_PATHS
+                and isinstance(value, str)
+                and value in refs
+            ):
+                json_blob[key] = refs[value]
+                replaced += 1
+            else:
+                replaced += rewrite_paths(value, refs)
+    elif isinstance(json_blob, list):
+        for value in json_blob:
+            replaced += rewrite_paths(value, refs)
+    return replaced
+
+
+def add_outline_paths(json_blob, folder_path):
+    # type: (object, str) -> int
+    """Sets outline_path on image conditions whose `_tap` template has an `_outline` screenshot, in place."""
+    added = 0
+    if isinstance(json_blob, dict):
+        image_path = json_blob.get("image_path", None)
+        if (
+            json_blob.get("type", None) in OUTLINE_CONDITION_TYPES
+            and not json_blob.get("outline_path", None)
+            and isinstance(image_path, str)
+            and "_tap" in image_path
+        ):
+            outline = image_path.replace("_tap", "_outline")
+            # as in Condition.adjust_file_path
+            if os.path.exists(
+                outline
+                if outline.startswith("configs")
+                else os.path.join(folder_path, outline)
+            ):
+                json_blob["outline_path"] = outline
+                added += 1
+        for value in json_blob.values():
+            added += add_outline_paths(value, folder_path)
+    elif isinstance(json_blob, list):
+        for value in json_blob:
+            added += add_outline_paths(value, folder_path)
+    return added
+
+
+def store_refs(config, configs_root, dry_run=False):
+    # type: (Config, str, bool) -> Dict[str, str]
+    """{path in config.json: store reference} for each of the config's templates, adding them to the store."""
+    refs = {}
+    for ref, path in config.template_paths().items():
+        if template_store.is_store_ref(ref) or not os.path.exists(path):
+            continue
+        if dry_run:
+            with Image.open(path) as image:
+                refs[ref] = template_store.STORE_PREFIX + template_store.image_hash(
+                    image
+                )
+        else:
+            refs[ref] = template_store.put_file(path, configs_root)
+    return refs
+
+
+def migrate_config(config, configs_root, delete_originals=False):
+    # type: (Config, str, bool) -> Dict[str, str]
+    """Moves one config's templates into the store and rewrites its config.json. Returns the references replaced."""
+    refs = store_refs(config, configs_root)
+    if not refs:
+        return refs
+    with open(config.json_path) as json_file:
+        config_json = pyjson5.load(json_file)
+    add_outline_paths(config_json, config.folder_path)
+    rewrite_paths(config_json, refs)
+    shutil.copy2(config.json_path, config.json_path + ".bak")
+    with open(config.json_path, "w") as outfile:
+        json.dump(config_json, outfile, ensure_ascii=False, sort_keys=True, indent=2)
+
+    if delete_originals:
+        folder = os.path.abspath(config.folder_path)
+        for ref in refs:
+            path = os.path.abspath(os.path.join(folder, ref))
+            # only files in this config's own folder; a path starting with configs/ may be used by other configs too
+            if not ref.startswith("configs") and os.path.dirname(path) == folder:
+                os.unlink(path)
+    return refs
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="move config templates into the shared, content-addressed template store"
+    )
+    parser.add_argument("names", nargs="*", help="configs to migrate; all by default")
+    parser.add_argument("--configs_root", default="configs")
+    parser.add_argument(
+        "--dry_run",
+        action="store_true",
+        help="only report how many templates are duplicates, and the space they'd save",
+    )
+    parser.add_argument(
+        "--delete_originals",
+        action="store_true",
+        help="delete each config's template files once they're in the store",
+    )
+    args = parser.parse_args()
+
+    # {store reference: size of the file it was first stored from}
+    unique_sizes = {}  # type: Dict[str, int]
+    template_count = 0
+    template_bytes = 0
+    for name in args.names or config_names(args.configs_root):
+        config = Config(args.configs_root, name)
+        sizes = {
+            ref: os.path.getsize(path)
+            for ref, path in config.template_paths().items()
+            if os.path.exists(path)
+        }
+        if args.dry_run:
+            refs = store_refs(config, args.configs_root, dry_run=True)
+        else:
+            refs = migrate_config(config, args.configs_root, args.delete_originals)
+        for ref, store_ref in refs.items():
+            unique_sizes.setdefault(store_ref, sizes[ref])
+            template_count += 1
+            template_bytes += sizes[ref]
+        print(f"{name}: {len(refs)} templates")
+
+    saved = template_bytes - sum(unique_sizes.values())
+    print(
+        f"{template_count} templates, {len(unique_sizes)} unique;"
+        f" {saved / 1024:.0f} KB of {template_bytes / 1024:.0f} KB are duplicates"
+    )
+
+
+if __name__ == "__main__":
+    main()
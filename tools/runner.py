@@ -1,4 +1,6 @@
 import argparse
+import asyncio
+import contextlib
 import threading
 from queue import SimpleQueue, Empty
 from typing import Union, Optional, List, Tuple
@@ -8,13 +10,18 @@ from tkinter.scrolledtext import ScrolledText
 from PIL import Image, ImageTk
 import json
 import datetime
+import logging
 import tqdm
 
-from fbmr.devices import all_device_constructors
 from fbmr.config import Config, Action
-from fbmr.conditions import ImageCondition
+from fbmr.conditions import ImageCondition, leaf_conditions
+from fbmr.utils import metrics
 from fbmr.utils.debug_settings import debug_settings
+from fbmr.utils.lazy_import import preload
+from fbmr.utils.persistent_stats import exit_on_sigterm
 from fbmr.executor import Executor, ExecutionHook
+from fbmr.pipelined_executor import PipelinedExecutor
+from fbmr.async_executor import AsyncExecutor
 
 
 class RunnerCommand:
@@ -50,9 +57,45 @@ class InterruptException(Exception):
 
 
 class Runner:
-    def __init__(self, config_name, device_name):
+    def __init__(
+        self,
+        config_name,
+        device_name,
+        pipelined=False,
+        keep_resident=False,
+        configs_root="configs",
+        device_constructors=None,
+    ):
         self.config_name = config_name
         self.device_name = device_name
+        # use a PipelinedExecutor, which overlaps capturing and scoring; helps on devices with slow captures
+        self.pipelined = pipelined
+        # keep the config and device loaded between runs, instead of reloading/reconnecting for each run
+        self.keep_resident = keep_resident
+        self.configs_root = configs_root
+        self._device_constructors = device_constructors
+        self.config = None  # type: Optional[Config]
+        self.device = None
+
+    @property
+    def device_constructors(self):
+        if self._device_constructors is None:
+            from fbmr.devices import all_device_constructors
+
+            self._device_constructors = all_device_constructors()
+        return self._device_constructors
+
+    def get_config(self):
+        # type: () -> Config
+        if self.keep_resident and self.config:
+            return self.config
+        self.config = Config(self.configs_root, self.config_name)
+        return self.config
+
+    def close(self):
+        if self.device is not None:
+            hasattr(self.device, "close") and self.device.close()
+            self.device = None
 
     def run(
         self,
@@ -64,15 +107,24 @@ class Runner:
         state: Optional[dict] = None,
     ):
         debug_settings.save_detect_subimage_images = False
-        c = Config("configs", self.config_name)
-        e = Executor()
+        c = self.get_config()
+        e = PipelinedExecutor() if self.pipelined else Executor()
         e.set_config(c)
         e.execution_hook = execution_hook
 
         if not state:
             state = {"viability_adjustment": 0}
 
-        with all_device_constructors()[self.device_name]() as d:
+        # template matching needs these; import them while the device connects
+        preload("cv2", "numpy")
+        if self.keep_resident:
+            if self.device is None:
+                self.device = self.device_constructors[self.device_name]()
+            device_context = contextlib.nullcontext(self.device)
+        else:
+            device_context = self.device_constructors[self.device_name]()
+
+        with device_context as d:
             utils = {"device": d}
             e.execute_chain(
                 next_actions,
@@ -83,6 +135,49 @@ class Runner:
                 max_minutes=max_minutes,
             )
 
+    async def run_async(
+        self,
+        next_actions: Union[str, List[str]] = None,
+        exit_actions: List[str] = None,
+        max_minutes: float = 0.0,
+        min_action_delay: float = 0,
+        execution_hook: ExecutionHook = None,
+        state: Optional[dict] = None,
+    ):
+        """
+        asyncio version of run(), using an AsyncExecutor.
+        To interrupt the chain, cancel the task that's awaiting this; there's no need for an InterruptException.
+        """
+        debug_settings.save_detect_subimage_images = False
+        c = self.get_config()
+        e = AsyncExecutor()
+        e.set_config(c)
+        e.execution_hook = execution_hook
+
+        if not state:
+            state = {"viability_adjustment": 0}
+
+        preload("cv2", "numpy")
+        loop = asyncio.get_running_loop()
+        device_constructor = self.device_constructors[self.device_name]
+        if self.keep_resident:
+            if self.device is None:
+                self.device = await loop.run_in_executor(None, device_constructor)
+            device_context = contextlib.nullcontext(self.device)
+        else:
+            device_context = await loop.run_in_executor(None, device_constructor)
+
+        with device_context as d:
+            utils = {"device": d}
+            await e.execute_chain(
+                next_actions,
+                exit_actions,
+                state,
+                utils,
+                min_action_delay=min_action_delay,
+                max_minutes=max_minutes,
+            )
+
     def start_thread(self, queue: SimpleQueue[RunnerCommand]):
         thread = threading.Thread(target=self.threaded_run, args=(queue,))
         thread.daemon = True
@@ -107,6 +202,9 @@ class Runner:
                     print(f"Runner: Unexpected queue element: {command}")
             except InterruptException:
                 pass
+            except Exception:
+                # keep consuming commands; a failed chain shouldn't take the runner thread down with it
+                logging.getLogger("fbmr_logger").exception(f"Runner: {command} failed")
 
 
 class ActionLogEvent:
@@ -294,10 +392,11 @@ class MacroLogUI:
 
 
 class RunnerUI(MacroLogUI):
-    def __init__(self, config_name, device_name):
+    def __init__(self, config_name, device_name, pipelined=False):
         super(RunnerUI, self).__init__()
         self.config_name = config_name
         self.device_name = device_name
+        self.pipelined = pipelined
 
         self.thread_started = False
         self.runner = None  # type: Optional[Runner]
@@ -359,7 +458,9 @@ class RunnerUI(MacroLogUI):
     def start_thread(self):
         if not self.thread_started:
             self.thread_started = True
-            self.runner = Runner(self.config_name, self.device_name)
+            self.runner = Runner(
+                self.config_name, self.device_name, pipelined=self.pipelined
+            )
             self.runner.start_thread(self.execution_hook.runner_queue)
 
     def forward_start_command(self):
@@ -423,13 +524,13 @@ def get_images_and_action_names_from_config(config: Config):
         name = action.name
         image_path = None
 
-        for condition in action.conditions:
+        for condition in leaf_conditions(action.conditions):
             if isinstance(condition, ImageCondition):
                 image_fp = condition.adjust_file_path(condition.image_path)
                 # use the "_outline" image if it exists since it shows the entire screenshot where the condition
                 # is expected to be valid
-                outline_fp = image_fp.replace("_tap", "_outline")
-                if os.path.exists(outline_fp):
+                outline_fp = condition.outline_file_path()
+                if outline_fp:
                     image_path = outline_fp
                 elif os.path.exists(image_fp):
                     if not image_path:
@@ -639,8 +740,8 @@ class RunnerUIExecutionHook(ExecutionHook):
                     image_fp = condition.adjust_file_path(condition.image_path)
                     # use the "_outline" image if it exists since it shows the entire screenshot where the condition
                     # is expected to be valid
-                    outline_fp = image_fp.replace("_tap", "_outline")
-                    if os.path.exists(outline_fp):
+                    outline_fp = condition.outline_file_path()
+                    if outline_fp:
                         image_path = outline_fp
                     elif os.path.exists(image_fp):
                         image_path = image_fp
@@ -687,7 +788,23 @@ def main():
         help='includes the "image match" logging in the'
         " console and saves images to the /debug folder.",
     )
+    parser.add_argument(
+        "--pipelined",
+        action="store_true",
+        default=False,
+        help="capture and score screenshots on separate threads; faster on devices with slow captures.",
+    )
+    parser.add_argument(
+        "--metrics_port",
+        help="serve Prometheus metrics at http://127.0.0.1:PORT/metrics",
+        type=int,
+        default=None,
+    )
     args = parser.parse_args()
+    exit_on_sigterm()
+
+    if args.metrics_port:
+        metrics.registry.start_http_server(args.metrics_port)
 
     if args.debug:
         debug_settings.save_detect_subimage_images = True
@@ -699,10 +816,10 @@ def main():
     if args.end_action:
         end_actions.append(args.end_action)
     if args.ui:
-        runner_ui = RunnerUI(args.config, args.device)
+        runner_ui = RunnerUI(args.config, args.device, pipelined=args.pipelined)
         runner_ui.launch_runner_ui(next_actions, end_actions)
     else:
-        runner = Runner(args.config, args.device)
+        runner = Runner(args.config, args.device, pipelined=args.pipelined)
         runner.run(next_actions, end_actions)
 
 
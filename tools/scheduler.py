@@ -0,0 +1,580 @@
+import argparse
+import datetime
+import heapq
+import json
+import logging
+import sqlite3
+import subprocess
+import threading
+import time
+from typing import Optional, List, Callable
+
+from PIL import Image
+
+from fbmr.config import Config, Action
+from fbmr.devicetypes.device import Device
+from fbmr.executor import Executor, ExecutionHook
+from fbmr.utils import metrics
+from fbmr.utils.debug_settings import debug_settings
+from fbmr.utils.persistent_stats import exit_on_sigterm
+
+DEFAULT_DATABASE = "scheduler.sqlite3"
+# how long stopping the scheduler waits for running jobs to be interrupted
+STOP_TIMEOUT = 30.0
+
+
+class Schedule:
+    def next_run_after(self, timestamp):
+        # type: (float) -> float
+        raise NotImplementedError("Schedule.next_run_after() not implemented")
+
+
+class IntervalSchedule(Schedule):
+    """'every 30m': runs every `seconds`, measured from the end of the previous run."""
+
+    UNITS = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+
+    def __init__(self, seconds):
+        # type: (float) -> None
+        assert seconds > 0, "interval should be positive"
+        self.seconds = seconds
+
+    def next_run_after(self, timestamp):
+        # type: (float) -> float
+        return timestamp + self.seconds
+
+    @staticmethod
+    def parse(spec):
+        # type: (str) -> IntervalSchedule
+        value = spec.strip()[len("every") :].strip()
+        if value[-1:] in IntervalSchedule.UNITS:
+            return IntervalSchedule(
+                float(value[:-1]) * IntervalSchedule.UNITS[value[-1]]
+            )
+        return IntervalSchedule(float(value))
+
+
+class CronSchedule(Schedule):
+    """
+    A standard 5 field cron expression: 'minute hour day-of-month month day-of-week'.
+    Fields support '*', 'a', 'a-b', lists ('a,b') and steps ('*/n', 'a-b/n'). Day-of-week is 0-6, with 0 as Sunday.
+    As in cron, if both day fields are restricted, a day matches if either does.
+    """
+
+    RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)]
+
+    def __init__(self, spec):
+        # type: (str) -> None
+        fields = spec.split()
+        if len(fields) != 5:
+            raise ValueError(f"Expected 5 fields in cron schedule, got '{spec}'")
+        self.spec = spec
+        self.minutes, self.hours, self.days, self.months, self.weekdays = [
+            CronSchedule.parse_field(f, low, high)
+            for f, (low, high) in zip(fields, CronSchedule.RANGES)
+        ]
+        self.days_restricted = fields[2] != "*"
+        self.weekdays_restricted = fields[4] != "*"
+
+    @staticmethod
+    def parse_field(field, low, high):
+        # type: (str, int, int) -> set[int]
+        values = set()
+        for part in field.split(","):
+            step = 1
+            if "/" in part:
+                part, step_str = part.split("/")
+                step = int(step_str)
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start_str, end_str = part.split("-")
+                start, end = int(start_str), int(end_str)
+            else:
+                start = int(part)
+                end = high if step != 1 else start
+            if start < low or end > high or start > end:
+                raise ValueError(f"Cron field '{field}' out of range {low}-{high}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def day_matches(self, dt):
+        # type: (datetime.datetime) -> bool
+        day_ok = dt.day in self.days
+        weekday_ok = (dt.weekday() + 1) % 7 in self.weekdays
+        if self.days_restricted and self.weekdays_restricted:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def next_run_after(self, timestamp):
+        # type: (float) -> float
+        dt = datetime.datetime.fromtimestamp(timestamp).replace(
+            second=0, microsecond=0
+        ) + datetime.timedelta(minutes=1)
+        # 5 years is enough to find any valid date (e.g. Feb 29th)
+        limit = dt + datetime.timedelta(days=5 * 366)
+        while dt < limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1) + datetime.timedelta(days=32)).replace(
+                    day=1, hour=0, minute=0
+                )
+            elif not self.day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+            elif dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + datetime.timedelta(hours=1)
+            elif dt.minute not in self.minutes:
+                dt = dt + datetime.timedelta(minutes=1)
+            else:
+                return dt.timestamp()
+        raise ValueError(f"Cron schedule '{self.spec}' never runs")
+
+
+def parse_schedule(spec):
+    # type: (str) -> Schedule
+    """Parses 'every 30m' (or s/h/d) as an IntervalSchedule, and anything else as a CronSchedule."""
+    if spec.strip().startswith("every"):
+        return IntervalSchedule.parse(spec)
+    return CronSchedule(spec)
+
+
+class ScheduledJob:
+    def __init__(
+        self,
+        name: str,
+        config_name: str,
+        device_name: str,
+        schedule: str,
+        priority: int = 0,
+        next_actions: Optional[List[str]] = None,
+        exit_actions: Optional[List[str]] = None,
+        max_minutes: float = 0,
+        next_run: float = 0,
+        last_run: float = 0,
+        last_status: str = "",
+        job_id: Optional[int] = None,
+    ):
+        self.job_id = job_id
+        self.name = name
+        self.config_name = config_name
+        self.device_name = device_name
+        self.schedule = schedule
+        # jobs with a higher priority run first when several are due on the same device
+        self.priority = priority
+        self.next_actions = next_actions or []
+        self.exit_actions = exit_actions or []
+        self.max_minutes = max_minutes
+        self.next_run = next_run
+        self.last_run = last_run
+        self.last_status = last_status
+
+    def describe(self) -> str:
+        next_run = datetime.datetime.fromtimestamp(self.next_run).strftime(
+            "%Y-%m-%d %H:%M:%S"
+        )
+        return (
+            f"{self.name}: {self.config_name} on {self.device_name}; '{self.schedule}'; priority {self.priority};"
+            f" next run {next_run}; last status '{self.last_status}'"
+        )
+
+
+class JobStore:
+    """Persists ScheduledJobs in a SQLite file, so that a restarted scheduler picks up where it left off."""
+
+    COLUMNS = [
+        "name",
+        "config_name",
+        "device_name",
+        "schedule",
+        "priority",
+        "next_actions",
+        "exit_actions",
+        "max_minutes",
+        "next_run",
+        "last_run",
+        "last_status",
+    ]
+
+    def __init__(self, path: str = DEFAULT_DATABASE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                    job_id INTEGER PRIMARY KEY,
+                    name TEXT UNIQUE NOT NULL,
+                    config_name TEXT NOT NULL,
+                    device_name TEXT NOT NULL,
+                    schedule TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    next_actions TEXT NOT NULL DEFAULT '[]',
+                    exit_actions TEXT NOT NULL DEFAULT '[]',
+                    max_minutes REAL NOT NULL DEFAULT 0,
+                    next_run REAL NOT NULL DEFAULT 0,
+                    last_run REAL NOT NULL DEFAULT 0,
+                    last_status TEXT NOT NULL DEFAULT ''
+                )""")
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def add_job(self, job: ScheduledJob) -> ScheduledJob:
+        parse_schedule(job.schedule)  # validate
+        if not job.next_run:
+            job.next_run = time.time()
+        values = [
+            job.name,
+            job.config_name,
+            job.device_name,
+            job.schedule,
+            job.priority,
+            json.dumps(job.next_actions),
+            json.dumps(job.exit_actions),
+            job.max_minutes,
+            job.next_run,
+            job.last_run,
+            job.last_status,
+        ]
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                f"INSERT INTO jobs ({', '.join(JobStore.COLUMNS)}) VALUES ({', '.join('?' * len(values))})",
+                values,
+            )
+            job.job_id = cursor.lastrowid
+        return job
+
+    def remove_job(self, name: str) -> bool:
+        with self.lock, self.connection:
+            cursor = self.connection.execute("DELETE FROM jobs WHERE name = ?", [name])
+            return cursor.rowcount > 0
+
+    def jobs(self, due_before: Optional[float] = None) -> List[ScheduledJob]:
+        query = f"SELECT job_id, {', '.join(JobStore.COLUMNS)} FROM jobs"
+        args = []
+        if due_before is not None:
+            query += " WHERE next_run <= ?"
+            args.append(due_before)
+        with self.lock:
+            rows = self.connection.execute(
+                query + " ORDER BY next_run", args
+            ).fetchall()
+        result = []
+        for row in rows:
+            job_id, name, config_name, device_name, schedule, priority = row[:6]
+            next_actions, exit_actions, max_minutes, next_run, last_run, status = row[
+                6:
+            ]
+            result.append(
+                ScheduledJob(
+                    name,
+                    config_name,
+                    device_name,
+                    schedule,
+                    priority,
+                    json.loads(next_actions),
+                    json.loads(exit_actions),
+                    max_minutes,
+                    next_run,
+                    last_run,
+                    status,
+                    job_id=job_id,
+                )
+            )
+        return result
+
+    def record_run(self, job: ScheduledJob, finished: float, status: str):
+        job.last_run = finished
+        job.last_status = status
+        job.next_run = parse_schedule(job.schedule).next_run_after(finished)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "UPDATE jobs SET next_run = ?, last_run = ?, last_status = ? WHERE job_id = ?",
+                [job.next_run, job.last_run, job.last_status, job.job_id],
+            )
+
+
+class JobInterruptedException(Exception):
+    pass
+
+
+class SchedulerExecutionHook(ExecutionHook):
+    """Interrupts a job's chain once the scheduler is stopping; chains have no other way out with max_minutes=0."""
+
+    def __init__(self, stop_event: threading.Event):
+        self.stop_event = stop_event
+
+    def check_for_stop(self):
+        if self.stop_event.is_set():
+            raise JobInterruptedException("scheduler stopped")
+
+    def starting_chain(self, start_action_names: List[str], config: Config):
+        self.check_for_stop()
+
+    def chain_completed(
+        self, start_action_names: List[str], last_action_name: str, config: Config
+    ):
+        pass
+
+    def chain_timed_out(
+        self, start_action_names: List[str], duration: float, config: Config
+    ):
+        pass
+
+    def searching_for_action(self, next_action_names: List[str], config: Config):
+        self.check_for_stop()
+
+    def performing_action(self, action: Action, pil_image: Image, config: Config):
+        self.check_for_stop()
+
+    def after_action(self, action: Action, cooldown: float, config: Config):
+        self.check_for_stop()
+
+    def waiting_to_advance(
+        self,
+        action: Action,
+        pil_image: Image,
+        waited_time: float,
+        retry_duration: float,
+        retries: int,
+        config: Config,
+    ):
+        self.check_for_stop()
+
+    def action_search_failed(self, pil_image: Image, config: Config):
+        self.check_for_stop()
+
+    def check_condition_result(
+        self, description: str, success: bool, pil_image: Image, config: Config
+    ):
+        pass
+
+
+class MacroScheduler:
+    """
+    Long-running service that runs the due jobs of a JobStore.
+
+    Due jobs go into a priority queue. Each device is used by one job at a time (a per-device lock), while jobs on
+    different devices run in parallel, each in its own thread. Configs and devices stay loaded between jobs, so
+    only the first job on a device pays for connecting to it. stop() interrupts the running jobs' chains.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        configs_root: str = "configs",
+        device_constructors: Optional[dict[str, Callable[[], Device]]] = None,
+        poll_interval: float = 1.0,
+    ):
+        self.store = store
+        self.configs_root = configs_root
+        if device_constructors is None:
+            from fbmr.devices import all_device_constructors
+
+            device_constructors = all_device_constructors()
+        self.device_constructors = device_constructors
+        self.poll_interval = poll_interval
+
+        self.configs = {}  # type: dict[str, Config]
+        self.devices = {}  # type: dict[str, Device]
+        self.device_locks = {}  # type: dict[str, threading.Lock]
+        self.queue = []  # type: list[tuple[int, float, int, ScheduledJob]]
+        self.queued_ids = set()  # type: set[int]
+        self.threads = []  # type: list[threading.Thread]
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    def get_config(self, config_name: str) -> Config:
+        with self.lock:
+            if config_name not in self.configs:
+                self.configs[config_name] = Config(self.configs_root, config_name)
+            return self.configs[config_name]
+
+    def get_device(self, device_name: str) -> Device:
+        # only called while holding the device's lock
+        if device_name not in self.devices:
+            self.devices[device_name] = self.device_constructors[device_name]()
+        return self.devices[device_name]
+
+    def enqueue_due_jobs(self, now: float):
+        for job in self.store.jobs(due_before=now):
+            with self.lock:
+                if job.job_id in self.queued_ids:
+                    continue
+                self.queued_ids.add(job.job_id)
+                heapq.heappush(
+                    self.queue, (-job.priority, job.next_run, job.job_id, job)
+                )
+
+    def dispatch(self):
+        """Start the highest priority queued job for each idle device."""
+        with self.lock:
+            waiting = []
+            while self.queue:
+                entry = heapq.heappop(self.queue)
+                job = entry[3]
+                device_lock = self.device_locks.setdefault(
+                    job.device_name, threading.Lock()
+                )
+                if device_lock.acquire(blocking=False):
+                    thread = threading.Thread(
+                        target=self._run_and_release,
+                        args=(job, device_lock),
+                        name=job.name,
+                        daemon=True,
+                    )
+                    self.threads.append(thread)
+                    thread.start()
+                else:
+                    waiting.append(entry)
+            for entry in waiting:
+                heapq.heappush(self.queue, entry)
+            self.threads = [t for t in self.threads if t.is_alive()]
+
+    def _run_and_release(self, job: ScheduledJob, device_lock: threading.Lock):
+        status = "ok"
+        try:
+            logging.getLogger("fbmr_logger").info(f"scheduler: starting {job.name}")
+            self.run_job(job)
+        except JobInterruptedException:
+            status = "interrupted"
+        except Exception as e:
+            status = f"error: {e!r}"
+            logging.getLogger("fbmr_logger").error(
+                f"scheduler: {job.name} failed: {e!r}"
+            )
+            if isinstance(e, subprocess.CalledProcessError):
+                # the device may have disconnected; reconnect on its next job
+                self.devices.pop(job.device_name, None)
+        finally:
+            self.store.record_run(job, time.time(), status)
+            with self.lock:
+                self.queued_ids.discard(job.job_id)
+            device_lock.release()
+            logging.getLogger("fbmr_logger").info(
+                f"scheduler: finished {job.name} ({status})"
+            )
+
+    def run_job(self, job: ScheduledJob):
+        e = Executor()
+        e.set_config(self.get_config(job.config_name))
+        e.execution_hook = SchedulerExecutionHook(self.stop_event)
+        state = {"viability_adjustment": 0}
+        e.execute_chain(
+            job.next_actions,
+            job.exit_actions,
+            state,
+            {"device": self.get_device(job.device_name)},
+            max_minutes=job.max_minutes,
+        )
+
+    def tick(self, now: Optional[float] = None):
+        self.enqueue_due_jobs(now if now is not None else time.time())
+        self.dispatch()
+
+    def wait_idle(self, timeout: Optional[float] = None) -> List[str]:
+        """Waits up to `timeout` seconds in total for the running jobs; returns the names of those still running."""
+        deadline = None if timeout is None else time.time() + timeout
+        for thread in list(self.threads):
+            thread.join(None if deadline is None else max(0.0, deadline - time.time()))
+        return [thread.name for thread in self.threads if thread.is_alive()]
+
+    def run_forever(self):
+        debug_settings.save_detect_subimage_images = False
+        try:
+            while not self.stop_event.is_set():
+                self.tick()
+                self.stop_event.wait(self.poll_interval)
+        finally:
+            # stop() may not have been called, e.g. on a KeyboardInterrupt
+            self.stop_event.set()
+            still_running = self.wait_idle(STOP_TIMEOUT)
+            if still_running:
+                logging.getLogger("fbmr_logger").warning(
+                    f"scheduler: jobs still running after {STOP_TIMEOUT}s: {still_running}"
+                )
+            self.close()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def close(self):
+        for device_name, device in self.devices.items():
+            device_lock = self.device_locks.get(device_name)
+            if device_lock and device_lock.locked():
+                # a job that didn't stop in time is still using it
+                continue
+            hasattr(device, "close") and device.close()
+        self.devices = {}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--db", help="the job database", type=str, default=DEFAULT_DATABASE
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    add_parser = subparsers.add_parser("add", help="schedule a chain")
+    add_parser.add_argument("name", help="a unique name for the job", type=str)
+    add_parser.add_argument("config", help="the config file to use", type=str)
+    add_parser.add_argument("device", help="the device to use", type=str)
+    add_parser.add_argument(
+        "schedule",
+        help="'every 30m' (s/m/h/d) or a cron expression like '*/15 8-22 * * 1-5'",
+        type=str,
+    )
+    add_parser.add_argument("--priority", type=int, default=0)
+    add_parser.add_argument("--next_action", type=str, default=None)
+    add_parser.add_argument("--end_action", type=str, default=None)
+    add_parser.add_argument("--max_minutes", type=float, default=0)
+
+    remove_parser = subparsers.add_parser("remove", help="unschedule a job")
+    remove_parser.add_argument("name", type=str)
+
+    subparsers.add_parser("list", help="list the scheduled jobs")
+    run_parser = subparsers.add_parser(
+        "run", help="run the scheduler until interrupted"
+    )
+    run_parser.add_argument(
+        "--metrics_port",
+        help="serve Prometheus metrics at http://127.0.0.1:PORT/metrics",
+        type=int,
+        default=None,
+    )
+    args = parser.parse_args()
+
+    store = JobStore(args.db)
+    if args.command == "add":
+        store.add_job(
+            ScheduledJob(
+                args.name,
+                args.config,
+                args.device,
+                args.schedule,
+                priority=args.priority,
+                next_actions=[args.next_action] if args.next_action else [],
+                exit_actions=[args.end_action] if args.end_action else [],
+                max_minutes=args.max_minutes,
+            )
+        )
+    elif args.command == "remove":
+        if not store.remove_job(args.name):
+            print(f"No job named {args.name}")
+    elif args.command == "list":
+        for job in store.jobs():
+            print(job.describe())
+    elif args.command == "run":
+        # lets run_forever's cleanup interrupt the running jobs
+        exit_on_sigterm()
+        if args.metrics_port:
+            metrics.registry.start_http_server(args.metrics_port)
+        scheduler = MacroScheduler(store)
+        try:
+            scheduler.run_forever()
+        except KeyboardInterrupt:
+            scheduler.stop()
+    store.close()
+
+
+if __name__ == "__main__":
+    main()